@@ -31,7 +31,15 @@ export class OutputPane extends React.Component {
         name: PropTypes.string.isRequired,
         type: PropTypes.oneOf(['text', 'number', 'datetime']).isRequired
       }).isRequired), // or null
-      nRows: PropTypes.number // or null
+      nRows: PropTypes.number, // or null
+      preview: PropTypes.shape({
+        delta_id: PropTypes.number.isRequired,
+        columns: PropTypes.arrayOf(PropTypes.shape({
+          name: PropTypes.string.isRequired,
+          type: PropTypes.oneOf(['text', 'number', 'datetime']).isRequired
+        }).isRequired).isRequired,
+        rows: PropTypes.arrayOf(PropTypes.object.isRequired).isRequired
+      }) // or null if there is no preview of the render in progress
     }), // or null if no selection
     isPublic: PropTypes.bool.isRequired,
     isReadOnly: PropTypes.bool.isRequired,
@@ -43,9 +51,21 @@ export class OutputPane extends React.Component {
 
     let wfm
     let wfModuleId
+    let previewRows = null
     if (wfModuleBeforeError) {
       wfm = wfModuleBeforeError
       wfModuleId = wfModuleBeforeError.id
+    } else if (wfModule && wfModule.preview) {
+      // The server is rendering, and it sent us the first few rows. Show
+      // them until the full render arrives.
+      const { preview } = wfModule
+      wfm = {
+        deltaId: preview.delta_id,
+        columns: preview.columns,
+        nRows: preview.rows.length
+      }
+      wfModuleId = wfModule.id
+      previewRows = preview.rows
     } else if (wfModule && wfModule.status === 'ok') {
       wfm = wfModule
       wfModuleId = wfm.id
@@ -72,8 +92,9 @@ export class OutputPane extends React.Component {
         deltaId={wfm ? wfm.deltaId : null}
         columns={wfm ? wfm.columns : null}
         nRows={wfm ? wfm.nRows : null}
+        previewRows={previewRows}
         api={api}
-        isReadOnly={isReadOnly}
+        isReadOnly={isReadOnly || previewRows !== null}
         showColumnLetter={showColumnLetter}
       />
     )
@@ -194,6 +215,16 @@ function mapStateToProps(state, ownProps) {
 
   const showColumnLetter = id_name === 'formula' || id_name === 'reorder-columns'
 
+  // A preview is only useful while its render is in progress. Ignore
+  // previews of older deltas, and previews of a render that has finished.
+  let preview = null
+  if (wfModule && wfModule.output_preview) {
+    const deltaId = wfModule.output_preview.delta_id
+    if (deltaId === wfModule.last_relevant_delta_id && deltaId !== wfModule.cached_render_result_delta_id) {
+      preview = wfModule.output_preview
+    }
+  }
+
   return {
     workflowId: workflow.id,
     wfModule: wfModule ? {
@@ -202,7 +233,8 @@ function mapStateToProps(state, ownProps) {
       status,
       deltaId: wfModule.cached_render_result_delta_id,
       columns: wfModule.output_columns,
-      nRows: wfModule.output_n_rows
+      nRows: wfModule.output_n_rows,
+      preview
     } : null,
     wfModuleBeforeError: wfModuleBeforeError,
     isPublic: workflow.public,
@@ -62,4 +62,19 @@ describe('OutputPane', () => {
     expect(w.find(OutputIframe).prop('wfModuleId')).toEqual(3)
     expect(w.find(OutputIframe).prop('deltaId')).toEqual(4)
   })
+
+  it('renders a read-only preview while rendering', () => {
+    const preview = {
+      delta_id: 5,
+      columns: [ { name: 'A', type: 'number' } ],
+      rows: [ { A: 1 }, { A: 2 } ]
+    }
+    const w = wrapper({ wfModule: { id: 1, deltaId: 4, status: 'busy', htmlOutput: false, preview }})
+    const table = w.find('TableSwitcher')
+    expect(table.prop('deltaId')).toEqual(5)
+    expect(table.prop('columns')).toEqual(preview.columns)
+    expect(table.prop('nRows')).toEqual(2)
+    expect(table.prop('previewRows')).toBe(preview.rows)
+    expect(table.prop('isReadOnly')).toBe(true)
+  })
 })
@@ -103,6 +103,7 @@ export default class DataGrid extends React.PureComponent {
       type: PropTypes.oneOf(['text', 'number', 'datetime']).isRequired
     }).isRequired), // immutable; null for placeholder table
     nRows: PropTypes.number, // immutable; null for placeholder table
+    previewRows: PropTypes.arrayOf(PropTypes.object.isRequired), // immutable; all `nRows` rows, if this is a preview
     showLetter: PropTypes.bool,
     onLoadPage: PropTypes.func.isRequired, // func(wfModuleId, deltaId) => undefined
     onEditCell: PropTypes.func.isRequired, // func(fromRow, cellKey, newValue) => undefined
@@ -127,7 +128,8 @@ export default class DataGrid extends React.PureComponent {
     gridHeight : null,
     spinning: false,
     draggingColumnIndex: null,
-    loadedRows: []
+    // A preview comes with all its rows: we never load() it
+    loadedRows: this.props.previewRows || []
   }
 
   emptyRow = buildEmptyRow(this.props.columns)
@@ -207,7 +209,7 @@ export default class DataGrid extends React.PureComponent {
 
   componentDidMount () {
     if (this.props.wfModuleId) {
-      if (this.props.nRows) {
+      if (this.props.nRows && !this.props.previewRows) {
         this.load()
       } else {
         // Indicate to caller that we're loaded
@@ -9,6 +9,7 @@ function areSameTable(props1, props2) {
   return props1.wfModuleId === props2.wfModuleId
     && props1.deltaId === props2.deltaId
     && props1.nRows === props2.nRows
+    && !props1.previewRows === !props2.previewRows
 }
 
 /**
@@ -16,7 +17,7 @@ function areSameTable(props1, props2) {
  */
 function tableProps (props) {
   const ret = {}
-  for (const key of [ 'wfModuleId', 'deltaId', 'columns', 'nRows', 'showColumnLetter', 'sortColumn', 'sortDirection' ]) {
+  for (const key of [ 'wfModuleId', 'deltaId', 'columns', 'nRows', 'previewRows', 'showColumnLetter', 'sortColumn', 'sortDirection' ]) {
     ret[key] = props[key]
   }
   return ret
@@ -54,6 +55,7 @@ export default class TableSwitcher extends React.PureComponent {
       type: PropTypes.oneOf([ 'text', 'datetime', 'number' ]).isRequired
     }).isRequired), // or null, if status!=ok
     nRows: PropTypes.number, // or null, if status!=ok
+    previewRows: PropTypes.arrayOf(PropTypes.object.isRequired), // or null, if this is not a preview
     showColumnLetter: PropTypes.bool.isRequired,
     sortColumn: PropTypes.string,
     sortDirection: PropTypes.number
@@ -75,14 +77,16 @@ export default class TableSwitcher extends React.PureComponent {
 
   /**
    * Render a <TableView>, with a `key` tied to wfModuleId+deltaId so tables
-   * are guaranteed to never share data.
+   * are guaranteed to never share data. (A preview has the same deltaId as
+   * the full table it precedes, so its key is different.)
    */
   _renderTable (props, className) {
-    const { wfModuleId, deltaId } = props
+    const { wfModuleId, deltaId, previewRows } = props
     const { api, isReadOnly } = this.props
+    const key = `${wfModuleId}-${deltaId}` + (previewRows ? '-preview' : '')
 
     return (
-      <div key={`${wfModuleId}-${deltaId}`} className={className}>
+      <div key={key} className={className}>
         <TableView api={api} isReadOnly={isReadOnly} onLoadPage={noop} {...props} />
       </div>
     )
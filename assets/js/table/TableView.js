@@ -20,6 +20,7 @@ export default class TableView extends React.PureComponent {
       type: PropTypes.oneOf(['text', 'number', 'datetime']).isRequired
     }).isRequired), // immutable; null for placeholder table
     nRows: PropTypes.number, // immutable; null for placeholder table
+    previewRows: PropTypes.arrayOf(PropTypes.object.isRequired), // immutable; null unless this is a preview
     api: PropTypes.object.isRequired,
     isReadOnly: PropTypes.bool.isRequired,
     onLoadPage: PropTypes.func.isRequired, // func(wfModuleId, deltaId) => undefined
@@ -53,7 +54,7 @@ export default class TableView extends React.PureComponent {
   render() {
     // Make a table component if we have the data
     const { selectedRowIndexes } = this.state
-    const { api, wfModuleId, deltaId, isReadOnly, columns, nRows, showColumnLetter, onLoadPage } = this.props
+    const { api, wfModuleId, deltaId, isReadOnly, columns, nRows, previewRows, showColumnLetter, onLoadPage } = this.props
     const tooWide = columns.length > NMaxColumns
 
     let gridView
@@ -78,6 +79,7 @@ export default class TableView extends React.PureComponent {
           deltaId={deltaId}
           columns={columns}
           nRows={nRows}
+          previewRows={previewRows}
           onEditCell={this.onEditCell}
           showLetter={showColumnLetter}
           onReorderColumns={UpdateTableAction.updateTableActionModule}
@@ -87,7 +89,7 @@ export default class TableView extends React.PureComponent {
           selectedRowIndexes={selectedRowIndexes}
           onLoadPage={onLoadPage}
           onSetSelectedRowIndexes={this.setSelectedRowIndexes}
-          key={wfModuleId + '-' + deltaId}
+          key={wfModuleId + '-' + deltaId + (previewRows ? '-preview' : '')}
         />
       )
     }
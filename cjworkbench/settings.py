@@ -31,6 +31,10 @@ MAX_ROWS_PER_TABLE = 1000000
 # How much StoredObject space can each module take up?
 MAX_STORAGE_PER_MODULE = 1024*1024*1024
 
+# Write intermediate render results to disk if they took this long to render.
+# Faster ones are rendered again when needed.
+MATERIALIZE_MIN_RENDER_SECONDS = 1.0
+
 # configuration for urlscraper
 SCRAPER_NUM_CONNECTIONS = 8
 SCRAPER_TIMEOUT = 30  # seconds
@@ -41,9 +45,38 @@ CHARDET_CHUNK_SIZE = 1024*1024
 # Chunk size for separator detection
 SEP_DETECT_CHUNK_SIZE = 1024*1024
 
+# Number of CSV rows we parse at a time. Fewer means less memory and more
+# re-coding of categories.
+CSV_PARSE_CHUNK_N_ROWS = 100000
+
+# Parse CSV files at least this big on several processes, each parsing about
+# CSV_PARALLEL_PARSE_CHUNK_N_BYTES at a time. Each worker process has one pool
+# of CSV_PARSE_N_PROCESSES parsers, shared by all its fetches and uploads.
+CSV_PARALLEL_PARSE_MIN_BYTES = 64*1024*1024
+CSV_PARALLEL_PARSE_CHUNK_N_BYTES = 16*1024*1024
+CSV_PARSE_N_PROCESSES = int(os.environ.get('CJW_CSV_PARSE_N_PROCESSES',
+                                           os.cpu_count() or 1))
+
 # Use categories if file over this size
 CATEGORY_FILE_SIZE_MIN = 250*1024*1024
 
+# Compression of Parquet files (fetched data, and render results cached before
+# we switched to Arrow): 'UNCOMPRESSED', 'SNAPPY', 'GZIP', 'LZ4' or 'ZSTD'.
+# GZIP and ZSTD accept a level. Measure with `manage.py benchmark-parquet`.
+PARQUET_COMPRESSION = os.environ.get('CJW_PARQUET_COMPRESSION', 'SNAPPY')
+PARQUET_COMPRESSION_LEVEL = (
+    int(os.environ['CJW_PARQUET_COMPRESSION_LEVEL'])
+    if os.environ.get('CJW_PARQUET_COMPRESSION_LEVEL') else None
+)
+
+# Dictionary-encode text columns in Parquet files when at most this fraction
+# of their values are distinct (e.g., 0.5). They read back as categories.
+# None means, "only dictionary-encode columns that are already categories."
+PARQUET_DICTIONARY_MAX_FRACTION = (
+    float(os.environ['CJW_PARQUET_DICTIONARY_MAX_FRACTION'])
+    if os.environ.get('CJW_PARQUET_DICTIONARY_MAX_FRACTION') else None
+)
+
 # ----- App Boilerplate -----
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -0,0 +1,148 @@
+"""
+Read and write tables as Arrow IPC files.
+
+We cache render results in this format because readers can memory-map it:
+reading 200 rows of a million-row table only touches those 200 rows' pages.
+(Parquet, in contrast, must decompress entire columns.) Files are
+uncompressed, so they are bigger than Parquet files: keep using
+`server.parquet` for long-term storage.
+
+`read_header()` maps the file and keeps the mapping open: reads through the
+returned ArrowFile work even if the file is deleted or replaced afterwards.
+(Its disk space is reclaimed when the ArrowFile is garbage-collected.)
+"""
+import errno
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import pandas
+import pyarrow
+from server import atomicfile
+
+
+def _arrow_type_to_dtype(arrow_type: pyarrow.DataType):
+    """Return the pandas dtype `to_pandas()` gives `arrow_type`."""
+    if pyarrow.types.is_dictionary(arrow_type):
+        return 'category'
+    elif pyarrow.types.is_timestamp(arrow_type):
+        return np.dtype('datetime64[ns]')
+    elif (pyarrow.types.is_integer(arrow_type)
+          or pyarrow.types.is_floating(arrow_type)
+          or pyarrow.types.is_boolean(arrow_type)):
+        return np.dtype(arrow_type.to_pandas_dtype())
+    else:
+        # string, or null (a column with only None values)
+        return np.dtype(object)
+
+
+def _select_columns(table: pyarrow.Table,
+                    columns: Optional[List[str]]) -> pyarrow.Table:
+    if columns is None:
+        return table
+
+    return pyarrow.Table.from_arrays(
+        [table.column(table.schema.get_field_index(c)) for c in columns]
+    )
+
+
+def _memory_map(path: Path) -> pyarrow.MemoryMappedFile:
+    """
+    Open `path` for reading, or raise OSError.
+
+    pyarrow raises ArrowIOError when the file is missing; raise
+    FileNotFoundError instead, like Python's open() and fastparquet.
+    """
+    try:
+        return pyarrow.memory_map(str(path), 'r')
+    except pyarrow.ArrowIOError:
+        if not os.path.exists(path):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                    str(path))
+        raise
+
+
+class ArrowFile:
+    """
+    Memory-mapped Arrow IPC file: column names, dtypes and row count.
+
+    Mimics fastparquet.ParquetFile: `columns`, `dtypes`, `count` and
+    `to_pandas()`. Thread-safe: reads never change it.
+    """
+
+    def __init__(self, path: Path, table: pyarrow.Table):
+        self.path = path
+        self.table = table  # zero-copy: it references the mapped file
+
+    @property
+    def schema(self) -> pyarrow.Schema:
+        return self.table.schema
+
+    @property
+    def count(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.schema.names)
+
+    @property
+    def dtypes(self) -> Dict[str, object]:
+        return dict((field.name, _arrow_type_to_dtype(field.type))
+                    for field in self.schema)
+
+    def to_pandas(self,
+                  columns: Optional[List[str]]=None) -> pandas.DataFrame:
+        """Read the whole file -- or, if `columns` is set, those columns."""
+        return _select_columns(self.table, columns).to_pandas()
+
+    def read_rows(self, start: int, stop: int,
+                  columns: Optional[List[str]]=None) -> pandas.DataFrame:
+        """
+        Read rows `start` (inclusive) to `stop` (exclusive).
+
+        Only those rows are converted to pandas. The returned DataFrame is
+        indexed from 0.
+        """
+        start = min(max(0, start), self.count)
+        stop = min(max(start, stop), self.count)
+        table = self.table.slice(start, stop - start)
+        return _select_columns(table, columns).to_pandas()
+
+
+def read_header(path: Path) -> ArrowFile:
+    """
+    Map an Arrow IPC file into memory, and return its header.
+
+    This reads the file's footer, not its data: the OS pages in data when we
+    read it.
+
+    May raise OSError (e.g., FileNotFoundError) or pyarrow.ArrowInvalid.
+    """
+    source = _memory_map(path)
+    return ArrowFile(path, pyarrow.RecordBatchFileReader(source).read_all())
+
+
+def read(path: Path, columns: Optional[List[str]]=None) -> pandas.DataFrame:
+    """
+    Load a Pandas DataFrame from disk.
+
+    May raise OSError (e.g., FileNotFoundError) or pyarrow.ArrowInvalid.
+    """
+    return read_header(path).to_pandas(columns=columns)
+
+
+def write(path: Path, table: pandas.DataFrame) -> None:
+    """
+    Write a Pandas DataFrame to a file on disk, atomically replacing it if
+    it exists.
+
+    `path`'s directory must exist, and the user must have permission to write
+    to `path`: otherwise, this function raises OSError.
+    """
+    arrow_table = pyarrow.Table.from_pandas(table, preserve_index=False)
+    with atomicfile.replacing(str(path)) as tmp_path:
+        with pyarrow.OSFile(tmp_path, 'wb') as sink:
+            writer = pyarrow.RecordBatchFileWriter(sink, arrow_table.schema)
+            writer.write_table(arrow_table)
+            writer.close()
@@ -0,0 +1,60 @@
+"""
+Write files so concurrent readers never see them half-written.
+
+Usage:
+
+    with atomicfile.replacing(path) as tmp_path:
+        write_something(tmp_path)
+    # now `path` is the new file
+
+We write to a temporary file in the same directory and then rename it over
+`path`. Rename is atomic: a reader opens either the old file or the new one.
+Readers that opened the old file keep reading it, even after it's replaced.
+If writing fails (or the process dies), `path` is untouched.
+
+Since we never modify these files in place, copies can share disk space:
+`copy()` hard-links when it can. The filesystem counts references for us:
+deleting one copy leaves the others intact.
+"""
+from contextlib import contextmanager
+import os
+import shutil
+import tempfile
+
+
+@contextmanager
+def replacing(path: str):
+    """Yield a temporary path; rename it to `path` on success."""
+    dirname, basename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=f'.{basename}.',
+                                    suffix='.tmp')
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def copy(src: str, dst: str) -> None:
+    """
+    Make `dst` a copy of `src`, atomically replacing `dst` if it exists.
+
+    This hard-links `src` if possible, so it takes no time and no disk space.
+    It falls back to copying bytes (e.g., if `src` is on another
+    filesystem). Only use it on files nobody modifies in place.
+
+    Raise FileNotFoundError if `src` does not exist.
+    """
+    with replacing(dst) as tmp_path:
+        os.remove(tmp_path)  # os.link() won't overwrite it
+        try:
+            os.link(src, tmp_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(src, tmp_path)
@@ -0,0 +1,143 @@
+"""
+Measure how file formats trade disk space against CPU.
+
+For each table in a corpus and each format -- Parquet with each codec, with
+and without dictionary-encoding text, and our uncompressed Arrow cache
+format -- we write the table to a directory, read it back, and report file
+size, write time and read time.
+
+Run it against the cache volume (`--dir`) so the timings include its I/O:
+
+    python manage.py benchmark-parquet --dir /path/on/the/volume
+"""
+import glob
+import os
+import tempfile
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from server import arrowfile, parquet
+
+
+TestDataDir = os.path.join(os.path.dirname(__file__), 'tests', 'test_data')
+
+
+class Format(NamedTuple):
+    name: str
+    write: Callable[[str, pd.DataFrame], None]
+    read: Callable[[str], pd.DataFrame]
+
+
+class Measurement(NamedTuple):
+    table_name: str
+    format_name: str
+    n_bytes: Optional[int]  # None if the format is unavailable
+    write_seconds: float
+    read_seconds: float
+    error: str
+
+
+def _parquet_format(compression: str, level: Optional[int]=None,
+                    dictionary_max_fraction: Optional[float]=None) -> Format:
+    name = compression if level is None else f'{compression}-{level}'
+    if dictionary_max_fraction is not None:
+        name += '+dict'
+
+    def write(path, table):
+        parquet.write(path, table, compression=compression,
+                      compression_level=level,
+                      dictionary_max_fraction=dictionary_max_fraction)
+
+    return Format(name, write, parquet.read)
+
+
+def default_formats() -> List[Format]:
+    """List every format we may want to deploy."""
+    formats = [Format('arrow', arrowfile.write, arrowfile.read)]
+    for dictionary_max_fraction in (None, 0.5):
+        for compression, level in [
+            ('UNCOMPRESSED', None),
+            ('SNAPPY', None),
+            ('LZ4', None),
+            ('ZSTD', 1),
+            ('ZSTD', 3),
+            ('ZSTD', 9),
+            ('GZIP', 6),
+        ]:
+            formats.append(_parquet_format(compression, level,
+                                           dictionary_max_fraction))
+    return formats
+
+
+def synthetic_tables(n_rows: int) -> Iterable[Tuple[str, pd.DataFrame]]:
+    """Yield tables resembling what users load: numbers, dates and text."""
+    rng = np.random.RandomState(0)  # same tables every run
+    words = np.array(['apple', 'banana', 'cherry', 'durian', 'elderberry',
+                      'fig', 'grape', 'honeydew', 'kiwi', 'lemon'])
+
+    yield ('numbers', pd.DataFrame({
+        'int': rng.randint(0, 1000000, n_rows),
+        'float': rng.normal(size=n_rows),
+    }))
+    yield ('dates', pd.DataFrame({
+        'date': pd.Timestamp('2018-01-01')
+        + pd.to_timedelta(rng.randint(0, 86400 * 365, n_rows), unit='s'),
+    }))
+    yield ('text-few-values', pd.DataFrame({
+        'text': words[rng.randint(0, len(words), n_rows)],
+    }))
+    yield ('text-many-values', pd.DataFrame({
+        'text': [f'row {i} {words[i % len(words)]}' for i in range(n_rows)],
+    }))
+
+
+def sample_tables() -> Iterable[Tuple[str, pd.DataFrame]]:
+    """Yield the CSV and Excel tables in server/tests/test_data."""
+    for path in sorted(glob.glob(os.path.join(TestDataDir, '*'))):
+        name = os.path.basename(path)
+        if name.endswith('.csv'):
+            yield (name, pd.read_csv(path))
+        elif name.endswith('.xlsx') or name.endswith('.xls'):
+            yield (name, pd.read_excel(path))
+
+
+def measure(table_name: str, table: pd.DataFrame, file_format: Format,
+            dirname: str) -> Measurement:
+    """Write and read `table` in `file_format`, in a temporary file."""
+    fd, path = tempfile.mkstemp(dir=dirname, suffix='.dat')
+    os.close(fd)
+    try:
+        t1 = time.perf_counter()
+        file_format.write(path, table)
+        t2 = time.perf_counter()
+        n_bytes = os.stat(path).st_size
+        t3 = time.perf_counter()
+        file_format.read(path)
+        t4 = time.perf_counter()
+        return Measurement(table_name, file_format.name, n_bytes, t2 - t1,
+                           t4 - t3, '')
+    except Exception as err:
+        # Most likely, the codec's library isn't installed
+        return Measurement(table_name, file_format.name, None, 0, 0,
+                           str(err))
+    finally:
+        os.unlink(path)
+
+
+def run(tables: Iterable[Tuple[str, pd.DataFrame]],
+        formats: List[Format], dirname: str) -> Iterable[Measurement]:
+    """Measure every format on every table."""
+    for table_name, table in tables:
+        for file_format in formats:
+            yield measure(table_name, table, file_format, dirname)
+
+
+def format_measurement(m: Measurement) -> str:
+    if m.n_bytes is None:
+        return f'{m.table_name:<24} {m.format_name:<20} error: {m.error}'
+    return (
+        f'{m.table_name:<24} {m.format_name:<20} {m.n_bytes:>12,d} B '
+        f'{m.write_seconds * 1000:>9.1f}ms write '
+        f'{m.read_seconds * 1000:>9.1f}ms read'
+    )
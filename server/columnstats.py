@@ -0,0 +1,105 @@
+"""
+Summarize each column of a table, so the web server needn't scan it.
+
+We compute stats while a render result is still in memory (see
+`CachedRenderResult.assign_wf_module()`) and store them as JSON next to the
+table on disk. For each column we store:
+
+* `n_nulls`: number of null values
+* `min`, `max`: smallest and largest non-null value, for number and datetime
+  columns (otherwise `null`)
+* `n_distinct`: number of distinct non-null values
+* `top_values`: up to `MaxNTopValues` `[value, count]` pairs, most-frequent
+  first. Values are strings, as in `/value-counts`. If `n_distinct <=
+  MaxNTopValues`, these are _all_ the values.
+"""
+import json
+from typing import Any, Dict, Optional
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_dtype, is_numeric_dtype
+from server import atomicfile
+
+
+# Number of [value, count] pairs we store per column. Columns with this many
+# distinct values or fewer have complete value counts.
+MaxNTopValues = 100
+
+
+def value_counts(series: pd.Series) -> pd.Series:
+    """
+    Count each non-null value in `series`, most frequent first.
+
+    The index holds values as strings: we only handle text in the value-counts
+    UI. Unused categories of a categorical `series` aren't values: we omit
+    them.
+    """
+    counts = series.value_counts()
+    if hasattr(series, 'cat'):
+        counts = counts[counts > 0]
+    if not (series.dtype == object or hasattr(series, 'cat')):
+        # Convert the (hopefully short) index, not the whole series
+        counts.index = counts.index.astype(str)
+    return counts
+
+
+def _json_scalar(value) -> Any:
+    """
+    Convert a numpy/pandas scalar to something json.dumps() handles.
+
+    JSON has no NaN or Infinity: they become None.
+    """
+    if value is None or pd.isna(value):
+        return None
+    elif isinstance(value, (float, np.floating)) and not np.isfinite(value):
+        return None
+    elif isinstance(value, pd.Timestamp):
+        return value.isoformat() + 'Z'
+    elif isinstance(value, np.generic):
+        return value.item()
+    else:
+        return value
+
+
+def compute_column(series: pd.Series) -> Dict[str, Any]:
+    """Summarize one column."""
+    counts = value_counts(series)
+
+    if is_numeric_dtype(series) or is_datetime64_dtype(series):
+        min_value = _json_scalar(series.min())
+        max_value = _json_scalar(series.max())
+    else:
+        min_value = None
+        max_value = None
+
+    return {
+        'n_nulls': int(series.isna().sum()),
+        'min': min_value,
+        'max': max_value,
+        'n_distinct': len(counts),
+        'top_values': [[str(value), int(count)] for value, count
+                       in counts.head(MaxNTopValues).items()],
+    }
+
+
+def compute(table: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """Summarize every column of `table`, keyed by column name."""
+    return dict((str(name), compute_column(table[name]))
+                for name in table.columns)
+
+
+def write(path: str, stats: Dict[str, Dict[str, Any]]) -> None:
+    """Write stats to `path`, atomically replacing it if it exists."""
+    with atomicfile.replacing(path) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            # Refuse NaN and Infinity: browsers' JSON.parse() rejects them
+            json.dump(stats, f, allow_nan=False)
+
+
+def read(path: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Read stats from `path`, or return None if they are missing."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -7,6 +7,7 @@ from django.conf import settings
 from server.worker.pg_locker import PgLocker
 from .autoupdate import queue_fetches
 from .sessions import delete_expired_sessions_and_workflows
+from .storagegc import collect_garbage
 
 
 logger = logging.getLogger(__name__)
@@ -18,6 +19,9 @@ FetchInterval = 60  # seconds
 ExpiryInterval = 300  # seconds
 
 
+GarbageCollectionInterval = 86400  # seconds
+
+
 async def benchmark(task, message):
     t1 = time.time()
     logger.info(f'Start {message}')
@@ -65,6 +69,16 @@ async def delete_expired_sessions_and_workflows_forever():
         await asyncio.sleep(ExpiryInterval)
 
 
+async def collect_garbage_forever():
+    while True:
+        try:
+            await benchmark(collect_garbage(), 'collect_garbage()')
+        except:
+            logger.exception('Error collecting orphaned files')
+
+        await asyncio.sleep(GarbageCollectionInterval)
+
+
 async def main():
     """
     Run maintenance tasks in the background.
@@ -74,4 +88,5 @@ async def main():
     await asyncio.wait({
         queue_fetches_forever(),
         delete_expired_sessions_and_workflows_forever(),
+        collect_garbage_forever(),
     }, return_when=asyncio.FIRST_EXCEPTION)
@@ -0,0 +1,292 @@
+"""
+Delete files on disk that no database row refers to.
+
+We delete files when we delete their rows -- `StoredObject`'s post_delete
+signal, `CachedRenderResult._clear_wf_module()` -- but a crash between the
+two, or a write that never made it into the database, leaves an orphan
+behind. Nothing else ever deletes it.
+
+We scan two kinds of files, in batches of `BatchSize`, with one database
+query per batch:
+
+* StoredObject files, `{wf_module_id}-{uuid}-fetch.dat` in MEDIA_ROOT: an
+  orphan if no StoredObject has it as `file`.
+* Render-cache files, in `cached-render-results/wf-{workflow_id}/`: table
+  files (and their `.stats.json`), memoized results and value counts. (See
+  `server.models.CachedRenderResult` for the layout.) A table file is an
+  orphan unless a WfModule's cached result points to exactly its version;
+  other files are orphans unless their WfModule's cached result is in that
+  workflow.
+
+Soft-deleted WfModules (`DeleteModuleCommand`) keep their rows -- and so
+their files, so undo works.
+
+We skip files created or renamed in the last `MinAgeSeconds`: writers create
+files _before_ they save the rows that refer to them. We leave files we don't
+recognize alone.
+"""
+import logging
+import os
+import re
+import shutil
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, \
+        Tuple
+from channels.db import database_sync_to_async
+from django.core.files.storage import default_storage
+from server.models import StoredObject, WfModule
+
+
+logger = logging.getLogger(__name__)
+
+
+# Files this new may belong to a row that is about to be saved.
+MinAgeSeconds = 3600
+
+# Number of files (or workflow directories) we look up per database query.
+BatchSize = 1000
+
+
+_StoredObjectRegex = re.compile(r'^\d+-[-0-9a-f]+-fetch\.dat$')
+_TempFileRegex = re.compile(r'^\..+\.tmp$')  # see server.atomicfile
+_WorkflowDirRegex = re.compile(r'^wf-(\d+)$')
+_TableRegex = re.compile(r'^wfm-(\d+)(?:-v(\d+))?\.dat(?:\.stats\.json)?$')
+_MemoRegex = re.compile(r'^wfm-(\d+)-.+\.dat(?:\.json|\.stats\.json)?$')
+_ValueCountsDirRegex = re.compile(r'^wfm-(\d+)$')
+_ValueCountsRegex = re.compile(r'^v(\d+)-[0-9a-f]+\.json$')
+
+
+class Report(NamedTuple):
+    n_files: int
+    n_bytes: int
+
+
+class _Collector:
+    """Delete (or quarantine) orphans, and count them."""
+
+    def __init__(self, root: str, min_age_seconds: float,
+                 quarantine_dir: Optional[str], dry_run: bool):
+        self.root = root
+        self.max_ctime = time.time() - min_age_seconds
+        self.quarantine_dir = quarantine_dir
+        self.dry_run = dry_run
+        self.n_files = 0
+        self.n_bytes = 0
+
+    def collect(self, entry: os.DirEntry) -> None:
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            return  # someone else deleted it
+
+        # st_ctime changes on rename, too: restore_wf_module() renames an
+        # old memoized file into place before it saves the WfModule.
+        if max(stat.st_mtime, stat.st_ctime) > self.max_ctime:
+            return
+
+        if not self.dry_run:
+            try:
+                if self.quarantine_dir:
+                    dest = os.path.join(self.quarantine_dir,
+                                        os.path.relpath(entry.path,
+                                                        self.root))
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    shutil.move(entry.path, dest)
+                else:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                return
+
+        logger.debug('Collected orphan %s (%d bytes)', entry.path,
+                     stat.st_size)
+        self.n_files += 1
+        self.n_bytes += stat.st_size
+
+    def remove_empty_dirs(self, path: str) -> None:
+        """Remove `path` and its subdirectories, if they are empty."""
+        if self.dry_run:
+            return
+
+        for dirpath, _, _ in os.walk(path, topdown=False):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass  # not empty
+
+    def report(self) -> Report:
+        return Report(self.n_files, self.n_bytes)
+
+
+def _scandir(path: str) -> Iterator[os.DirEntry]:
+    """Yield entries of `path`, or nothing if it doesn't exist."""
+    try:
+        with os.scandir(path) as it:
+            yield from it
+    except FileNotFoundError:
+        return
+
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _collect_stored_objects(collector: _Collector) -> None:
+    root = collector.root
+    entries = (
+        entry for entry in _scandir(root)
+        if entry.is_file(follow_symlinks=False)
+        and (_StoredObjectRegex.match(entry.name)
+             or _TempFileRegex.match(entry.name))
+    )
+
+    for batch in _batches(entries, BatchSize):
+        # We store absolute paths in `file`; very old rows may hold names
+        names = [entry.name for entry in batch]
+        paths = [entry.path for entry in batch]
+        files = (
+            StoredObject.objects
+            .filter(file__in=names + paths)
+            .values_list('file', flat=True)
+        )
+        known_paths = set(os.path.join(root, file) for file in files)
+
+        for entry in batch:
+            if entry.path not in known_paths:
+                collector.collect(entry)
+
+
+def _collect_memo_dir(path: str, results: Dict[int, Tuple[int, int]],
+                      collector: _Collector) -> None:
+    for entry in _scandir(path):
+        match = _MemoRegex.match(entry.name)
+        if match:
+            if int(match.group(1)) not in results:
+                collector.collect(entry)
+        elif _TempFileRegex.match(entry.name):
+            collector.collect(entry)
+
+
+def _collect_value_counts_dir(path: str,
+                              results: Dict[int, Tuple[int, int]],
+                              collector: _Collector) -> None:
+    for dir_entry in _scandir(path):
+        match = _ValueCountsDirRegex.match(dir_entry.name)
+        if not match or not dir_entry.is_dir(follow_symlinks=False):
+            continue
+
+        try:
+            delta_id, _ = results[int(match.group(1))]
+        except KeyError:
+            delta_id = None  # every file is an orphan
+
+        for entry in _scandir(dir_entry.path):
+            match = _ValueCountsRegex.match(entry.name)
+            if match:
+                if int(match.group(1)) != delta_id:
+                    collector.collect(entry)
+            elif _TempFileRegex.match(entry.name):
+                collector.collect(entry)
+
+        if delta_id is None:
+            collector.remove_empty_dirs(dir_entry.path)
+
+
+def _collect_workflow_dir(path: str, results: Dict[int, Tuple[int, int]],
+                          collector: _Collector) -> None:
+    """
+    Collect orphans in one workflow's render-cache directory.
+
+    `results` maps each WfModule ID with a cached result in this workflow to
+    its `(delta_id, file_version)`.
+    """
+    for entry in _scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name == 'memo':
+                _collect_memo_dir(entry.path, results, collector)
+            elif entry.name == 'value-counts':
+                _collect_value_counts_dir(entry.path, results, collector)
+            continue
+
+        match = _TableRegex.match(entry.name)
+        if match:
+            wf_module_id = int(match.group(1))
+            version = match.group(2) and int(match.group(2))
+            try:
+                _, file_version = results[wf_module_id]
+            except KeyError:
+                collector.collect(entry)
+            else:
+                if file_version != version:
+                    collector.collect(entry)
+        elif _TempFileRegex.match(entry.name):
+            collector.collect(entry)
+
+    if not results:
+        collector.remove_empty_dirs(path)
+
+
+def _workflow_dirs(cache_root: str) -> Iterator[Tuple[int, os.DirEntry]]:
+    for entry in _scandir(cache_root):
+        match = _WorkflowDirRegex.match(entry.name)
+        if match and entry.is_dir(follow_symlinks=False):
+            yield (int(match.group(1)), entry)
+
+
+def _collect_render_cache(collector: _Collector) -> None:
+    cache_root = os.path.join(collector.root, 'cached-render-results')
+    workflow_dirs = _workflow_dirs(cache_root)
+
+    for batch in _batches(workflow_dirs, BatchSize):
+        # workflow_id => {wf_module_id => (delta_id, file_version)}
+        results = {}
+        rows = (
+            WfModule.objects
+            .filter(cached_render_result_workflow_id__in=[
+                workflow_id for workflow_id, _ in batch
+            ])
+            .filter(cached_render_result_delta_id__isnull=False)
+            .values_list('id', 'cached_render_result_workflow_id',
+                         'cached_render_result_delta_id',
+                         'cached_render_result_file_version')
+        )
+        for wf_module_id, workflow_id, delta_id, file_version in rows:
+            results.setdefault(workflow_id, {})[wf_module_id] = \
+                (delta_id, file_version)
+
+        for workflow_id, entry in batch:
+            _collect_workflow_dir(entry.path, results.get(workflow_id, {}),
+                                  collector)
+
+
+def collect_garbage_sync(*, min_age_seconds: float=MinAgeSeconds,
+                         quarantine_dir: Optional[str]=None,
+                         dry_run: bool=False) -> Report:
+    """
+    Delete orphaned StoredObject and render-cache files.
+
+    If `quarantine_dir` is set, move orphans there (keeping their paths
+    relative to MEDIA_ROOT) instead of deleting them. If `dry_run` is set,
+    only count them.
+
+    Return the number of orphans and their total size.
+    """
+    collector = _Collector(default_storage.path(''), min_age_seconds,
+                           quarantine_dir, dry_run)
+    _collect_stored_objects(collector)
+    _collect_render_cache(collector)
+    return collector.report()
+
+
+@database_sync_to_async
+def collect_garbage() -> Report:
+    report = collect_garbage_sync()
+    logger.info('Deleted %d orphaned files, reclaiming %d bytes',
+                report.n_files, report.n_bytes)
+    return report
@@ -0,0 +1,75 @@
+"""
+Parse chunks of CSV on a pool of child processes.
+
+Each process has one pool, created on first use and shared by every thread
+that parses: a worker runs at most `n_processes` parsers, however many
+fetches and uploads (NFetchers, NUploaders) it handles at once.
+
+Children come from a 'forkserver', not from forking the caller: a worker has
+threads (e.g., `database_sync_to_async` executors), and a forked child would
+inherit whatever locks they hold, locked forever. The forkserver preloads only
+this module, so this module must not import Django models.
+"""
+from collections import deque
+import io
+import multiprocessing
+import multiprocessing.pool
+import threading
+from typing import Iterable, Iterator, Optional, Tuple
+import pandas
+from pandas import DataFrame
+
+
+# Seconds we wait for a chunk. multiprocessing.Pool never answers if a child
+# dies mid-task (e.g., the kernel's OOM killer); then we give up.
+ChunkTimeout = 300
+
+
+_context = multiprocessing.get_context('forkserver')
+_context.set_forkserver_preload([__name__])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_chunk(data: bytes, sep: str, text_encoding: Optional[str],
+                has_header: bool) -> DataFrame:
+    """
+    Parse CSV `data`, in a child process.
+
+    Decodes the way `server.modules.utils._wrap_text()` does, newline
+    translation included, so values are identical.
+    """
+    with io.TextIOWrapper(io.BytesIO(data), encoding=text_encoding or 'utf-8',
+                          errors='replace') as textio:
+        return pandas.read_csv(textio, dtype='category', sep=sep,
+                               header=0 if has_header else None,
+                               low_memory=False)
+
+
+def _get_pool(n_processes: int) -> multiprocessing.pool.Pool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _context.Pool(n_processes)
+        return _pool
+
+
+def parse_chunks(chunks: Iterable[Tuple[bytes, str, Optional[str], bool]],
+                 n_processes: int) -> Iterator[DataFrame]:
+    """
+    Yield `parse_chunk(*args)` for each `args` in `chunks`, in order.
+
+    We read at most `2 * n_processes` chunks ahead, so a big file needn't fit
+    in memory.
+
+    Raise what `parse_chunk()` raises, or multiprocessing.TimeoutError.
+    """
+    pool = _get_pool(n_processes)
+    pending = deque()
+    for args in chunks:
+        pending.append(pool.apply_async(parse_chunk, args))
+        if len(pending) >= 2 * n_processes:
+            yield pending.popleft().get(ChunkTimeout)
+    while pending:
+        yield pending.popleft().get(ChunkTimeout)
@@ -1,14 +1,70 @@
 import asyncio
 import contextlib
 import datetime
-from typing import Any, Dict, Optional, Tuple
+from functools import lru_cache
+import glob
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
 from channels.db import database_sync_to_async
-from server import notifications
-from server.models import CachedRenderResult, LoadedModule, WfModule, Workflow
+from django.conf import settings
+import pandas as pd
+from server import notifications, renderbudget, renderpool, resultcache
+from server.models import CachedRenderResult, LoadedModule, Params, \
+        WfModule, Workflow
+from server.models.loaded_module import StaticModules
+import server.modules
 from server.modules.types import ProcessResult
 from server import websockets
 
 
+# Render key of the first module's input. (The first module's input is always
+# an empty table.)
+EmptyInputKey = 'empty'
+
+# Number of rows we render and send before the full render, so users editing
+# a huge table see the start of the selected module's output right away.
+PreviewNRows = 200
+
+# The client won't show more columns than this; don't preview wider tables.
+PreviewMaxNColumns = 100
+
+
+def _read_result(cached_result: CachedRenderResult) -> ProcessResult:
+    """
+    Return `cached_result.result`, from resultcache if possible.
+
+    On a miss, read from Parquet and remember the result for next time.
+    """
+    result = resultcache.get(cached_result.wf_module_id,
+                             cached_result.delta_id)
+    if result is None:
+        result = cached_result.result
+        resultcache.put(cached_result.wf_module_id, cached_result.delta_id,
+                        result)
+    return result
+
+
+def _read_input_table(cached_result: CachedRenderResult,
+                      columns: Optional[List[str]]) -> pd.DataFrame:
+    """
+    Read `columns` of `cached_result`'s table (or all columns, if None).
+
+    On a resultcache miss, only read `columns` from Parquet.
+    """
+    if columns is None:
+        return _read_result(cached_result).dataframe
+
+    result = resultcache.get(cached_result.wf_module_id,
+                             cached_result.delta_id)
+    if result is not None:
+        return result.dataframe[columns]
+    else:
+        return cached_result.read_dataframe(columns)
+
+
 def _needs_render(wf_module: WfModule) -> bool:
     return (
         wf_module.last_relevant_delta_id
@@ -16,6 +72,119 @@ def _needs_render(wf_module: WfModule) -> bool:
     )
 
 
+def _is_materialized(wf_module: WfModule) -> bool:
+    """True if `wf_module`'s cached table is on disk."""
+    return wf_module.cached_render_result_n_rows is None
+
+
+def _should_materialize(wf_module: WfModule, result: ProcessResult,
+                        render_seconds: float) -> bool:
+    """
+    Decide whether to write `result`'s table to disk.
+
+    Writing Parquet is slow, and most intermediate tables are never viewed. We
+    skip writing tables that are cheap to render again. We write:
+
+    * errors (there's no table to write)
+    * the output of slow renders
+    * the selected module's output and input: the user is viewing them
+    * the workflow's output: other workflows and embeds read it
+    * input to a module that loads data: its fetch may read it
+    * results we email about: the next render compares against them
+    * output someone reads through the public CSV/JSON URL
+
+    Call this within a lock: it queries the database.
+    """
+    if (
+        result.status != 'ok'
+        or wf_module.notifications
+        or wf_module.materialize_output
+    ):
+        return True
+
+    if render_seconds >= settings.MATERIALIZE_MIN_RENDER_SECONDS:
+        return True
+
+    selected = wf_module.workflow.selected_wf_module
+    if selected is not None and wf_module.order in (selected - 1, selected):
+        return True
+
+    next_wf_module = WfModule.objects \
+        .filter(workflow_id=wf_module.workflow_id, order=wf_module.order + 1) \
+        .select_related('module_version__module') \
+        .first()
+    if next_wf_module is None:
+        return True
+    module_version = next_wf_module.module_version
+    return module_version is not None and module_version.module.loads_data
+
+
+@lru_cache(maxsize=None)
+def _internal_modules_code_hash() -> str:
+    """
+    Hash the source code of internal modules.
+
+    Every internal module's ModuleVersion is the same version, deploy after
+    deploy. Without this hash, a memoized render would outlive a fix to the
+    module that rendered it. We hash the whole package, because modules
+    share helpers (e.g., `server.modules.utils`).
+    """
+    package_dir = os.path.dirname(server.modules.__file__)
+    sha1 = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(package_dir, '*.py'))):
+        with open(path, 'rb') as f:
+            sha1.update(f.read())
+    return sha1.hexdigest()
+
+
+def _render_key(wf_module: WfModule, params: Params,
+                input_key: Optional[str]) -> Optional[str]:
+    """
+    Identify a render's inputs; or return None if we can't.
+
+    Two renders with the same key produce the same result. The key covers:
+
+    * the module version -- and for internal modules, whose version never
+      changes, the hash of their code
+    * params
+    * the input table -- which we identify by the previous module's render
+      key. Keys form a chain, so we never need to hash table data.
+    * fetched data (StoredObject hash) and fetch error
+
+    Call this within a lock: it queries the database.
+    """
+    module_version = wf_module.module_version
+    if input_key is None or module_version is None:
+        return None
+
+    if wf_module.stored_data_version is None:
+        fetch_hash = None
+    else:
+        fetch_hash = wf_module.stored_objects \
+            .filter(stored_at=wf_module.stored_data_version) \
+            .values_list('hash', flat=True) \
+            .first()
+
+    params_list = sorted([id_name, pv.value, pv.items]
+                         for id_name, pv in params.vals.items())
+
+    if module_version.module.id_name in StaticModules:
+        code_hash = _internal_modules_code_hash()
+    else:
+        code_hash = None  # source_version_hash identifies the code
+
+    data = json.dumps([
+        module_version.module.id_name,
+        module_version.source_version_hash,
+        code_hash,
+        params_list,
+        input_key,
+        fetch_hash,
+        wf_module.fetch_error,
+    ])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
 class UnneededExecution(Exception):
     """Indicates that a render would produce useless results."""
     pass
@@ -75,7 +244,8 @@ def mark_wfmodule_unreachable(wf_module: WfModule):
 
 
 @database_sync_to_async
-def _execute_wfmodule_pre(wf_module: WfModule) -> Tuple:
+def _execute_wfmodule_pre(wf_module: WfModule,
+                          input_key: Optional[str]) -> Tuple:
     """
     First step of execute_wfmodule().
 
@@ -87,6 +257,10 @@ def _execute_wfmodule_pre(wf_module: WfModule) -> Tuple:
         * fetch_result: optional ProcessResult for dispatching render
         * old_result: if wf_module.notifications is set, the previous
           result we'll compare against after render.
+        * key: render key to store alongside the result (or None).
+
+    If a render with the same key produced the existing (or a memoized)
+    result, reuse it and return it as `cached_render_result`.
 
     All this runs synchronously within a database lock. (It's a separate
     function so that when we're done awaiting it, we can continue executing in
@@ -96,34 +270,63 @@ def _execute_wfmodule_pre(wf_module: WfModule) -> Tuple:
         cached_render_result = wf_module.get_cached_render_result()
 
         old_result = None
-        if cached_render_result:
+        if cached_render_result and cached_render_result.is_materialized:
             # If the cache is good, skip everything. No need for old_result,
             # because we know the output won't change (since we won't even run
             # render()).
+            #
+            # If the table isn't on disk, we're rendering because the next
+            # module needs it (or the user wants to see it). Render again.
             if (cached_render_result.delta_id
                     == wf_module.last_relevant_delta_id):
-                return (cached_render_result, None, None, None, None)
+                return (cached_render_result, None, None, None, None, None)
+
+        params = safe_wf_module.get_params()
+        key = _render_key(safe_wf_module, params, input_key)
 
-            if safe_wf_module.notifications:
-                old_result = cached_render_result.result
+        # Reusing a result whose table isn't on disk would give us no table
+        reusable = (
+            not cached_render_result
+            or cached_render_result.is_materialized
+            or key != cached_render_result.key
+        )
+        if reusable and (
+            cached_render_result
+            and key == cached_render_result.key
+            or not safe_wf_module.notifications
+        ):
+            # Skip render if we have a result with the same key. (Restoring
+            # a _different_ result from memo would change the output; skip
+            # that when we need to email about changes.)
+            reused = safe_wf_module.reuse_render_result(
+                safe_wf_module.last_relevant_delta_id,
+                key
+            )
+            if reused is not None:
+                safe_wf_module.save()
+                return (reused, None, None, None, None, None)
+
+        if cached_render_result and safe_wf_module.notifications:
+            old_result = _read_result(cached_render_result)
 
         module_version = wf_module.module_version
-        params = safe_wf_module.get_params()
         fetch_result = safe_wf_module.get_fetch_result()
 
         loaded_module = LoadedModule.for_module_version_sync(module_version)
 
-        return (None, loaded_module, params, fetch_result, old_result)
+        return (None, loaded_module, params, fetch_result, old_result, key)
 
 
 @database_sync_to_async
 def _execute_wfmodule_save(wf_module: WfModule, result: ProcessResult,
-                           old_result: ProcessResult) -> Tuple:
+                           old_result: ProcessResult,
+                           key: Optional[str], peak_bytes: int,
+                           render_seconds: float) -> Tuple:
     """
     Second database step of execute_wfmodule().
 
-    Writes result (and maybe has_unseen_notification) to the WfModule in the
-    database and returns a Tuple in this order:
+    Writes result, render_peak_bytes (and maybe has_unseen_notification) to
+    the WfModule in the database and returns a Tuple in this order:
         * cached_render_result: the return value of execute_wfmodule().
         * output_delta: if non-None, an OutputDelta to email to the Workflow
           owner.
@@ -139,10 +342,16 @@ def _execute_wfmodule_save(wf_module: WfModule, result: ProcessResult,
                 != wf_module.last_relevant_delta_id):
             raise UnneededExecution
 
+        materialize = _should_materialize(safe_wf_module, result,
+                                          render_seconds)
         cached_render_result = safe_wf_module.cache_render_result(
             safe_wf_module.last_relevant_delta_id,
-            result
+            result,
+            key=key or '',
+            materialize=materialize,
+            write_stats=False  # slow: we write them after unlocking
         )
+        safe_wf_module.render_peak_bytes = peak_bytes
 
         if safe_wf_module.notifications and result != old_result:
             safe_wf_module.has_unseen_notification = True
@@ -160,11 +369,61 @@ def _execute_wfmodule_save(wf_module: WfModule, result: ProcessResult,
         return (cached_render_result, output_delta)
 
 
+async def _render_unless_cancelled(
+    loaded_module: LoadedModule,
+    params: Params,
+    table: pd.DataFrame,
+    fetch_result: Optional[ProcessResult],
+    cancel: Optional[asyncio.Event]
+) -> ProcessResult:
+    """
+    Render; or raise UnneededExecution as soon as `cancel` is set.
+
+    If we're rendering in a child process, cancelling kills the child. If
+    we're rendering in a thread, the thread runs to completion and we ignore
+    its result.
+    """
+    render = asyncio.ensure_future(
+        renderpool.render(loaded_module, params, table, fetch_result)
+    )
+    if cancel is None:
+        return await render
+
+    cancelled = asyncio.ensure_future(cancel.wait())
+    done, _ = await asyncio.wait({render, cancelled},
+                                 return_when=asyncio.FIRST_COMPLETED)
+    cancelled.cancel()
+
+    if render in done:
+        return render.result()
+
+    render.cancel()
+    try:
+        await render  # let renderpool clean up
+    except asyncio.CancelledError:
+        pass
+    raise UnneededExecution
+
+
 async def execute_wfmodule(wf_module: WfModule,
-                           last_result: ProcessResult) -> CachedRenderResult:
+                           last_cached_result: Optional[CachedRenderResult],
+                           cancel: Optional[asyncio.Event]=None
+                           ) -> CachedRenderResult:
     """
     Render a single WfModule; cache and return output.
 
+    `last_cached_result` is the previous module's output, or None if
+    `wf_module` is the first module. We only read its table from disk if we
+    need to render. We don't need to render if the cached result -- or a
+    memoized one -- has the same render key as the one we'd produce.
+
+    If `cancel` is set mid-render, abort the render and raise
+    UnneededExecution.
+
+    If the input and output tables need more memory than renderbudget allows,
+    the result is an error. We record the memory the render needed as
+    `wf_module.render_peak_bytes`.
+
     CONCURRENCY NOTES: This function is reasonably concurrency-friendly:
 
     * It returns a valid cache result immediately.
@@ -182,7 +441,8 @@ async def execute_wfmodule(wf_module: WfModule,
 
     These guarantees mean:
 
-    * TODO It's relatively cheap to render twice.
+    * It's relatively cheap to render twice: if nothing changed, we reuse
+      the previous result instead of rendering.
     * Users who modify a WfModule while it's rendering will be stalled -- for
       as short a duration as possible.
     * When a user changes a workflow significantly, all prior renders will end
@@ -190,22 +450,57 @@ async def execute_wfmodule(wf_module: WfModule,
 
     Raises `UnneededExecution` when the input WfModule should not be rendered.
     """
-    (cached_render_result, loaded_module, params, fetch_result, old_result
-     ) = await _execute_wfmodule_pre(wf_module)
+    if last_cached_result is None:
+        input_key = EmptyInputKey
+    else:
+        input_key = last_cached_result.key or None
+
+    (cached_render_result, loaded_module, params, fetch_result, old_result,
+     key) = await _execute_wfmodule_pre(wf_module, input_key)
 
     # If the cached render result is valid, we're done!
     if cached_render_result is not None:
         return cached_render_result
 
-    table = last_result.dataframe
-    loop = asyncio.get_event_loop()
-    # Render may take a while. run_in_executor to push that slowdown to a
-    # thread and keep our event loop responsive.
-    result = await loop.run_in_executor(None, loaded_module.render, params,
-                                        table, fetch_result)
+    if last_cached_result is None:
+        # First module has empty-DataFrame input.
+        table = ProcessResult().dataframe
+    else:
+        # Only read the columns the module will use. A module that selects
+        # five columns from a 200-column table needn't read the other 195.
+        columns = loaded_module.input_columns(params,
+                                              last_cached_result.column_names)
+        table = _read_input_table(last_cached_result, columns)
+
+    reservation = renderbudget.reserve(renderbudget.table_nbytes(table))
+    time1 = time.time()
+    try:
+        async with reservation:
+            # Render may take a while. renderpool pushes that slowdown to a
+            # child process (or a thread) and keeps our event loop responsive.
+            result = await _render_unless_cancelled(loaded_module, params,
+                                                    table, fetch_result,
+                                                    cancel)
+            reservation.add(renderbudget.table_nbytes(result.dataframe))
+    except renderbudget.OverBudget as err:
+        result = ProcessResult(error=str(err))
+        # The inputs didn't produce this error: the budget did, and it may
+        # be bigger next time. Don't store it under the render key, or we'd
+        # restore it instead of rendering.
+        key = None
+    del table  # free memory before we wait for the database
+    render_seconds = time.time() - time1
 
     cached_render_result, output_delta = \
-        await _execute_wfmodule_save(wf_module, result, old_result)
+        await _execute_wfmodule_save(wf_module, result, old_result, key,
+                                     reservation.peak_bytes, render_seconds)
+
+    # Summarize columns outside the database lock: it takes a while, and
+    # users wait for the lock. (It locks briefly to write the summaries.)
+    await database_sync_to_async(cached_render_result.write_column_stats)()
+
+    # The next module will probably read this as input -- soon.
+    resultcache.put(wf_module.id, cached_render_result.delta_id, result)
 
     # Email notification if data has changed. Do this outside of the database
     # lock, because SMTP can be slow, and Django's email backend is
@@ -213,10 +508,6 @@ async def execute_wfmodule(wf_module: WfModule,
     if output_delta:
         notifications.email_output_delta(output_delta, datetime.datetime.now())
 
-    # TODO if there's no change, is it possible for us to skip the render
-    # and simply set cached_render_result_delta_id=last_relevant_delta_id?
-    # Investigate whether this is a worthwhile optimization.
-
     return cached_render_result
 
 
@@ -263,6 +554,12 @@ def _load_wf_modules_and_input(workflow: Workflow):
         while index < len(wf_modules) and not _needs_render(wf_modules[index]):
             index += 1
 
+        # 3. If its input isn't on disk, render that input again, too. (See
+        # _should_materialize().)
+        if index < len(wf_modules):
+            while index > 0 and not _is_materialized(wf_modules[index - 1]):
+                index -= 1
+
         wf_modules_needing_render = wf_modules[index:]
 
         if not wf_modules_needing_render:
@@ -284,15 +581,130 @@ def _load_wf_modules_and_input(workflow: Workflow):
         return wf_modules_needing_render, prev_result
 
 
-async def execute_workflow(workflow: Workflow) -> Optional[CachedRenderResult]:
+@database_sync_to_async
+def _load_preview_plan(workflow: Workflow,
+                       wf_modules: List[WfModule]) -> Optional[List[Tuple]]:
+    """
+    Find the stale modules up to and including the selected one.
+
+    Return a list of (wf_module, loaded_module, params) Tuples; or None if we
+    can't preview because the selected module isn't stale or a module in the
+    chain isn't row-wise. (See `ModuleImpl.is_row_wise()`.)
+    """
+    with workflow.cooperative_lock():
+        selected = workflow.selected_wf_module
+        chain = [wf_module for wf_module in wf_modules
+                 if selected is not None and wf_module.order <= selected]
+        if not chain or chain[-1].order != selected:
+            return None
+
+        plan = []
+        for wf_module in chain:
+            module_version = wf_module.module_version
+            if module_version is None:
+                return None
+            if wf_module.stored_data_version is not None:
+                # We'd need to read its fetch result: not worth it for a
+                # preview.
+                return None
+
+            loaded_module = \
+                LoadedModule.for_module_version_sync(module_version)
+            params = wf_module.get_params()
+            if not loaded_module.is_row_wise(params):
+                return None
+
+            plan.append((wf_module, loaded_module, params))
+
+        return plan
+
+
+async def _send_preview(workflow: Workflow, wf_modules: List[WfModule],
+                        last_cached_result: Optional[CachedRenderResult],
+                        cancel: Optional[asyncio.Event]) -> None:
+    """
+    Render the first few rows of the selected module and send them to clients.
+
+    A full render of a huge table can take many seconds. When every module
+    between the last-rendered output and the selected module is row-wise, the
+    first `PreviewNRows` rows of input give the first `PreviewNRows` rows of
+    output -- and rendering those is nearly instant.
+
+    The client shows `output_preview` until the full render's status arrives.
+    It ignores previews for any other `delta_id`.
+    """
+    if (
+        last_cached_result is None
+        or last_cached_result.status != 'ok'
+        or len(last_cached_result) <= PreviewNRows
+    ):
+        # Nothing to preview, or the full render will be fast anyway
+        return
+
+    plan = await _load_preview_plan(workflow, wf_modules)
+    if plan is None:
+        return
+
+    cached = resultcache.get(last_cached_result.wf_module_id,
+                             last_cached_result.delta_id)
+    if cached is not None:
+        table = cached.dataframe.head(PreviewNRows)
+    else:
+        table = last_cached_result.read_head(PreviewNRows)
+
+    for _, loaded_module, params in plan:
+        # Previews share the worker's memory, too: reserve it, like
+        # execute_wfmodule() does.
+        reservation = renderbudget.reserve(renderbudget.table_nbytes(table))
+        try:
+            async with reservation:
+                result = await _render_unless_cancelled(loaded_module,
+                                                        params, table, None,
+                                                        cancel)
+                reservation.add(renderbudget.table_nbytes(result.dataframe))
+        except renderbudget.OverBudget:
+            return  # the full render will be over budget, too
+        if result.status != 'ok':
+            return  # the full render will report the error
+        table = result.dataframe.head(PreviewNRows)
+
+    if len(table.columns) > PreviewMaxNColumns:
+        return
+
+    wf_module = plan[-1][0]
+    columns = [{'name': c.name, 'type': c.type} for c in result.columns]
+    rows = json.loads(table.to_json(orient='records', date_format='iso'))
+
+    await websockets.ws_client_send_delta_async(workflow.id, {
+        'updateWfModules': {
+            str(wf_module.id): {
+                'output_preview': {
+                    'delta_id': wf_module.last_relevant_delta_id,
+                    'columns': columns,
+                    'rows': rows,
+                },
+            },
+        },
+    })
+
+
+async def execute_workflow(
+    workflow: Workflow,
+    cancel: Optional[asyncio.Event]=None
+) -> Optional[CachedRenderResult]:
     """
     Ensure all `workflow.wf_modules` have valid cached render results.
 
     Raise UnneededExecution if the inputs become stale (at which point we don't
     care about results any more).
 
+    Also raise UnneededExecution soon after somebody sets `cancel`: before the
+    next module, or mid-render. Callers set it when they learn of a newer
+    delta: that's quicker than waiting for the next stale database-write.
+
     WEBSOCKET NOTES: each wf_module is executed in turn. After each execution,
-    we notify clients of its new columns and status.
+    we notify clients of its new columns and status. Before that, we may send
+    a preview of the selected module's first rows.
     """
     wf_modules, last_cached_result = await _load_wf_modules_and_input(
         workflow
@@ -301,25 +713,26 @@ async def execute_workflow(workflow: Workflow) -> Optional[CachedRenderResult]:
     if not wf_modules:
         return last_cached_result
 
+    await _send_preview(workflow, wf_modules, last_cached_result, cancel)
+
     # Execute one module at a time.
     #
     # We don't hold any lock throughout the loop: the loop can take a long
     # time; it might be run multiple times simultaneously (even on different
     # computers); and `await` doesn't work with locks.
     for wf_module in wf_modules:
+        if cancel is not None and cancel.is_set():
+            raise UnneededExecution
+
         # The first module in the Workflow has last_cached_result=None.
         # Other than that, there's no recovering from any non='ok' result:
         # all subsequent results should be 'unreachable'
         if last_cached_result and last_cached_result.status != 'ok':
             last_cached_result = await mark_wfmodule_unreachable(wf_module)
         else:
-            if last_cached_result:
-                last_result = last_cached_result.result
-            else:
-                # First module has empty-DataFrame input.
-                last_result = ProcessResult()
-
-            last_cached_result = await execute_wfmodule(wf_module, last_result)
+            last_cached_result = await execute_wfmodule(wf_module,
+                                                        last_cached_result,
+                                                        cancel)
 
         await websockets.ws_client_send_delta_async(workflow.id, {
             'updateWfModules': {
@@ -0,0 +1,128 @@
+"""
+Keep recently-read table file headers in memory.
+
+Every tile, render and value-counts request builds a new CachedRenderResult,
+and each one used to parse its file's footer and metadata again. This
+process-wide cache lets them share one header per file version.
+
+Headers are keyed by `(path, inode, mtime, size, delta_id)`: writing a new
+file at `path` changes those, so entries never go stale. Each header has an
+`owner` -- for render results, `(workflow_id, wf_module_id)`. Versions are
+written to new paths, so when a header is cached, we drop other headers with
+the same owner: they're superseded versions, and we mustn't hold them open.
+Otherwise entries fall out least-recently-used first.
+
+A cached header holds the file open (see `server.arrowfile.ArrowFile`), so
+readers can keep reading it after it is deleted or replaced on disk.
+
+Usage:
+
+    header = headercache.read_header(path, delta_id, arrowfile.read_header,
+                                     owner=(workflow_id, wf_module_id))
+    headercache.stats()  # hits and misses, for tuning
+"""
+from collections import OrderedDict
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# Number of headers we keep. Each one may hold a file open.
+MaxNHeaders = 100
+
+# We log stats every so often, so we can size the cache.
+LogEveryNMisses = 1000
+
+
+class HeaderCache:
+    """
+    LRU cache of file headers.
+
+    Thread-safe: Django calls views from several threads.
+    """
+
+    def __init__(self, max_n_headers: int):
+        self.max_n_headers = max_n_headers
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (path, inode, mtime_ns, size, delta_id) => (owner, header)
+        self._entries = OrderedDict()
+
+    def read_header(self, path: str, delta_id: int,
+                    read: Callable[[str], Any],
+                    owner: Optional[Hashable]=None) -> Any:
+        """
+        Return the header of `path`, calling `read(path)` on a miss.
+
+        On a miss, drop other headers with the same `owner` (or, if `owner`
+        is None, the same `path`).
+
+        May raise OSError (e.g., FileNotFoundError) or whatever `read()`
+        raises. Errors aren't cached.
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size, delta_id)
+
+        with self._lock:
+            try:
+                _, header = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                should_log = self.misses % LogEveryNMisses == 0
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return header
+
+        if should_log:
+            logger.info('Header cache: %r', self.stats())
+
+        # Read outside the lock: it's slow. Two threads may read the same
+        # file at once; that's okay.
+        header = read(path)
+
+        if owner is None:
+            owner = path
+
+        with self._lock:
+            for other_key, (other_owner, _) in list(self._entries.items()):
+                if other_owner == owner:
+                    del self._entries[other_key]  # another version
+
+            self._entries[key] = (owner, header)
+
+            while len(self._entries) > self.max_n_headers:
+                self._entries.popitem(last=False)
+
+        return header
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters, so we can size the cache."""
+        with self._lock:
+            n_lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / n_lookups if n_lookups else None,
+                'n_headers': len(self._entries),
+                'max_n_headers': self.max_n_headers,
+            }
+
+
+_cache = HeaderCache(MaxNHeaders)
+
+
+def read_header(path: str, delta_id: int, read: Callable[[str], Any],
+                owner: Optional[Hashable]=None) -> Any:
+    """Return a cached header of `path`, calling `read(path)` on a miss."""
+    return _cache.read_header(path, delta_id, read, owner)
+
+
+def stats() -> Dict[str, Any]:
+    """Return hit and miss counters of the process-wide cache."""
+    return _cache.stats()
@@ -0,0 +1,24 @@
+import tempfile
+from django.core.management.base import BaseCommand
+from server import cachebenchmark
+
+
+class Command(BaseCommand):
+    help = 'Report file size, write time and read time of each codec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None,
+                            help='Directory to write files in (default: tmp)')
+        parser.add_argument('--n-rows', type=int, default=1000000,
+                            help='Number of rows in each synthetic table')
+
+    def handle(self, *args, **options):
+        tables = list(cachebenchmark.synthetic_tables(options['n_rows'])) \
+            + list(cachebenchmark.sample_tables())
+        formats = cachebenchmark.default_formats()
+
+        with tempfile.TemporaryDirectory(dir=options['dir']) as dirname:
+            for measurement in cachebenchmark.run(tables, formats, dirname):
+                self.stdout.write(
+                    cachebenchmark.format_measurement(measurement)
+                )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from server.cron import storagegc
+
+
+class Command(BaseCommand):
+    help = 'Delete cache and StoredObject files no database row refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quarantine-dir', default=None,
+                            help='Move orphans here instead of deleting them')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count orphans; do not touch them')
+        parser.add_argument('--min-age-seconds', type=float,
+                            default=storagegc.MinAgeSeconds,
+                            help='Skip files newer than this')
+
+    def handle(self, *args, **options):
+        report = storagegc.collect_garbage_sync(
+            min_age_seconds=options['min_age_seconds'],
+            quarantine_dir=options['quarantine_dir'],
+            dry_run=options['dry_run']
+        )
+        verb = 'Found' if options['dry_run'] else 'Collected'
+        self.stdout.write(f'{verb} {report.n_files:,d} orphaned files '
+                          f'({report.n_bytes:,d} bytes)')
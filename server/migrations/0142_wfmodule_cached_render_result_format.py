@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0141_wfmodule_cached_render_result_shape'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wfmodule',
+            name='cached_render_result_format',
+            field=models.CharField(choices=[('arrow', 'arrow'), ('parquet', 'parquet')], default='parquet', max_length=10),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0144_storedobject_column_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedobject',
+            name='n_rows',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='storedobject',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dependents', to='server.StoredObject'),
+        ),
+        migrations.AddField(
+            model_name='storedobject',
+            name='base_rows_first',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='storedobject',
+            name='chain_length',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from server.models.StoredObject import protect_dependents
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0146_wfmodule_materialize_output'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storedobject',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=protect_dependents, related_name='dependents', to='server.StoredObject'),
+        ),
+    ]
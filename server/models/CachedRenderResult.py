@@ -1,17 +1,245 @@
+import hashlib
 import os
 import json
+import re
+import shutil
+import time
 from typing import Any, Dict, List, Optional
 from django.core.files.storage import default_storage
 import pandas
+import pyarrow
 from pandas.api.types import is_numeric_dtype, is_datetime64_dtype
 from server.modules.types import Column, ProcessResult, QuickFix
-from server import parquet
+from server import arrowfile, atomicfile, columnstats, headercache, parquet
 
 
-def _parquet_path(workflow_id: int, wf_module_id: int):
-    """Return the path on disk where we save Parquet. for this wf_module."""
-    path = f'cached-render-results/wf-{workflow_id}/wfm-{wf_module_id}.dat'
-    return default_storage.path(path)
+# Number of superseded render results we keep per WfModule, so undo/redo can
+# restore them instead of re-rendering.
+MaxMemoizedResultsPerWfModule = 2
+
+# Seconds we keep a table file after a new version supersedes it. Another
+# process may have read the old version's path from the database and not yet
+# opened it. (Once it's open, deleting it is safe.)
+StaleFileGraceSeconds = 60
+
+
+def _parquet_path(workflow_id: int, wf_module_id: int,
+                  file_version: Optional[int]) -> str:
+    """
+    Return the path on disk where we save this wf_module's table.
+
+    `file_version` is the delta_id the file was written for. Each version gets
+    its own file, so a reader that looked up an old version never reads a
+    newer table by mistake. `None` means the file predates versioning.
+    """
+    if file_version is None:
+        name = f'wfm-{wf_module_id}.dat'
+    else:
+        name = f'wfm-{wf_module_id}-v{file_version}.dat'
+    return default_storage.path(f'cached-render-results/wf-{workflow_id}/'
+                                + name)
+
+
+def _list_table_paths(workflow_id: int, wf_module_id: int) -> List[str]:
+    """List every version of a WfModule's table on disk."""
+    dirname = os.path.dirname(_parquet_path(workflow_id, wf_module_id, None))
+    regex = re.compile(rf'^wfm-{wf_module_id}(-v\d+)?\.dat$')
+    try:
+        names = os.listdir(dirname)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(dirname, name) for name in names
+            if regex.match(name)]
+
+
+def _current_table_path(wf_module: 'WfModule') -> Optional[str]:
+    """Return the path of `wf_module`'s table on disk, or None."""
+    workflow_id = wf_module.cached_render_result_workflow_id
+    if (
+        workflow_id is None
+        or wf_module.cached_render_result_delta_id is None
+        or wf_module.cached_render_result_n_rows is not None
+    ):
+        return None
+    return _parquet_path(workflow_id, wf_module.id,
+                         wf_module.cached_render_result_file_version)
+
+
+def _mark_superseded(path: Optional[str]) -> None:
+    """
+    Record that `path` is no longer current, by setting its mtime to now.
+
+    Until we do, its mtime says when it was _written_ -- or, for a hard link
+    (see `WfModule.duplicate()`), when its source was written. Either may be
+    long ago, and `_delete_stale_table_paths()` would delete it right away.
+    """
+    if path is None:
+        return
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _delete_stale_table_paths(workflow_id: int, wf_module_id: int,
+                              current_path: Optional[str]) -> None:
+    """
+    Delete versions of a WfModule's table other than `current_path`.
+
+    Versions superseded less than `StaleFileGraceSeconds` ago (see
+    `_mark_superseded()`) are kept, because a reader may be about to open
+    them. A later call -- or `server.cron.storagegc` -- deletes them.
+    """
+    min_mtime = time.time() - StaleFileGraceSeconds
+    for path in _list_table_paths(workflow_id, wf_module_id):
+        if path == current_path:
+            continue
+        try:
+            if os.stat(path).st_mtime > min_mtime:
+                continue
+        except FileNotFoundError:
+            continue
+        _delete_table_path(path)
+
+
+def _memo_dir(workflow_id: int) -> str:
+    """Return the directory where we keep superseded render results."""
+    return default_storage.path(f'cached-render-results/wf-{workflow_id}/memo')
+
+
+def _memo_path(workflow_id: int, wf_module_id: int, key: str) -> str:
+    """
+    Return the path to a superseded render result's Parquet file.
+
+    Alongside it, at `path + '.json'`, we store the result's non-table fields.
+    """
+    return os.path.join(_memo_dir(workflow_id),
+                        f'wfm-{wf_module_id}-{key}.dat')
+
+
+def _value_counts_dir(workflow_id: int, wf_module_id: int) -> str:
+    """Return the directory where we keep a WfModule's value counts."""
+    return default_storage.path(
+        f'cached-render-results/wf-{workflow_id}/value-counts/'
+        f'wfm-{wf_module_id}'
+    )
+
+
+def _column_hash(column: str) -> str:
+    return hashlib.sha1(column.encode('utf-8')).hexdigest()
+
+
+def _value_counts_path(workflow_id: int, wf_module_id: int, delta_id: int,
+                       column: str) -> str:
+    """
+    Return the path to a column's value counts, as JSON.
+
+    The filename includes `delta_id`, so a new result never reads an old
+    result's value counts.
+    """
+    return os.path.join(_value_counts_dir(workflow_id, wf_module_id),
+                        f'v{delta_id}-{_column_hash(column)}.json')
+
+
+def _write_value_counts(path: str, value_counts: Dict[str, int]) -> None:
+    """Write value counts, so concurrent readers never see half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomicfile.replacing(path) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            json.dump(value_counts, f)
+
+
+def _list_memo_paths(workflow_id: int, wf_module_id: int) -> List[str]:
+    """List a WfModule's memoized Parquet files, newest first."""
+    prefix = f'wfm-{wf_module_id}-'
+    try:
+        names = os.listdir(_memo_dir(workflow_id))
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(_memo_dir(workflow_id), name) for name in names
+             if name.startswith(prefix) and name.endswith('.dat')]
+    return sorted(paths, key=lambda p: os.stat(p).st_mtime, reverse=True)
+
+
+def _stats_path(path: str) -> str:
+    """Return the path to the column stats of the table at `path`."""
+    return path + '.stats.json'
+
+
+def _delete_table_path(path: str) -> None:
+    """Delete a table from disk, with its column stats."""
+    for p in (path, _stats_path(path)):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+
+def _write_column_stats(path: str,
+                        table: pandas.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """Summarize `table`'s columns to `path`; return the stats."""
+    stats = columnstats.compute(table)
+    columnstats.write(path, stats)
+    return stats
+
+
+def _categorical_value_counts(
+    table: pandas.DataFrame,
+    stats: Dict[str, Dict[str, Any]]
+) -> Dict[str, Dict[str, int]]:
+    """
+    Count categorical columns' values, where `stats` lack some values.
+
+    Their codes make counting cheap.
+    """
+    return dict(
+        (column, columnstats.value_counts(table[column]).to_dict())
+        for column, column_stats in stats.items()
+        if (hasattr(table[column], 'cat')
+            and column_stats['n_distinct'] > len(column_stats['top_values']))
+    )
+
+
+def _write_categorical_value_counts(workflow_id: int, wf_module_id: int,
+                                    delta_id: int,
+                                    value_counts: Dict[str, Dict[str, int]]
+                                    ) -> None:
+    """Index value counts from `_categorical_value_counts()`."""
+    for column, column_value_counts in value_counts.items():
+        _write_value_counts(
+            _value_counts_path(workflow_id, wf_module_id, delta_id, column),
+            column_value_counts
+        )
+
+
+def _link_table_path(src: str, dst: str) -> None:
+    """
+    Hard-link a table on disk, with its column stats. May raise OSError.
+
+    Unlike a rename, this leaves `src` for readers that are about to open it.
+    """
+    atomicfile.copy(src, dst)
+    try:
+        atomicfile.copy(_stats_path(src), _stats_path(dst))
+    except FileNotFoundError:
+        pass  # it was written before we stored stats
+
+
+def _rename_table_path(src: str, dst: str) -> None:
+    """Move a table on disk, with its column stats. May raise OSError."""
+    os.rename(src, dst)
+    try:
+        os.rename(_stats_path(src), _stats_path(dst))
+    except FileNotFoundError:
+        pass  # it was written before we stored stats
+
+
+def _delete_memo_path(path: str) -> None:
+    _delete_table_path(path)
+    try:
+        os.remove(path + '.json')
+    except FileNotFoundError:
+        pass
 
 
 def _dtype_to_column_type(dtype) -> str:
@@ -35,12 +263,27 @@ class CachedRenderResult:
     (This is unconventional. The convention is to use OneToOneField, but that
     has no pros, only cons.)
 
-    Part of this result is also stored on disk. Read it as `parquet_file`.
+    Part of this result is also stored on disk, as `file_format` ('arrow' or
+    'parquet'). Read its header as `table_file`. We write new results as Arrow
+    IPC, which the web server can memory-map and slice cheaply; results
+    written before we switched from Parquet stay readable.
+
+    `key` identifies the render's inputs: module version, params, input key and
+    fetched data. Two renders with the same non-empty `key` produce the same
+    result. (See `server.execute`.) An empty `key` means "unknown inputs".
+
+    A result may be "not materialized": we stored its `stored_columns` and
+    `stored_n_rows` but not its table. Its table reads as empty: render again
+    to get it.
     """
 
     def __init__(self, workflow_id: int, wf_module_id: int, delta_id: int,
                  status: str, error: str, json: Optional[Dict[str, Any]],
-                 quick_fixes: List[QuickFix]):
+                 quick_fixes: List[QuickFix], key: str='',
+                 stored_columns: Optional[List[Column]]=None,
+                 stored_n_rows: Optional[int]=None,
+                 file_format: str='arrow',
+                 file_version: Optional[int]=None):
         self.workflow_id = workflow_id
         self.wf_module_id = wf_module_id
         self.delta_id = delta_id
@@ -48,16 +291,47 @@ class CachedRenderResult:
         self.error = error
         self.json = json
         self.quick_fixes = quick_fixes
+        self.key = key
+        self.stored_columns = stored_columns
+        self.stored_n_rows = stored_n_rows
+        self.file_format = file_format
+        self.file_version = file_version
+
+    @property
+    def is_materialized(self) -> bool:
+        """True if the table is on disk (or in memory)."""
+        return self.stored_n_rows is None or hasattr(self, '_result')
 
     @property
     def parquet_path(self):
-        return _parquet_path(self.workflow_id, self.wf_module_id)
+        return _parquet_path(self.workflow_id, self.wf_module_id,
+                             self.file_version)
+
+    @property
+    def stats_path(self):
+        return _stats_path(self.parquet_path)
 
     @property
-    def parquet_file(self):
-        if not hasattr(self, '_parquet_file'):
+    def table_file(self):
+        """
+        Read the on-disk header: an ArrowFile or a fastparquet.ParquetFile.
+
+        Both have `columns`, `dtypes`, `count` and `to_pandas()`.
+        """
+        if not self.is_materialized:
+            return None
+
+        if not hasattr(self, '_table_file'):
             try:
-                self._parquet_file = parquet.read_header(self.parquet_path)
+                if self.file_format == 'parquet':
+                    read_header = parquet.read_header
+                else:
+                    read_header = arrowfile.read_header
+                # Share headers between requests: parsing them is slow
+                self._table_file = headercache.read_header(
+                    self.parquet_path, self.delta_id, read_header,
+                    owner=(self.workflow_id, self.wf_module_id)
+                )
             except OSError:
                 # Two possibilities:
                 #
@@ -67,28 +341,129 @@ class CachedRenderResult:
                 #
                 # Either way, our cached DataFrame is "empty", and we represent
                 # that as None.
-                self._parquet_file = None
-            except parquet.FastparquetCouldNotHandleFile:
+                self._table_file = None
+            except (parquet.FastparquetCouldNotHandleFile,
+                    pyarrow.ArrowInvalid):
                 # Treat bugs as "empty file"
-                self._parquet_file = None
+                self._table_file = None
 
-        # TODO keep a handle on the file, to guarantee it doesn't disappear
-        # from disk until after this CachedRenderResult is destroyed. Until
-        # then, every read from self._parquet_file is a race.
-        return self._parquet_file
+        # An ArrowFile keeps the file mapped, so reads from it can't race
+        # with writers. TODO do the same for ParquetFile: until then, every
+        # read from a Parquet-format self._table_file is a race.
+        return self._table_file
+
+    @property
+    def column_stats(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Read per-column stats from disk, or None if there are none.
+
+        See `server.columnstats` for the format. Results written before we
+        computed stats, and results that aren't materialized, have none.
+        """
+        if not self.is_materialized:
+            return None
+
+        if not hasattr(self, '_column_stats'):
+            self._column_stats = columnstats.read(self.stats_path)
+        return self._column_stats
+
+    def write_column_stats(self) -> None:
+        """
+        Summarize the in-memory table's columns, next to the table on disk.
+
+        `assign_wf_module(..., write_stats=False)` leaves this for the caller
+        to do later, outside the workflow lock: it's slow. No-op if the table
+        isn't on disk or isn't in memory.
+
+        We summarize without the lock, then take it to write the files --
+        only if this is still the WfModule's current result. Otherwise, a
+        concurrent render has already deleted this table, and nothing would
+        ever delete its stats.
+
+        This queries the database.
+        """
+        from server.models import WfModule, Workflow  # circular import
+
+        if self.stored_n_rows is not None or not hasattr(self, '_result'):
+            return
+
+        table = self._result.dataframe
+        stats = columnstats.compute(table)
+        value_counts = _categorical_value_counts(table, stats)
+
+        try:
+            workflow = Workflow.objects.get(id=self.workflow_id)
+            with workflow.cooperative_lock():
+                if not WfModule.objects.filter(
+                    id=self.wf_module_id,
+                    cached_render_result_delta_id=self.delta_id,
+                    cached_render_result_file_version=self.file_version
+                ).exists():
+                    return  # a newer result superseded this one
+
+                columnstats.write(self.stats_path, stats)
+                _write_categorical_value_counts(self.workflow_id,
+                                                self.wf_module_id,
+                                                self.delta_id, value_counts)
+        except (Workflow.DoesNotExist, OSError):
+            return  # readers can do without
+
+        self._column_stats = stats
+
+    def value_counts_etag(self, column: str) -> str:
+        """
+        Return an HTTP ETag for `read_value_counts(column)`.
+
+        It changes whenever the result does, because delta_id does.
+        """
+        return (
+            f'"wfm-{self.wf_module_id}-v{self.delta_id}-'
+            f'{_column_hash(column)[:16]}"'
+        )
+
+    def read_value_counts(self, column: str) -> Dict[str, int]:
+        """
+        Count each value in `column`, as strings, most frequent first.
+
+        Answer from `column_stats` if they list every value, or else from the
+        column's value-counts index. If there is no index, read the column
+        and build the index, so the next call is quick.
+        """
+        stats = (self.column_stats or {}).get(column)
+        if stats and stats['n_distinct'] <= len(stats['top_values']):
+            return dict(stats['top_values'])
+
+        path = _value_counts_path(self.workflow_id, self.wf_module_id,
+                                  self.delta_id, column)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+        series = self.read_dataframe([column])[column]
+        value_counts = columnstats.value_counts(series).to_dict()
+
+        if self.status == 'ok' and self.is_materialized:
+            try:
+                _write_value_counts(path, value_counts)
+            except OSError:
+                pass  # we'll count again next time
+
+        return value_counts
 
     @property
     def result(self):
         """
-        Convert to ProcessResult -- which means reading the parquet file.
+        Convert to ProcessResult -- which means reading the whole file.
 
         It's best to avoid this operation when possible.
         """
         if not hasattr(self, '_result'):
-            if self.status == 'ok' and self.parquet_file:
+            if self.status == 'ok' and self.table_file:
                 # At this point, we know the file exists. (It may be an empty
                 # DataFrame.)
-                dataframe = self.parquet_file.to_pandas()
+                dataframe = self.table_file.to_pandas()
             else:
                 dataframe = pandas.DataFrame()
 
@@ -98,6 +473,55 @@ class CachedRenderResult:
 
         return self._result
 
+    def read_dataframe(self,
+                       columns: Optional[List[str]]=None) -> pandas.DataFrame:
+        """
+        Read the table -- or, if `columns` is set, only those columns.
+
+        Reading a few columns of a wide table is much cheaper than reading
+        `result`. (The result is not kept in memory: call this once.)
+        """
+        if columns is None:
+            return self.result.dataframe
+
+        if hasattr(self, '_result'):
+            return self._result.dataframe[columns]
+        elif not columns:
+            # Keep the row count, even with zero columns
+            return pandas.DataFrame(index=pandas.RangeIndex(len(self)))
+        elif self.status == 'ok' and self.table_file:
+            return self.table_file.to_pandas(columns=columns)
+        else:
+            return pandas.DataFrame()
+
+    def read_rows(self, start: int, stop: int,
+                  columns: Optional[List[str]]=None) -> pandas.DataFrame:
+        """
+        Read rows `start` (inclusive) to `stop` (exclusive).
+
+        This only decodes the requested rows (or, from Parquet, the row groups
+        that hold them): its cost does not grow with the table's length. The
+        returned DataFrame is indexed from 0.
+        """
+        if hasattr(self, '_result'):
+            dataframe = self._result.dataframe
+            if columns is not None:
+                dataframe = dataframe[columns]
+            return dataframe[start:stop].reset_index(drop=True)
+        elif self.status != 'ok' or not self.table_file:
+            return pandas.DataFrame()
+        elif self.file_format == 'arrow':
+            return self.table_file.read_rows(start, stop, columns=columns)
+        else:
+            return parquet.read_rows(self.parquet_path, columns, start, stop)
+
+    def read_head(self, n_rows: int) -> pandas.DataFrame:
+        """Read the first `n_rows` rows of the table."""
+        if hasattr(self, '_result'):
+            return self._result.dataframe.head(n_rows)
+        else:
+            return self.read_rows(0, n_rows)
+
     @property
     def column_names(self) -> List[str]:
         """
@@ -107,8 +531,10 @@ class CachedRenderResult:
         """
         if hasattr(self, '_result'):
             return self._result.column_names
-        elif self.parquet_file:
-            return self.parquet_file.columns
+        elif not self.is_materialized:
+            return [c.name for c in self.stored_columns]
+        elif self.table_file:
+            return self.table_file.columns
         else:
             return []
 
@@ -123,8 +549,10 @@ class CachedRenderResult:
         """
         if hasattr(self, '_result'):
             return len(self._result.dataframe)
-        elif self.parquet_file:
-            return self.parquet_file.count
+        elif not self.is_materialized:
+            return self.stored_n_rows
+        elif self.table_file:
+            return self.table_file.count
         else:
             return 0
 
@@ -137,8 +565,10 @@ class CachedRenderResult:
         """
         if hasattr(self, '_result'):
             return self._result.column_types
-        elif self.parquet_file:
-            dtypes = self.parquet_file.dtypes.values()
+        elif not self.is_materialized:
+            return [c.type for c in self.stored_columns]
+        elif self.table_file:
+            dtypes = self.table_file.dtypes.values()
         else:
             dtypes = []
 
@@ -192,11 +622,29 @@ class CachedRenderResult:
         # Coerce from tuples to QuickFixes
         quick_fixes = [QuickFix.coerce(qf) for qf in quick_fixes]
 
-        ret = CachedRenderResult(workflow_id=workflow_id,
-                                 wf_module_id=wf_module_id, delta_id=delta_id,
-                                 status=status, error=error, json=json_dict,
-                                 quick_fixes=quick_fixes)
-        # Keep in mind: ret.parquet_file has not been loaded yet. That means
+        if wf_module.cached_render_result_n_rows is None:
+            stored_columns = None
+        else:
+            stored_columns = [
+                Column(c['name'], c['type'])
+                for c in (wf_module.cached_render_result_columns or [])
+            ]
+
+        ret = CachedRenderResult(
+            workflow_id=workflow_id,
+            wf_module_id=wf_module_id,
+            delta_id=delta_id,
+            status=status,
+            error=error,
+            json=json_dict,
+            quick_fixes=quick_fixes,
+            key=wf_module.cached_render_result_key,
+            stored_columns=stored_columns,
+            stored_n_rows=wf_module.cached_render_result_n_rows,
+            file_format=wf_module.cached_render_result_format,
+            file_version=wf_module.cached_render_result_file_version
+        )
+        # Keep in mind: ret.table_file has not been loaded yet. That means
         # this result is _not_ a snapshot in time, and you must be careful not
         # to treat it as such.
         return ret
@@ -210,25 +658,147 @@ class CachedRenderResult:
         wf_module.cached_render_result_error = ''
         wf_module.cached_render_result_json = b'null'
         wf_module.cached_render_result_quick_fixes = []
+        wf_module.cached_render_result_key = ''
+        wf_module.cached_render_result_columns = None
+        wf_module.cached_render_result_n_rows = None
+        wf_module.cached_render_result_file_version = None
 
         if workflow_id is not None:
             # We're setting non-None to None. That means there's probably
             # a file to delete.
-            parquet_path = _parquet_path(workflow_id, wf_module.id)
-            try:
-                os.remove(parquet_path)
-            except FileNotFoundError:
-                pass
+            for path in _list_table_paths(workflow_id, wf_module.id):
+                _delete_table_path(path)
+            shutil.rmtree(_value_counts_dir(workflow_id, wf_module.id),
+                          ignore_errors=True)
+
+            for path in _list_memo_paths(workflow_id, wf_module.id):
+                _delete_memo_path(path)
+
+    @staticmethod
+    def _memoize_current(wf_module: 'WfModule', new_key: str) -> None:
+        """
+        Copy `wf_module`'s current result aside, so we can restore it later.
+
+        No-op if the current result has no key, if its key is `new_key` or if
+        it isn't materialized. Deletes the oldest memoized results, keeping
+        `MaxMemoizedResultsPerWfModule`.
+        """
+        workflow_id = wf_module.cached_render_result_workflow_id
+        old_key = wf_module.cached_render_result_key
+        if workflow_id is None or not old_key or old_key == new_key:
+            return
+        if wf_module.cached_render_result_n_rows is not None:
+            return  # no table on disk
+
+        memo_path = _memo_path(workflow_id, wf_module.id, old_key)
+        os.makedirs(os.path.dirname(memo_path), exist_ok=True)
+        try:
+            _link_table_path(
+                _parquet_path(workflow_id, wf_module.id,
+                              wf_module.cached_render_result_file_version),
+                memo_path
+            )
+        except FileNotFoundError:
+            return  # DB and filesystem are out of sync. Nothing to memoize.
+
+        with open(memo_path + '.json', 'w') as f:
+            json.dump({
+                'status': wf_module.cached_render_result_status,
+                'error': wf_module.cached_render_result_error,
+                # cached_render_result_json is sometimes a memoryview
+                'json': bytes(wf_module.cached_render_result_json)
+                .decode('utf-8'),
+                'quick_fixes': wf_module.cached_render_result_quick_fixes,
+                'format': wf_module.cached_render_result_format,
+            }, f)
+
+        memo_paths = _list_memo_paths(workflow_id, wf_module.id)
+        for path in memo_paths[MaxMemoizedResultsPerWfModule:]:
+            _delete_memo_path(path)
+
+    @staticmethod
+    def relabel_wf_module(wf_module: 'WfModule',
+                          delta_id: int) -> 'CachedRenderResult':
+        """
+        Mark `wf_module`'s current result as the result for `delta_id`.
+
+        Call this instead of rendering when you know the render would produce
+        the same result: that is, when the current result has the same key.
+        """
+        wf_module.cached_render_result_delta_id = delta_id
+        return CachedRenderResult.from_wf_module(wf_module)
+
+    @staticmethod
+    def restore_wf_module(wf_module: 'WfModule', delta_id: int,
+                          key: str) -> Optional['CachedRenderResult']:
+        """
+        Restore a memoized result with `key` to `wf_module`, if there is one.
+
+        Return None if there is no such result.
+        """
+        workflow_id = wf_module.workflow_id
+        if workflow_id is None or not key:
+            return None
+
+        memo_path = _memo_path(workflow_id, wf_module.id, key)
+        try:
+            with open(memo_path + '.json') as f:
+                fields = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        previous_path = _current_table_path(wf_module)
+        CachedRenderResult._memoize_current(wf_module, key)
+
+        parquet_path = _parquet_path(workflow_id, wf_module.id, delta_id)
+        try:
+            _rename_table_path(memo_path, parquet_path)
+        except FileNotFoundError:
+            _delete_memo_path(memo_path)
+            return None
+        os.remove(memo_path + '.json')
+        if previous_path != parquet_path:
+            _mark_superseded(previous_path)
+        _delete_stale_table_paths(workflow_id, wf_module.id, parquet_path)
+
+        wf_module.cached_render_result_workflow_id = workflow_id
+        wf_module.cached_render_result_delta_id = delta_id
+        wf_module.cached_render_result_status = fields['status']
+        wf_module.cached_render_result_error = fields['error']
+        wf_module.cached_render_result_json = fields['json'].encode('utf-8')
+        wf_module.cached_render_result_quick_fixes = fields['quick_fixes']
+        wf_module.cached_render_result_key = key
+        wf_module.cached_render_result_columns = None
+        wf_module.cached_render_result_n_rows = None
+        # Memos written before we stored 'format' are Parquet
+        wf_module.cached_render_result_format = \
+            fields.get('format', 'parquet')
+        wf_module.cached_render_result_file_version = delta_id
+        return CachedRenderResult.from_wf_module(wf_module)
 
     @staticmethod
     def assign_wf_module(wf_module: 'WfModule',
                          delta_id: Optional[int],
-                         result: Optional[ProcessResult]
+                         result: Optional[ProcessResult],
+                         key: str='',
+                         materialize: bool=True,
+                         write_stats: bool=True
                          ) -> Optional['CachedRenderResult']:
         """
         Write `result` to `wf_module`'s fields and to disk.
 
         If either argument is None, clear the fields.
+
+        If `materialize` is False, don't write the table to disk: only its
+        columns and row count. The returned CachedRenderResult still holds the
+        table in memory.
+
+        If `write_stats` is False, don't summarize the table's columns: the
+        caller should call `write_column_stats()` on the return value, outside
+        the workflow lock.
+
+        If the previous result had a key, memoize it so `restore_wf_module()`
+        can restore it.
         """
         if delta_id is None or result is None:
             return CachedRenderResult._clear_wf_module(wf_module)
@@ -249,6 +819,9 @@ class CachedRenderResult:
             json_bytes = ''
             quick_fixes = []
 
+        previous_path = _current_table_path(wf_module)
+        CachedRenderResult._memoize_current(wf_module, key)
+
         wf_module.cached_render_result_workflow_id = wf_module.workflow_id
         wf_module.cached_render_result_delta_id = delta_id
         wf_module.cached_render_result_error = error
@@ -256,24 +829,67 @@ class CachedRenderResult:
         wf_module.cached_render_result_json = json_bytes
         wf_module.cached_render_result_quick_fixes = [qf.to_dict()
                                                       for qf in quick_fixes]
+        wf_module.cached_render_result_key = key
 
-        parquet_path = _parquet_path(wf_module.workflow_id, wf_module.id)
+        parquet_path = _parquet_path(wf_module.workflow_id, wf_module.id,
+                                     delta_id)
+        if previous_path != parquet_path:
+            _mark_superseded(previous_path)
 
         os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
 
+        # Value counts are per-delta_id; the old ones are useless now
+        shutil.rmtree(_value_counts_dir(wf_module.workflow_id, wf_module.id),
+                      ignore_errors=True)
+
         if result is None:
-            try:
-                os.remove(parquet_path)
-            except FileNotFoundError:
-                pass
+            _delete_stale_table_paths(wf_module.workflow_id, wf_module.id,
+                                      None)
             return None
+        elif not materialize:
+            stored_columns = result.columns
+            stored_n_rows = len(result.dataframe)
+            wf_module.cached_render_result_columns = [
+                {'name': c.name, 'type': c.type} for c in stored_columns
+            ]
+            wf_module.cached_render_result_n_rows = stored_n_rows
+            wf_module.cached_render_result_file_version = None
+            _delete_stale_table_paths(wf_module.workflow_id, wf_module.id,
+                                      None)
         else:
-            parquet.write(parquet_path, result.dataframe)
-
-            ret = CachedRenderResult(workflow_id=wf_module.workflow_id,
-                                     wf_module_id=wf_module.id,
-                                     delta_id=delta_id, status=status,
-                                     error=error, json=json_dict,
-                                     quick_fixes=quick_fixes)
-            ret._result = result  # no need to read from disk
-            return ret
+            stored_columns = None
+            stored_n_rows = None
+            wf_module.cached_render_result_columns = None
+            wf_module.cached_render_result_n_rows = None
+            wf_module.cached_render_result_file_version = delta_id
+            # Summarize while the table is in memory, so the web server
+            # needn't read it to answer questions about it. Write the stats
+            # first: whoever can see the table can see its stats.
+            if write_stats:
+                stats = _write_column_stats(_stats_path(parquet_path),
+                                            result.dataframe)
+            # Write atomically to a new file: readers of the previous
+            # version keep reading it, and we delete it later.
+            arrowfile.write(parquet_path, result.dataframe)
+            _delete_stale_table_paths(wf_module.workflow_id, wf_module.id,
+                                      parquet_path)
+            if write_stats:
+                _write_categorical_value_counts(
+                    wf_module.workflow_id,
+                    wf_module.id,
+                    delta_id,
+                    _categorical_value_counts(result.dataframe, stats)
+                )
+        wf_module.cached_render_result_format = 'arrow'
+        file_version = wf_module.cached_render_result_file_version
+
+        ret = CachedRenderResult(workflow_id=wf_module.workflow_id,
+                                 wf_module_id=wf_module.id,
+                                 delta_id=delta_id, status=status,
+                                 error=error, json=json_dict,
+                                 quick_fixes=quick_fixes, key=key,
+                                 stored_columns=stored_columns,
+                                 stored_n_rows=stored_n_rows,
+                                 file_version=file_version)
+        ret._result = result  # no need to read from disk
+        return ret
@@ -1,13 +1,33 @@
 import os
 import uuid
-from shutil import copyfile
+from django.contrib.postgres.fields import JSONField
 from django.db import models
 from django.core.files.storage import default_storage
 from django.dispatch import receiver
 from django.utils import timezone
 import pandas as pd
-from server.pandas_util import hash_table
-from server import parquet
+from server.pandas_util import hash_columns, hash_table
+from server import atomicfile, parquet
+
+
+# Maximum number of appended-rows versions between a version and the
+# standalone version it builds upon. Reading a version reads every file in
+# its chain; when a chain would grow longer, we store the whole table.
+MaxChainLength = 10
+
+
+def protect_dependents(collector, field, sub_objs, using):
+    """
+    `on_delete` for `StoredObject.base`: like PROTECT, unless the dependents
+    are being deleted, too (e.g., with their WfModule).
+
+    Deleting a base would lose its dependents' rows. Call
+    `StoredObject.delete()`, which rewrites them as standalone tables first.
+    """
+    deleting = collector.data.get(sub_objs.model, ())
+    undeleted = [so for so in sub_objs if so not in deleting]
+    if undeleted:
+        models.PROTECT(collector, field, undeleted, using)
 
 
 # StoredObject is our persistence layer.
@@ -23,8 +43,23 @@ class StoredObject(models.Model):
 
     # used only for stored tables
     hash = models.CharField(max_length=32)
+    # one hash per column (see server.pandas_util.hash_columns()); null if
+    # stored before we hashed columns
+    column_hashes = JSONField(null=True, blank=True)
     metadata = models.CharField(default=None, max_length=255, null=True)
     size = models.IntegerField(default=0)  # file size
+    n_rows = models.IntegerField(null=True, blank=True)  # null if unknown
+
+    # If set, `file` holds only the rows this version adds to `base`: before
+    # base's rows, or after them if `base_rows_first`. Accumulating fetches
+    # (e.g., Twitter) then write only their new rows. `delete()` makes
+    # dependent versions standalone before deleting their base; other ways
+    # of deleting a base raise ProtectedError.
+    base = models.ForeignKey('self', null=True, blank=True,
+                             related_name='dependents',
+                             on_delete=protect_dependents)
+    base_rows_first = models.BooleanField(default=True)
+    chain_length = models.IntegerField(default=0)  # number of bases to read
 
     # keeping track of whether this version of the data has ever been loaded
     # and delivered to the frontend
@@ -40,41 +75,112 @@ class StoredObject(models.Model):
 
     @staticmethod
     def create_table(wf_module, table, metadata=None):
-        hash = hash_table(table)
+        column_hashes = hash_columns(table)
         return StoredObject.__create_table_internal(wf_module, table,
-                                                    metadata, hash)
+                                                    metadata, column_hashes)
 
     # Create a new StoredObject if it's going to store different data than the
-    # previous one. Otherwise null Fast; checks hash without loading file
-    # contents
+    # previous one. Otherwise null Fast: compares column hashes without
+    # loading file contents
     @staticmethod
     def create_table_if_different(wf_module, old_so, table, metadata=None):
         if old_so is None:
             return StoredObject.create_table(wf_module, table,
                                              metadata=metadata)
 
-        hash = hash_table(table)
-        if hash != old_so.hash:
+        column_hashes = hash_columns(table)
+        if old_so.column_hashes is not None:
+            if column_hashes == old_so.column_hashes:
+                return None
+        else:
+            # Stored before we hashed columns: we must read it. (Next time,
+            # we'll compare against the version we store now.)
             old_table = old_so.get_table()
-            if not old_table.equals(table):
-                return StoredObject.__create_table_internal(wf_module, table,
-                                                            metadata, hash)
+            if old_table.equals(table):
+                return None
+
+        return StoredObject.__create_table_internal(wf_module, table,
+                                                    metadata, column_hashes,
+                                                    old_so)
+
+    @staticmethod
+    def _find_new_rows(old_so, table):
+        """
+        Return `(new_rows, base_rows_first)` if `table` is `old_so`'s table
+        plus rows; otherwise None.
+
+        Compares hashes: does not read `old_so`'s table.
+        """
+        n = old_so.n_rows
+        if (
+            not old_so.column_hashes
+            or n is None
+            or not 0 < n < len(table)
+            or old_so.chain_length >= MaxChainLength
+            # concatenating categoricals may not give the same categories
+            or any(dtype.name == 'category' for dtype in table.dtypes)
+        ):
+            return None
 
-        return None
+        if hash_columns(table.iloc[:n]) == old_so.column_hashes:
+            return (table.iloc[n:], True)
+        elif hash_columns(table.iloc[-n:]) == old_so.column_hashes:
+            return (table.iloc[:-n], False)
+        else:
+            return None
 
     @staticmethod
-    def __create_table_internal(wf_module, table, metadata, hash):
+    def __create_table_internal(wf_module, table, metadata, column_hashes,
+                                old_so=None):
+        new_rows = None
+        if old_so is not None:
+            new_rows = StoredObject._find_new_rows(old_so, table)
+
         path = StoredObject._storage_filename(wf_module.id)
-        parquet.write(path, table)
+        base_kwargs = {}
+        if new_rows is not None:
+            rows, base_rows_first = new_rows
+            rows = rows.reset_index(drop=True)
+            parquet.write(path, rows)
+            # Parquet may not round-trip a few rows the way it round-trips
+            # the whole table (e.g., an all-None text column). Reading them
+            # back is cheap.
+            if parquet.read(path).equals(rows):
+                base_kwargs = {
+                    'base': old_so,
+                    'base_rows_first': base_rows_first,
+                    'chain_length': old_so.chain_length + 1,
+                }
+        if not base_kwargs:
+            parquet.write(path, table)
+
         return StoredObject.objects.create(
             wf_module=wf_module,
             metadata=metadata,
             file=path,
             size=os.stat(path).st_size,
+            n_rows=len(table),
             stored_at=timezone.now(),
-            hash=hash
+            hash=hash_table(column_hashes),
+            column_hashes=column_hashes,
+            **base_kwargs
         )
 
+    def _read_table(self):
+        """
+        Read this version's table, following `base`. Raise on missing file.
+        """
+        table = parquet.read(self.file.name)
+        if self.base_id is None:
+            return table
+
+        base_table = self.base._read_table()
+        if self.base_rows_first:
+            parts = [base_table, table]
+        else:
+            parts = [table, base_table]
+        return pd.concat(parts, ignore_index=True, sort=False)
+
     def get_table(self):
         if not self.file:
             # Before 2018-11-09, we did not write empty data frames.
@@ -84,13 +190,36 @@ class StoredObject(models.Model):
             return pd.DataFrame()
 
         try:
-            return parquet.read(self.file.name)
+            return self._read_table()
         except (FileNotFoundError, parquet.FastparquetCouldNotHandleFile):
             # Spotted on production for a duplicated workflow dated
             # 2018-08-01. [adamhooper, 2018-09-20] I can think of no harm in
             # returning an empty dataframe here.
             return pd.DataFrame()  # empty table
 
+    def compact(self):
+        """
+        Rewrite this version as a standalone table, detached from `base`.
+        """
+        if self.base_id is None:
+            return
+
+        # parquet.write() replaces the file atomically: concurrent readers
+        # see either the appended rows (and `base`) or the whole table.
+        parquet.write(self.file.name, self._read_table())
+        self.size = os.stat(self.file.name).st_size
+        self.base = None
+        self.base_rows_first = True
+        self.chain_length = 0
+        self.save(update_fields=['size', 'base', 'base_rows_first',
+                                 'chain_length'])
+
+    def delete(self, *args, **kwargs):
+        # Versions built on this one would cascade-delete: keep them
+        for dependent in self.dependents.all():
+            dependent.compact()
+        return super().delete(*args, **kwargs)
+
     # make a deep copy for another WfModule
     def duplicate(self, to_wf_module):
         if to_wf_module == self.wf_module:
@@ -99,15 +228,25 @@ class StoredObject(models.Model):
                 'Cannot duplicate a StoredObject to same WfModule'
             )
 
-        srcname = default_storage.path(self.file.name)
         new_path = StoredObject._storage_filename(to_wf_module.id)
-        copyfile(srcname, new_path)
+        if self.base_id is None:
+            srcname = default_storage.path(self.file.name)
+            # Hard-link: anonymous visitors duplicate example workflows all
+            # day
+            atomicfile.copy(srcname, new_path)
+            size = self.size
+        else:
+            # Our base belongs to self.wf_module: write the whole table
+            parquet.write(new_path, self.get_table())
+            size = os.stat(new_path).st_size
         new_so = StoredObject.objects.create(wf_module=to_wf_module,
                                              stored_at=self.stored_at,
                                              hash=self.hash,
+                                             column_hashes=self.column_hashes,
                                              metadata=self.metadata,
                                              file=new_path,
-                                             size=self.size)
+                                             size=size,
+                                             n_rows=self.n_rows)
         return new_so
 
 
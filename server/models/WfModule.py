@@ -1,9 +1,8 @@
 import os
-import shutil
 from typing import List, Optional
 from django.contrib.postgres.fields import JSONField
 from django.db import models
-from server import websockets
+from server import atomicfile, websockets
 from server.modules.types import ProcessResult
 from .Params import Params
 from .CachedRenderResult import CachedRenderResult
@@ -74,6 +73,10 @@ class WfModule(models.Model):
     # true means user has not acknowledged email
     has_unseen_notification = models.BooleanField(default=False)
 
+    # true means, 'always write the rendered table to disk': someone reads
+    # this module's public CSV/JSON output. (See server.execute.)
+    materialize_output = models.BooleanField(default=False)
+
     # Our undo mechanism assigns None to self.workflow_id sometimes. We need to
     # also store the ID, so we can reference it while deleting.
     cached_render_result_workflow_id = models.IntegerField(null=True,
@@ -90,6 +93,30 @@ class WfModule(models.Model):
     # should be JSONField but we need backwards-compatibility
     cached_render_result_json = models.BinaryField(blank=True)
     cached_render_result_quick_fixes = JSONField(blank=True, default=list)
+    # Identifies the render inputs (module version, params, input, fetched
+    # data). See server.execute. '' means "unknown".
+    cached_render_result_key = models.CharField(max_length=40, blank=True,
+                                                default='')
+    # Set when we did not write the table to disk because it's cheap to
+    # render again. (See server.execute.) Then these describe the table. null
+    # means the table is on disk.
+    cached_render_result_columns = JSONField(null=True, blank=True)
+    cached_render_result_n_rows = models.IntegerField(null=True, blank=True)
+    # 'arrow' or 'parquet': the format of the file on disk. We used to write
+    # Parquet; now we write Arrow IPC, which readers can memory-map.
+    cached_render_result_format = models.CharField(
+        choices=[('arrow', 'arrow'), ('parquet', 'parquet')],
+        max_length=10,
+        default='parquet'
+    )
+    # delta_id the file on disk was written for: part of its filename. null
+    # means the file predates versioned filenames (or there is no file).
+    cached_render_result_file_version = models.IntegerField(null=True,
+                                                            blank=True)
+
+    # Memory used by the most recent render's input and output tables, in
+    # bytes. 0 means "not measured". See server.renderbudget.
+    render_peak_bytes = models.BigIntegerField(default=0)
 
     # TODO once we auto-compute stale module outputs, nix is_busy -- it will
     # be implied by the fact that the cached output revision is wrong.
@@ -164,7 +191,13 @@ class WfModule(models.Model):
 
     # Compares against latest version (which may not be current version)
     # Note: does not switch to new version automatically
-    def store_fetched_table_if_different(self, table, metadata=''):
+    #
+    # If `metadata_is_validators` (e.g., a fetch's ETag), the next fetch
+    # compares against `metadata`: store it on the latest version even if the
+    # table didn't change. Other metadata (e.g., an upload's filename)
+    # describes the version it was stored with, so we leave it alone.
+    def store_fetched_table_if_different(self, table, metadata='',
+                                         metadata_is_validators=False):
         reference_so = StoredObject.objects.filter(
             wf_module=self
         ).order_by('-stored_at').first()
@@ -173,6 +206,13 @@ class WfModule(models.Model):
                                                              reference_so,
                                                              table,
                                                              metadata=metadata)
+        if new_version is None and reference_so is not None \
+                and metadata_is_validators \
+                and metadata and metadata != reference_so.metadata:
+            # Same table, new metadata (e.g., the server sent a new ETag):
+            # the next fetch should compare against the new metadata.
+            reference_so.metadata = metadata
+            reference_so.save(update_fields=['metadata'])
         return new_version.stored_at if new_version else None
 
     def retrieve_fetched_table(self):
@@ -285,17 +325,32 @@ class WfModule(models.Model):
             new_wfm.cached_render_result_workflow_id = to_workflow.id
             new_wfm.cached_render_result_delta_id = \
                 to_workflow.last_delta_id
-            for attr in [ 'status', 'error', 'json', 'quick_fixes' ]:
+            if self.cached_render_result_file_version is not None:
+                new_wfm.cached_render_result_file_version = \
+                    to_workflow.last_delta_id
+            for attr in [ 'status', 'error', 'json', 'quick_fixes', 'key',
+                          'columns', 'n_rows', 'format' ]:
                 full_attr = f'cached_render_result_{attr}'
                 setattr(new_wfm, full_attr, getattr(self, full_attr))
 
             new_wfm.save()  # so there is a new_wfm.id for parquet_path
 
-            parquet_path = new_wfm.get_cached_render_result().parquet_path
+            new_result = new_wfm.get_cached_render_result()
+            os.makedirs(os.path.dirname(new_result.parquet_path),
+                        exist_ok=True)
+
+            # Copy stats first: whoever can see the table can see its stats
+            # (atomicfile.copy() hard-links: duplicating a popular workflow
+            # costs no disk space.)
+            try:
+                atomicfile.copy(cached_result.stats_path,
+                                new_result.stats_path)
+            except FileNotFoundError:
+                pass  # no stats; CachedRenderResult handles that, too
 
             try:
-                os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
-                shutil.copy(cached_result.parquet_path, parquet_path)
+                atomicfile.copy(cached_result.parquet_path,
+                                new_result.parquet_path)
             except FileNotFoundError:
                 # DB and filesystem are out of sync. CachedRenderResult handles
                 # such cases gracefully. So `new_result` will behave exactly
@@ -329,9 +384,38 @@ class WfModule(models.Model):
         return result
 
     def cache_render_result(self, delta_id: Optional[int],
-                            result: ProcessResult) -> CachedRenderResult:
-        """Save the given ProcessResult (or None) for later viewing."""
-        return CachedRenderResult.assign_wf_module(self, delta_id, result)
+                            result: ProcessResult,
+                            key: str='',
+                            materialize: bool=True,
+                            write_stats: bool=True) -> CachedRenderResult:
+        """
+        Save the given ProcessResult (or None) for later viewing.
+
+        If `materialize` is False, only save the table's columns and row
+        count: the table itself must be rendered again before it's read.
+
+        If `write_stats` is False, the caller must call `write_column_stats()`
+        on the return value.
+        """
+        return CachedRenderResult.assign_wf_module(self, delta_id, result,
+                                                   key=key,
+                                                   materialize=materialize,
+                                                   write_stats=write_stats)
+
+    def reuse_render_result(self, delta_id: int,
+                            key: str) -> Optional[CachedRenderResult]:
+        """
+        Point the cached result at `delta_id` if it was rendered from `key`.
+
+        Restore a memoized result if the current one doesn't match. Return
+        None if there is no result with `key`: then we must render.
+        """
+        if not key:
+            return None
+        elif self.cached_render_result_key == key:
+            return CachedRenderResult.relabel_wf_module(self, delta_id)
+        else:
+            return CachedRenderResult.restore_wf_module(self, delta_id, key)
 
     def delete(self, *args, **kwargs):
         self.cache_render_result(None, None)
@@ -1,7 +1,7 @@
 from channels.db import database_sync_to_async
 from django.db import models
 from server.models import Delta, WfModule
-from server import websockets
+from server import rabbitmq, websockets
 from .util import ChangesWfModuleOutputs
 
 
@@ -64,7 +64,11 @@ class ChangeDataVersionCommand(Delta, ChangesWfModuleOutputs):
             * The Django page-load view queues a render when needed.
         """
         if await _workflow_has_notifications(self.workflow):
-            await super().schedule_execute()
+            # This render is for the email notification. Users' renders
+            # come first.
+            await rabbitmq.queue_render(self.workflow.id,
+                                        self.workflow.last_delta_id,
+                                        background=True)
         else:
             await websockets.queue_render_if_listening(
                 self.workflow.id,
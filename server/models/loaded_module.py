@@ -10,7 +10,7 @@ import sys
 import time
 import traceback
 from types import ModuleType
-from typing import Awaitable, Callable, Optional
+from typing import Any, Awaitable, Callable, List, Optional
 from channels.db import database_sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -106,13 +106,17 @@ class LoadedModule:
     def __init__(self, module_id_name: str, version_sha1: str,
                  is_external: bool=True,
                  render_impl: Optional[Callable]=_default_render,
-                 fetch_impl: Optional[Callable]=_default_fetch):
+                 fetch_impl: Optional[Callable]=_default_fetch,
+                 input_columns_impl: Optional[Callable]=None,
+                 is_row_wise_impl: Optional[Callable]=None):
         self.module_id_name = module_id_name
         self.version_sha1 = version_sha1
         self.is_external = is_external
         self.name = f'{module_id_name}:{version_sha1}'
         self.render_impl = render_impl
         self.fetch_impl = fetch_impl
+        self.input_columns_impl = input_columns_impl
+        self.is_row_wise_impl = is_row_wise_impl
 
     def _wrap_exception(self, err) -> ProcessResult:
         """Coerce an Exception (must be on the stack) into a ProcessResult."""
@@ -179,6 +183,63 @@ class LoadedModule:
 
         return out
 
+    def input_columns(self, params: Params,
+                      column_names: List[str]) -> Optional[List[str]]:
+        """
+        Return the input columns `render()` needs, or None for "all".
+
+        Modules may declare an `input_columns()` function. (See
+        `ModuleImpl.input_columns()`. External modules use their `render()`
+        calling convention: `input_columns(table, params)`.) The return value
+        is ordered like `column_names` and never includes missing columns.
+
+        This never raises: when in doubt, it returns None.
+        """
+        if self.input_columns_impl is None:
+            return None
+
+        table = pd.DataFrame(columns=column_names)
+        if self.is_external:
+            arg1, arg2 = (table, params.to_painful_dict(table))
+        else:
+            arg1, arg2 = (params, table)
+
+        try:
+            columns = self.input_columns_impl(arg1, arg2)
+        except Exception:
+            logger.exception('%s.input_columns() raised', self.name)
+            return None
+
+        if columns is None:
+            return None
+
+        wanted = set(columns)
+        return [c for c in column_names if c in wanted]
+
+    def is_row_wise(self, params: Params) -> bool:
+        """
+        Return True if `render()` on the first N rows gives the first N rows.
+
+        Modules may declare an `is_row_wise()` function. (See
+        `ModuleImpl.is_row_wise()`. External modules are passed
+        `params.to_painful_dict()`.)
+
+        This never raises: when in doubt, it returns False.
+        """
+        if self.is_row_wise_impl is None:
+            return False
+
+        if self.is_external:
+            arg = params.to_painful_dict(pd.DataFrame())
+        else:
+            arg = params
+
+        try:
+            return bool(self.is_row_wise_impl(arg))
+        except Exception:
+            logger.exception('%s.is_row_wise() raised', self.name)
+            return False
+
     async def fetch(
         self,
         params: Params,
@@ -186,6 +247,7 @@ class LoadedModule:
         workflow_id: int,
         get_input_dataframe: Callable[[], Awaitable[pd.DataFrame]],
         get_stored_dataframe: Callable[[], Awaitable[pd.DataFrame]],
+        get_stored_metadata: Callable[[], Awaitable[Any]],
         get_workflow_owner: Callable[[], Awaitable[User]]
     ) -> ProcessResult:
         """
@@ -204,6 +266,8 @@ class LoadedModule:
             kwargs['get_input_dataframe'] = get_input_dataframe
         if varkw or 'get_stored_dataframe' in kwonlyargs:
             kwargs['get_stored_dataframe'] = get_stored_dataframe
+        if varkw or 'get_stored_metadata' in kwonlyargs:
+            kwargs['get_stored_metadata'] = get_stored_metadata
         if varkw or 'get_workflow_owner' in kwonlyargs:
             kwargs['get_workflow_owner'] = get_workflow_owner
 
@@ -296,7 +360,21 @@ class LoadedModule:
         """
         module_id_name = module_version.module.id_name  # TODO DoesNotExist
         version_sha1 = module_version.source_version_hash
+        return cls.for_id_name_and_version_sync(module_id_name, version_sha1)
+
+    @classmethod
+    def for_id_name_and_version_sync(cls, module_id_name: str,
+                                     version_sha1: str) -> 'LoadedModule':
+        """
+        Return module referenced by `module_id_name` and `version_sha1`.
 
+        This does not touch the database, so it is safe to call from a render
+        child process. (`LoadedModule` itself can't be pickled: external
+        modules' functions aren't importable by name. Send `module_id_name`
+        and `version_sha1` instead, and call this method on the other side.)
+
+        The same assumptions hold as in `for_module_version_sync()`.
+        """
         try:
             module = StaticModules[module_id_name]
             version_sha1 = 'internal'
@@ -307,9 +385,13 @@ class LoadedModule:
 
         render_impl = getattr(module, 'render', _default_render)
         fetch_impl = getattr(module, 'fetch', _default_fetch)
+        input_columns_impl = getattr(module, 'input_columns', None)
+        is_row_wise_impl = getattr(module, 'is_row_wise', None)
 
         return cls(module_id_name, version_sha1, is_external=is_external,
-                   render_impl=render_impl, fetch_impl=fetch_impl)
+                   render_impl=render_impl, fetch_impl=fetch_impl,
+                   input_columns_impl=input_columns_impl,
+                   is_row_wise_impl=is_row_wise_impl)
 
 
 def load_external_module(module_id_name: str, version_sha1: str) -> ModuleType:
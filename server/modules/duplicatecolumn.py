@@ -29,3 +29,6 @@ class DuplicateColumn(ModuleImpl):
         columns, _ = params.get_param_multicolumn('colnames', table)
 
         return _do_render(table, columns)
+
+    def is_row_wise(params):
+        return True
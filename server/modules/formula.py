@@ -180,3 +180,12 @@ class Formula(ModuleImpl):
         table[out_column] = newcol
 
         return table
+
+    @staticmethod
+    def is_row_wise(params):
+        syntax = params.get_param_menu_idx('syntax')
+        if syntax == 0:
+            # A one-row Excel formula may reference any row
+            return params.get_param_checkbox('all_rows')
+        else:
+            return True
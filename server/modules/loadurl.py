@@ -1,3 +1,6 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
 import aiohttp
 import asyncio
 from .moduleimpl import ModuleImpl
@@ -48,6 +51,69 @@ def guess_mime_type_or_none(content_type: str, url: str) -> str:
     return None
 
 
+# StoredObject.metadata holds this many characters; we store validators there
+MaxValidatorsLength = 255
+
+_HashChunkSize = 1024 * 1024
+
+
+def _hash_url(url: str) -> str:
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _hash_file(f) -> Tuple[int, str]:
+    """Return `(n_bytes, hash)` of `f`'s contents, and rewind it."""
+    h = hashlib.blake2b(digest_size=16)
+    n_bytes = 0
+    while True:
+        blob = f.read(_HashChunkSize)
+        if not blob:
+            break
+        h.update(blob)
+        n_bytes += len(blob)
+    f.seek(0)
+    return (n_bytes, h.hexdigest())
+
+
+def _stored_validators(stored_metadata: Any,
+                       url_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Return validators the last fetch of this URL stored, or None.
+
+    A user who edits the URL wants the new URL's data, whatever its ETag.
+    """
+    if (
+        isinstance(stored_metadata, dict)
+        and stored_metadata.get('url_hash') == url_hash
+    ):
+        return stored_metadata
+    else:
+        return None
+
+
+def _build_validators(url_hash: str, headers, n_bytes: int,
+                      content_hash: str) -> Dict[str, Any]:
+    """
+    Build the JSON we store with the table, to make the next fetch cheap.
+
+    Omit `Last-Modified` and `ETag` if they don't fit in `metadata`; we can
+    still compare `n_bytes` and `hash` after downloading.
+    """
+    validators = {
+        'url_hash': url_hash,
+        'n_bytes': n_bytes,
+        'hash': content_hash,
+    }
+    for key, header in (('last_modified', 'Last-Modified'),
+                        ('etag', 'ETag')):
+        value = headers.get(header)
+        if value:
+            candidate = {**validators, key: value}
+            if len(json.dumps(candidate)) <= MaxValidatorsLength:
+                validators = candidate
+    return validators
+
+
 class LoadURL(ModuleImpl):
     # Input table ignored.
     @staticmethod
@@ -64,18 +130,40 @@ class LoadURL(ModuleImpl):
         return ProcessResult(table, error)
 
     # Load a CSV from file when fetch pressed
+    #
+    # Return None -- "no new version" -- without parsing when the server says
+    # the file is unchanged (HTTP 304) or sends the same bytes as last time.
     @staticmethod
-    async def fetch(params, **kwargs):
+    async def fetch(params, *, get_stored_metadata=None, **kwargs):
         url = params.get_param_string('url').strip()
+        url_hash = _hash_url(url)
 
         mimetypes = ','.join(AllowedMimeTypes)
         headers = {'Accept': mimetypes}
         timeout = aiohttp.ClientTimeout(total=5*60, connect=30)
 
+        validators = None
+        if get_stored_metadata is not None:
+            validators = _stored_validators(await get_stored_metadata(),
+                                            url_hash)
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
         try:
             async with utils.spooled_data_from_url(
                 url, headers, timeout
             ) as (bytes_io, headers, charset):
+                n_bytes, content_hash = _hash_file(bytes_io)
+                if (
+                    validators
+                    and validators.get('n_bytes') == n_bytes
+                    and validators.get('hash') == content_hash
+                ):
+                    return None
+
                 content_type = headers.get('Content-Type', '') \
                         .split(';')[0] \
                         .strip()
@@ -85,12 +173,18 @@ class LoadURL(ModuleImpl):
                     result = parse_bytesio(bytes_io, mime_type, charset)
                     result.truncate_in_place_if_too_big()
                     result.sanitize_in_place()
+                    if not result.error:
+                        result.json = _build_validators(url_hash, headers,
+                                                        n_bytes,
+                                                        content_hash)
                     return result
                 else:
                     return ProcessResult(error=(
                         f'Error fetching {url}: '
                         f'unknown content type {content_type}'
                     ))
+        except utils.NotModified:
+            return None
         except asyncio.TimeoutError:
             return ProcessResult(error=f'Timeout fetching {url}')
         except aiohttp.InvalidURL:
@@ -1,4 +1,4 @@
-from typing import Awaitable, Callable
+from typing import Any, Awaitable, Callable, List, Optional
 from django.contrib.auth.models import User
 import pandas as pd
 from server.models import Params
@@ -11,6 +11,29 @@ class ModuleImpl:
     def render(params: Params, table: pd.DataFrame, **kwargs) -> ProcessResult:
         return ProcessResult(table)
 
+    @staticmethod
+    def input_columns(params: Params,
+                      table: pd.DataFrame) -> Optional[List[str]]:
+        """
+        Return the input columns `render()` needs, or None for "all".
+
+        `table` has the input's columns and no rows. If this returns a list,
+        `render()` must produce the same output when given only those columns
+        of its input: then we needn't read the others from disk.
+        """
+        return None
+
+    @staticmethod
+    def is_row_wise(params: Params) -> bool:
+        """
+        Return True if rendering the first N input rows produces the first N
+        output rows.
+
+        We use this to preview a module's output quickly: render only the
+        first few rows of a huge table.
+        """
+        return False
+
     @staticmethod
     async def fetch(
         params: Params,
@@ -18,6 +41,7 @@ class ModuleImpl:
         workflow_id: int,
         get_input_dataframe: Callable[[], Awaitable[pd.DataFrame]],
         get_stored_dataframe: Callable[[], Awaitable[pd.DataFrame]],
+        get_stored_metadata: Callable[[], Awaitable[Any]],
         get_workflow_owner: Callable[[], Awaitable[User]]
     ) -> ProcessResult:
         pass
@@ -64,3 +64,7 @@ class RenameFromTable(ModuleImpl):
             return table
         else:
             return parse_list(params, table)
+
+    @staticmethod
+    def is_row_wise(params):
+        return True
@@ -26,3 +26,7 @@ class ReorderFromTable(ModuleImpl):
             columns.insert(to_idx, moved)
 
         return table[columns]
+
+    @staticmethod
+    def is_row_wise(params):
+        return True
@@ -1,7 +1,7 @@
 from .moduleimpl import ModuleImpl
 from server.modules.types import ProcessResult
 from pandas import IntervalIndex
-from typing import Tuple
+from typing import List, Optional, Tuple
 import re
 
 commas = re.compile('\\s*,\\s*')
@@ -21,6 +21,23 @@ class SelectColumns(ModuleImpl):
             str_col_nums = params.get_param_string('column_numbers')
             return select_columns_by_number(table, str_col_nums, drop_or_keep)
 
+    def is_row_wise(params):
+        return True
+
+    def input_columns(params, table) -> Optional[List[str]]:
+        if params.get_param_checkbox('select_range'):
+            # Column numbers refer to positions in the full input table
+            return None
+
+        cols, _ = params.get_param_multicolumn('colnames', table)
+        if not cols:
+            return None  # render() passes through every column
+
+        if params.get_param_radio_idx('drop_or_keep') == 1:
+            return cols
+        else:
+            return [c for c in table.columns if c not in cols]
+
 
 def select_columns_by_name(table, cols, drop_or_keep):
     # if no column has been selected, keep the columns
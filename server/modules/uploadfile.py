@@ -1,9 +1,9 @@
-from io import BufferedReader
+import shutil
+import tempfile
 from server.minio import open_for_read, ResponseError
 from .moduleimpl import ModuleImpl
 from .types import ProcessResult
 from .utils import parse_bytesio, turn_header_into_first_row
-from server.utils import TempfileBackedReader
 from server import versions
 
 
@@ -30,9 +30,12 @@ async def parse_uploaded_file(uploaded_file) -> ProcessResult:
     if mime_type:
         try:
             with open_for_read(uploaded_file.bucket, uploaded_file.key) as s3:
-                with TempfileBackedReader(s3) as tempio:
-                    with BufferedReader(tempio) as bufio:
-                        result = parse_bytesio(bufio, mime_type, None)
+                # Spool to a real file: parse_bytesio() can parse big CSVs
+                # on several cores, reading chunks of it in parallel
+                with tempfile.TemporaryFile(prefix='upload') as spool:
+                    shutil.copyfileobj(s3, spool)
+                    spool.seek(0)
+                    result = parse_bytesio(spool, mime_type, None)
         except ResponseError as err:
             return ProcessResult(error=str(err))
     else:
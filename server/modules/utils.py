@@ -1,11 +1,15 @@
 import builtins
 from collections import OrderedDict
 from contextlib import contextmanager
+import csv
 import io
 import json
+import multiprocessing
+import os
 import re
 import tempfile
-from typing import Any, Dict, Callable, Optional
+from typing import Any, Dict, Callable, Iterable, Iterator, List, \
+        Optional
 import aiohttp
 from async_generator import asynccontextmanager  # TODO python 3.7 native
 import cchardet as chardet
@@ -14,11 +18,12 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.db.models.fields.files import FieldFile
 from django.db import transaction
+import numpy as np
 import pandas
 from pandas import DataFrame
 import pandas.errors
 import xlrd
-from server import rabbitmq
+from server import csvpool, rabbitmq
 from server.models import Workflow
 from server.sanitizedataframe import autocast_dtypes_in_place
 from .types import ProcessResult
@@ -26,6 +31,7 @@ from .types import ProcessResult
 
 _TextEncoding = Optional[str]
 _ChunkSize = 1024 * 1024
+_ScanBlockSize = 1024 * 1024
 
 
 class PythonFeatureDisabledError(Exception):
@@ -119,6 +125,174 @@ def _wrap_text(bytesio: io.BytesIO, text_encoding: _TextEncoding):
         yield textio
 
 
+def _concat_categorical_chunks(chunks: Iterable[DataFrame]) -> DataFrame:
+    """
+    Concatenate DataFrames of categoricals, unifying their categories.
+
+    (`pandas.concat()` would turn columns with differing categories into
+    `object` columns, which take far more memory.)
+
+    We consume `chunks` one at a time and keep only each column's codes and
+    distinct values, so the caller needn't hold every chunk in memory: peak
+    memory is the result plus about one chunk.
+    """
+    columns = None
+    code_lookups = []  # per column, value => code
+    code_arrays = []  # per column, one array of codes per chunk
+    for chunk in chunks:
+        if columns is None:
+            columns = chunk.columns  # read_csv() de-duplicates names
+            code_lookups = [{} for _ in columns]
+            code_arrays = [[] for _ in columns]
+        for i in range(len(columns)):
+            categorical = chunk.iloc[:, i].cat
+            lookup = code_lookups[i]
+            # chunk code => our code. Code -1 (null) maps to the last entry.
+            recode = np.array(
+                [lookup.setdefault(value, len(lookup))
+                 for value in categorical.categories] + [-1],
+                dtype=np.int32
+            )
+            code_arrays[i].append(recode[categorical.codes])
+        del chunk  # let the next chunk replace it
+
+    if columns is None:
+        return DataFrame()
+
+    data = OrderedDict()
+    for i, name in enumerate(columns):
+        # Sort, as read_csv() does: the result mustn't depend on chunk size
+        values = list(code_lookups[i].keys())
+        order = sorted(range(len(values)), key=values.__getitem__)
+        recode = np.empty(len(values) + 1, dtype=np.int32)
+        recode[order] = np.arange(len(values), dtype=np.int32)
+        recode[-1] = -1
+        codes = recode[np.concatenate(code_arrays[i])]
+        code_arrays[i] = None  # free as we go
+        data[name] = pandas.Categorical.from_codes(
+            codes,
+            [values[j] for j in order]
+        )
+    return DataFrame(data, columns=columns)
+
+
+def _fileno_or_none(bytesio: io.BytesIO) -> Optional[int]:
+    """Return the file descriptor behind `bytesio`, if there is one."""
+    try:
+        return bytesio.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return None  # e.g., io.BytesIO
+
+
+def _is_ascii_compatible(encoding: str) -> bool:
+    """True if `encoding` encodes newlines, quotes and separators as ASCII."""
+    try:
+        return '\n"\t,;'.encode(encoding) == b'\n"\t,;'
+    except (LookupError, UnicodeError):
+        return False
+
+
+def _find_chunk_starts(fd: int, size: int, chunk_size: int) -> List[int]:
+    """
+    Return offsets of records that start about every `chunk_size` bytes.
+
+    A newline ends a record unless it is within quotes, and we know whether
+    it is by counting quotes (`""` is two). A stray quote in an unquoted field
+    (`12" pipe`) can fool us into picking an offset within a quoted field.
+    Then the chunk before it ends mid-quote, and parsing it raises
+    ParserError.
+    """
+    starts = [0]
+    in_quotes = False
+    next_target = chunk_size
+    block_start = 0
+    while block_start < size:
+        block = os.pread(fd, _ScanBlockSize, block_start)
+        if not block:
+            break  # file shrank?
+
+        i = 0  # we know `in_quotes` at block[i]
+        while True:
+            if block_start + i < next_target:
+                j = next_target - block_start
+                if j >= len(block):
+                    break
+                in_quotes ^= block.count(b'"', i, j) % 2 == 1
+                i = j
+            j = block.find(b'\n', i)
+            if j == -1:
+                break
+            in_quotes ^= block.count(b'"', i, j) % 2 == 1
+            i = j + 1
+            if not in_quotes and block_start + i < size:
+                starts.append(block_start + i)
+                next_target = block_start + i + chunk_size
+
+        in_quotes ^= block.count(b'"', i) % 2 == 1
+        block_start += len(block)
+    return starts
+
+
+def _parse_table_in_parallel(bytesio: io.BytesIO, sep: str,
+                             text_encoding: _TextEncoding
+                             ) -> Optional[DataFrame]:
+    """
+    Parse a big CSV on CSV_PARSE_N_PROCESSES processes (see server.csvpool).
+
+    `sep` must be known: each chunk must split on the same separator. (We
+    don't sniff it per chunk.)
+
+    Return None if we can't: the file is small, or isn't a real file, or its
+    encoding or contents make it hard to split, or a chunk fails to parse.
+    The caller should parse it the slow way, which produces the same table
+    (or error).
+    """
+    fd = _fileno_or_none(bytesio)
+    if not sep or fd is None or settings.CSV_PARSE_N_PROCESSES < 2:
+        return None
+    size = os.fstat(fd).st_size
+    if size < settings.CSV_PARALLEL_PARSE_MIN_BYTES:
+        return None
+    if not _is_ascii_compatible(text_encoding or 'utf-8'):
+        return None  # e.g., UTF-16: we'd split characters
+
+    starts = _find_chunk_starts(fd, size,
+                                settings.CSV_PARALLEL_PARSE_CHUNK_N_BYTES)
+    stops = starts[1:] + [size]
+    chunk_args = (
+        (os.pread(fd, stop - start, start), sep, text_encoding, i == 0)
+        for i, (start, stop) in enumerate(zip(starts, stops))
+    )
+
+    chunks = csvpool.parse_chunks(chunk_args, settings.CSV_PARSE_N_PROCESSES)
+    try:
+        return _concat_categorical_chunks(_check_chunk_columns(chunks))
+    except (ValueError, csv.Error, multiprocessing.TimeoutError):
+        # ValueError includes ParserError, EmptyDataError and ragged rows
+        return None
+
+
+def _check_chunk_columns(chunks: Iterable[DataFrame]) -> Iterator[DataFrame]:
+    """
+    Yield `chunks`, named like the first one; raise ValueError on a mismatch.
+
+    Only the first chunk has a header row. A ragged row means we should parse
+    the slow way, for its error.
+    """
+    columns = None
+    for chunk in chunks:
+        if columns is None:
+            columns = chunk.columns
+        if (
+            len(chunk.columns) != len(columns)
+            # read_csv() treats an extra first-row value as an index
+            or not isinstance(chunk.index, pandas.RangeIndex)
+        ):
+            raise ValueError('CSV chunks have different numbers of columns')
+        chunk.columns = columns
+        yield chunk
+
+
 def _parse_table(bytesio: io.BytesIO, sep: Optional[str],
                  text_encoding: _TextEncoding) -> DataFrame:
     with _wrap_text(bytesio, text_encoding) as textio:
@@ -134,25 +308,26 @@ def _parse_table(bytesio: io.BytesIO, sep: Optional[str],
         # 3. Per-column, convert dtypes to array
         # 4. Smoosh arrays together into a pd.DataFrame.
         #
-        # When `low_memory=True`, all this happens in a bigger loop, so
-        # that the tokenized data structure is smaller.
+        # With `low_memory=False`, step 1 tokenizes the whole file: that
+        # cost an extra 1GB for `general.csv` (our 1.2GB file). With
+        # `low_memory=True`, pandas picks its own chunk size and re-codes
+        # categories per column-chunk: `rc11.txt` has 9,000 * 60 of them.
         #
-        # `low_memory=True` forces re-coding categories. That's `O(Ch * N
-        # * Ca lg Ca)`, where Ch is number of column-chunks (9,000 * 60
-        # in this case), N is number of records, Ch is number of chunks
-        # (8, in this case), and Ca is the number of categories.
+        # So we read fixed-size chunks of CSV_PARSE_CHUNK_N_ROWS rows
+        # ourselves. Peak memory is the categorical table plus one chunk's
+        # tokens, and we unify categories once per column per chunk.
         #
-        # This `rc11.txt` file has enormous `Ch`: 9,000 * 60 = 540,000.
-        # `general.csv` (our 1.2GB file) is much smaller, at ~4,000, even
-        # though it has 250x more rows. Pandas doesn't let us adjust
-        # chunk size, and its heuristic is terrible for`rc11.txt`.
+        # `low_memory=False` tells pandas not to sub-divide our chunks.
         #
-        # Let's try `low_memory=False`. That makes the CPU cost
-        # `O(N * Co * Ca lg Ca)`, where Co is the number of columns. Memory
-        # usage grows by the number of cells. In the case of `general.csv`,
-        # the cost is an extra 1GB.
-        data = pandas.read_csv(textio, dtype='category', sep=sep,
-                               low_memory=False)
+        # Big files that live on disk, we split by bytes and parse on
+        # several cores.
+        data = _parse_table_in_parallel(bytesio, sep, text_encoding)
+        if data is None:
+            reader = pandas.read_csv(
+                textio, dtype='category', sep=sep,
+                chunksize=settings.CSV_PARSE_CHUNK_N_ROWS, low_memory=False
+            )
+            data = _concat_categorical_chunks(reader)
 
         autocast_dtypes_in_place(data)
         return data
@@ -412,6 +587,10 @@ def fetch_external_workflow(calling_workflow_id: int,
     return ProcessResult(dataframe=result.dataframe)
 
 
+class NotModified(Exception):
+    """The server answered a conditional request with 304 Not Modified."""
+
+
 @asynccontextmanager
 async def spooled_data_from_url(url: str, headers: Dict[str, str]={},
                                 timeout: aiohttp.ClientTimeout=None):
@@ -422,6 +601,9 @@ async def spooled_data_from_url(url: str, headers: Dict[str, str]={},
     * aiohttp.InvalidURL on invalid URL
     * aiohttp.ClientResponseError when HTTP status is not 200
 
+    Raise NotModified when `headers` include `If-None-Match` or
+    `If-Modified-Since` and the server says the data has not changed.
+
     Raise asyncio.TimeoutError when `timeout` seconds have expired.
     """
     with tempfile.TemporaryFile(prefix='loadurl') as spool:
@@ -430,6 +612,8 @@ async def spooled_data_from_url(url: str, headers: Dict[str, str]={},
                                    timeout=timeout,
                                    raise_for_status=True) as response:
                 response.raise_for_status()
+                if response.status == 304:
+                    raise NotModified()
 
                 async for blob in \
                         response.content.iter_chunked(_ChunkSize):
@@ -1,9 +1,35 @@
-from pandas import DataFrame
+import hashlib
+from typing import List
+from pandas import DataFrame, Series
 from pandas.util import hash_pandas_object
 
 
-def hash_table(table: DataFrame) -> str:
-    """Build a hash useful in comparing data frames for equality."""
-    h = hash_pandas_object(table).sum()  # xor would be nice, but whatevs
-    h = h if h > 0 else -h               # stay positive (sum often overflows)
-    return str(h)
+def _hash_column(name: str, series: Series) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(name.encode('utf-8'))
+    h.update(b'\0')
+    h.update(str(series.dtype).encode('utf-8'))
+    h.update(b'\0')
+    # One uint64 per row, in order: reordering rows changes the hash
+    h.update(hash_pandas_object(series, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def hash_columns(table: DataFrame) -> List[str]:
+    """
+    Build one hash per column, useful in comparing data frames for equality.
+
+    Each hash covers the column's name, dtype and values. Tables with equal
+    lists of hashes are equal (barring a 128-bit collision), so we can
+    compare tables we haven't loaded.
+    """
+    return [_hash_column(str(name), table.iloc[:, i])
+            for i, name in enumerate(table.columns)]
+
+
+def hash_table(column_hashes: List[str]) -> str:
+    """Combine `hash_columns()` output into a single 32-character hash."""
+    h = hashlib.blake2b(digest_size=16)
+    for column_hash in column_hashes:
+        h.update(column_hash.encode('ascii'))
+    return h.hexdigest()
@@ -1,9 +1,15 @@
+from contextlib import contextmanager
+import json
 from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Type, Union
+from django.conf import settings
 import fastparquet
 from fastparquet import ParquetFile
 import pandas
+from pandas.api.types import CategoricalDtype
 import snappy
 import warnings
+from server import atomicfile
 
 
 # Suppress this arning:
@@ -20,6 +26,12 @@ warnings.filterwarnings(
 )
 
 
+# Number of rows per row group we write. A multiple of
+# server.views.WfModule.N_ROWS_PER_TILE (200), so a tile's rows are in one row
+# group and `read_rows()` decodes only that row group.
+RowGroupNRows = 20000
+
+
 class FastparquetCouldNotHandleFile(Exception):
     pass
 
@@ -69,20 +81,17 @@ def read_header(path: Path) -> ParquetFile:
         raise FastparquetIssue361
 
 
-def read(path: Path) -> pandas.DataFrame:
+@contextmanager
+def _translating_fastparquet_errors():
     """
-    Load a Pandas DataFrame from disk or raise FileNotFoundError or
-    FastparquetCouldNotHandleFile.
+    Raise FastparquetIssue375 when fastparquet fails to decode data.
 
-    May raise OSError (e.g., FileNotFoundError) or
-    FastparquetCouldNotHandleFile. The latter comes from
     https://github.com/dask/fastparquet/issues/375 -- we used to write with
     pyarrow, and fastparquet fails on some files with large strings. Those
     files are so old we won't attempt to support them.
     """
     try:
-        pf = read_header(path)
-        return pf.to_pandas()  # no need to close? Weird API
+        yield
     except snappy.UncompressError as err:
         if str(err) == 'Error while decompressing: invalid input':
             # Assume Fastparquet is reporting the wrong bug.
@@ -95,9 +104,214 @@ def read(path: Path) -> pandas.DataFrame:
         raise FastparquetIssue375
 
 
-def write(path: Path, table: pandas.DataFrame) -> None:
+def _categorical_columns(pf: ParquetFile) -> Dict[str, Dict[str, Any]]:
+    """
+    Find columns that were pandas categoricals when we wrote them.
+
+    Return `{name: {'ordered': bool}}`, from the file's pandas metadata.
+    """
+    try:
+        pandas_metadata = json.loads(pf.key_value_metadata['pandas'])
+    except (KeyError, ValueError):
+        return {}  # not written by pandas
+
+    return dict(
+        (column['name'],
+         {'ordered': bool((column.get('metadata') or {}).get('ordered'))})
+        for column in pandas_metadata.get('columns', [])
+        if column.get('pandas_type') == 'categorical'
+    )
+
+
+def _merge_categories(categories_list: Iterable[Iterable[Any]]) -> List[Any]:
+    """
+    List the first categories in order, then the others' new values.
+
+    Sorting would scramble ordered categoricals.
+    """
+    merged = []
+    seen = set()
+    for categories in categories_list:
+        for value in categories:
+            if value not in seen:
+                seen.add(value)
+                merged.append(value)
+    return merged
+
+
+def _written_categories(pf: ParquetFile, name: str) -> Optional[List[Any]]:
+    """
+    Read `name`'s categories, in order, from the first row group's dictionary.
+
+    Return None if there is no dictionary.
+    """
+    if not pf.row_groups:
+        return None
+    dictionary = pf.grab_cats([name]).get(name)
+    if dictionary is None:
+        return None
+    return list(dictionary)
+
+
+def _concat_row_groups(chunks: List[pandas.DataFrame]) -> pandas.DataFrame:
+    """
+    Concatenate row groups' tables, keeping categoricals categorical.
+
+    `pandas.concat()` turns categoricals with differing categories into
+    object columns. Row groups we write share one dictionary, but other
+    files' needn't: then we give every chunk the same categories first.
+    """
+    chunks = [chunk.copy(deep=False) for chunk in chunks]
+    for name in chunks[0].columns:
+        parts = [chunk[name] for chunk in chunks]
+        if not all(hasattr(part, 'cat') for part in parts):
+            continue
+        if all(part.cat.categories.equals(parts[0].cat.categories)
+               for part in parts):
+            continue
+        categories = _merge_categories(part.cat.categories for part in parts)
+        for chunk in chunks:
+            chunk[name] = chunk[name].cat.set_categories(categories)
+    return pandas.concat(chunks, ignore_index=True)
+
+
+def _restore_categoricals(pf: ParquetFile,
+                          table: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Make `table`'s categorical columns match what we wrote.
+
+    fastparquet restores categories, in order, from each row group's
+    dictionary. But it drops `ordered`; and reading a column with no
+    dictionary gives an object column. Either way, every module downstream
+    would use several times the memory.
+    """
+    for name, options in _categorical_columns(pf).items():
+        if name not in table.columns:
+            continue
+        series = table[name]
+        if not hasattr(series, 'cat'):
+            written = _written_categories(pf, name)
+            if written is None:
+                series = series.astype('category')
+            else:
+                # astype('category') would sort: keep the written order
+                categories = _merge_categories([written,
+                                                series.dropna().unique()])
+                series = series.astype(CategoricalDtype(categories))
+        if series.cat.ordered != options['ordered']:
+            series = series.cat.set_ordered(options['ordered'])
+        table[name] = series
+    return table
+
+
+def read(path: Path, columns: Optional[List[str]]=None) -> pandas.DataFrame:
+    """
+    Load a Pandas DataFrame from disk or raise FileNotFoundError or
+    FastparquetCouldNotHandleFile.
+
+    If `columns` is set, only read those columns. (Parquet stores each column
+    separately, so this saves I/O and memory in proportion.)
+
+    May raise OSError (e.g., FileNotFoundError) or
+    FastparquetCouldNotHandleFile.
+    """
+    with _translating_fastparquet_errors():
+        pf = read_header(path)
+        # no need to close? Weird API
+        return _restore_categoricals(pf, pf.to_pandas(columns=columns))
+
+
+def read_rows(path: Path, columns: Optional[List[str]], start: int,
+              stop: int) -> pandas.DataFrame:
+    """
+    Load rows `start` (inclusive) to `stop` (exclusive) from disk.
+
+    Only the row groups that overlap [start, stop) are decoded, so reading a
+    few rows near the end of a long table is cheap. If `columns` is set, only
+    read those columns. The returned DataFrame is indexed from 0.
+
+    May raise OSError (e.g., FileNotFoundError) or
+    FastparquetCouldNotHandleFile.
+    """
+    with _translating_fastparquet_errors():
+        pf = read_header(path)
+        if columns is None:
+            columns = pf.columns
+
+        chunks = []
+        offset = 0  # index of row_group's first row
+        for row_group in pf.row_groups:
+            end = offset + row_group.num_rows
+            if end > start and offset < stop:
+                chunk = pf.read_row_group_file(row_group, columns, None)
+                chunks.append(chunk[max(0, start - offset):stop - offset])
+            offset = end
+            if offset >= stop:
+                break
+
+        if not chunks:
+            # No rows. Read the (empty) table to get dtypes right.
+            return _restore_categoricals(pf,
+                                         pf.to_pandas(columns=columns)[0:0])
+
+        return _restore_categoricals(pf, _concat_row_groups(chunks))
+
+
+def _compression_option(
+    compression: str,
+    level: Optional[int]
+) -> Union[str, Dict[str, Any]]:
+    """
+    Build fastparquet's `compression` argument.
+
+    Raise ValueError if `compression` does not accept a level.
+    """
+    compression = compression.upper()
+    if level is None:
+        return compression
+    elif compression == 'ZSTD':
+        args = {'level': level}
+    elif compression == 'GZIP':
+        args = {'compresslevel': level}
+    else:
+        raise ValueError(f'Compression {compression} does not take a level')
+    return {'_default': {'type': compression, 'args': args}}
+
+
+def dictionary_encode(table: pandas.DataFrame,
+                      max_fraction: float) -> pandas.DataFrame:
+    """
+    Convert text columns with few distinct values to categories.
+
+    fastparquet writes categories with dictionary encoding: each value is
+    stored once, and rows store small integer codes.
     """
-    Write a Pandas DataFrame to a file on disk, overwriting if needed.
+    table = table.copy(deep=False)
+    max_n_distinct = len(table) * max_fraction
+    for column in table.columns:
+        series = table[column]
+        if series.dtype == object and series.nunique() <= max_n_distinct:
+            table[column] = series.astype('category')
+    return table
+
+
+class FromSettings:
+    """
+    Default for write() options: "use the deployment's settings.PARQUET_*".
+    """
+
+
+def write(
+    path: Path,
+    table: pandas.DataFrame,
+    compression: Union[str, Type[FromSettings]]=FromSettings,
+    compression_level: Union[int, None, Type[FromSettings]]=FromSettings,
+    dictionary_max_fraction: Union[float, None,
+                                   Type[FromSettings]]=FromSettings
+) -> None:
+    """
+    Write a Pandas DataFrame to a file on disk, atomically replacing it if
+    it exists.
 
     `path`'s directory must exist, and the user must have permission to write
     to `path`: otherwise, this function raises OSError.
@@ -105,6 +319,33 @@ def write(path: Path, table: pandas.DataFrame) -> None:
     We aim to keep the file format "stable": all future versions of
     parquet.read() should support all files written by today's version of this
     function.
+
+    Row groups start every `RowGroupNRows` rows. `compression`,
+    `compression_level` and `dictionary_max_fraction` default to
+    `settings.PARQUET_*`: pass them to write files that don't depend on the
+    deployment. (If you pass `compression`, `compression_level` defaults to
+    None: the codec's default.) If `dictionary_max_fraction` is not None,
+    text columns with few distinct values are dictionary-encoded: they read
+    back as categories.
     """
-    fastparquet.write(path, table, compression='SNAPPY',
-                      object_encoding='utf8')
+    if compression_level is FromSettings:
+        if compression is FromSettings:
+            compression_level = settings.PARQUET_COMPRESSION_LEVEL
+        else:
+            compression_level = None
+    if compression is FromSettings:
+        compression = settings.PARQUET_COMPRESSION
+    if dictionary_max_fraction is FromSettings:
+        dictionary_max_fraction = settings.PARQUET_DICTIONARY_MAX_FRACTION
+    if dictionary_max_fraction is not None:
+        table = dictionary_encode(table, dictionary_max_fraction)
+
+    # Pass explicit offsets: given an int, fastparquet splits rows evenly
+    # among row groups, and they wouldn't align with tiles.
+    row_group_offsets = list(range(0, len(table), RowGroupNRows))
+    with atomicfile.replacing(path) as tmp_path:
+        fastparquet.write(tmp_path, table,
+                          compression=_compression_option(compression,
+                                                          compression_level),
+                          object_encoding='utf8',
+                          row_group_offsets=row_group_offsets)
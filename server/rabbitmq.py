@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import threading
+import time
 import types
 import aio_pika
 from django.conf import settings
@@ -15,24 +16,53 @@ _loop_to_connection = {}  # loop => (connection, channel)
 logger = logging.getLogger(__name__)
 
 
+# Renders somebody is waiting for (e.g., after the user changes a param)
+RenderQueue = 'render'
+
+# Renders nobody is watching (e.g., a cron-fetch of a workflow with
+# notifications). Workers only start these when no RenderQueue render is
+# waiting.
+BackgroundRenderQueue = 'render-background'
+
+# Fanout exchange: every worker hears every coalesce-render message
+CoalesceRenderExchange = 'render-coalesce'
+
+
 class Connection:
-    def __init__(self, connection, channel):
+    def __init__(self, connection, channel, coalesce_render_exchange):
         self.connection = connection
         self.channel = channel
+        self.coalesce_render_exchange = coalesce_render_exchange
         self.lock = asyncio.Lock()
 
     async def close(self) -> None:
         await self.channel.close()
         await self.connection.close()
 
-    async def queue_render(self, workflow_id: int, delta_id: int) -> None:
+    async def queue_render(self, workflow_id: int, delta_id: int,
+                           background: bool=False) -> None:
         async with self.lock:
             await self.channel.default_exchange.publish(
                 aio_pika.Message(msgpack.packb({
                     'workflow_id': workflow_id,
                     'delta_id': delta_id,
+                    'queued_at': time.time(),
+                })),
+                routing_key=(
+                    BackgroundRenderQueue if background else RenderQueue
+                )
+            )
+
+    async def coalesce_render(self, workflow_id: int, delta_id: int,
+                              holder_pid: int) -> None:
+        async with self.lock:
+            await self.coalesce_render_exchange.publish(
+                aio_pika.Message(msgpack.packb({
+                    'workflow_id': workflow_id,
+                    'delta_id': delta_id,
+                    'holder_pid': holder_pid,
                 })),
-                routing_key='render'
+                routing_key=''
             )
 
     async def queue_fetch(self, wf_module_id: int) -> None:
@@ -75,9 +105,14 @@ async def get_connection(loop=None):
             connection = await aio_pika.connect_robust(url=host,
                                                        connection_attempts=100)
             channel = await connection.channel()
-            await channel.declare_queue('render', durable=True)
+            await channel.declare_queue(RenderQueue, durable=True)
+            await channel.declare_queue(BackgroundRenderQueue, durable=True)
             await channel.declare_queue('fetch', durable=True)
             await channel.declare_queue('DELETEME-upload', durable=True)
+            coalesce_render_exchange = await channel.declare_exchange(
+                CoalesceRenderExchange,
+                aio_pika.ExchangeType.FANOUT
+            )
 
             def _wrap_event_loop(self, *args, **kwargs):  # self = loop
                 global _loop_to_connection
@@ -98,18 +133,39 @@ async def get_connection(loop=None):
             original_impl = loop.close
             loop.close = types.MethodType(_wrap_event_loop, loop)
 
-            _loop_to_connection[loop] = Connection(connection, channel)
+            _loop_to_connection[loop] = Connection(
+                connection,
+                channel,
+                coalesce_render_exchange
+            )
             return _loop_to_connection[loop]
 
 
-async def queue_render(workflow_id: int, delta_id: int):
+async def queue_render(workflow_id: int, delta_id: int,
+                       background: bool=False):
     """
     Queue render in RabbitMQ.
 
     Spurious renders are fine: these messages are tiny.
+
+    Pass `background=True` if no user is waiting for this render. Workers
+    prefer other renders.
+    """
+    connection = await get_connection()
+    await connection.queue_render(workflow_id, delta_id,
+                                  background=background)
+
+
+async def coalesce_render(workflow_id: int, delta_id: int, holder_pid: int):
+    """
+    Ask the worker that holds `workflow_id`'s render lock to render
+    `delta_id` once it's done -- and to abort its render if it's older.
+
+    `holder_pid` names the holder (see `PgLocker.pid`). Every worker hears
+    this message; the others ignore it.
     """
     connection = await get_connection()
-    await connection.queue_render(workflow_id, delta_id)
+    await connection.coalesce_render(workflow_id, delta_id, holder_pid)
 
 
 async def queue_fetch(wf_module):
@@ -0,0 +1,156 @@
+"""
+Limit the memory renders use.
+
+Each render holds its input table and its output table in memory at once. One
+workflow with a huge table could make a worker run out of memory -- killing
+every render and fetch it's running. So we measure tables with
+`DataFrame.memory_usage(deep=True)` and enforce two budgets:
+
+* `max_render_bytes`: input+output of a single render. A render that needs
+  more fails with an error the user can read (and fix).
+* `max_worker_bytes`: input+output of all renders running in this process. A
+  render that would exceed it waits for other renders to finish.
+
+Usage:
+
+    renderbudget.start(max_render_bytes=..., max_worker_bytes=...)
+    # ...
+    reservation = renderbudget.reserve(renderbudget.table_nbytes(table))
+    async with reservation:  # may raise OverBudget
+        result = ...  # render
+        # may raise OverBudget
+        reservation.add(renderbudget.table_nbytes(result.dataframe))
+    reservation.peak_bytes  # for the record
+
+If `start()` was never called (e.g., in unit tests or in the web server),
+there are no limits; but `peak_bytes` is still measured.
+"""
+import asyncio
+import logging
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+_budget = None  # set in start()
+
+
+def table_nbytes(table: pd.DataFrame) -> int:
+    """Measure a table, including the contents of its Python strings."""
+    return int(table.memory_usage(index=True, deep=True).sum())
+
+
+class OverBudget(Exception):
+    """A render needs more memory than `max_render_bytes`."""
+
+    def __init__(self, n_bytes: int, max_bytes: int):
+        super().__init__(n_bytes, max_bytes)
+        self.n_bytes = n_bytes
+        self.max_bytes = max_bytes
+
+    def __str__(self):
+        MB = 1024 * 1024
+        return (
+            f'This step needs {self.n_bytes // MB}MB of memory, but the '
+            f'limit is {self.max_bytes // MB}MB. Please remove some rows or '
+            'columns in an earlier step.'
+        )
+
+
+class RenderBudget:
+    """
+    Bytes reserved by renders in this process.
+
+    Not thread-safe: call it from the event loop.
+    """
+
+    def __init__(self, max_render_bytes: int, max_worker_bytes: int):
+        self.max_render_bytes = max_render_bytes
+        self.max_worker_bytes = max_worker_bytes
+        self.n_bytes = 0
+        self._waiters = []  # Futures, resolved when bytes are released
+
+    def check(self, n_bytes: int) -> None:
+        """Raise OverBudget if a single render may not use `n_bytes`."""
+        if n_bytes > self.max_render_bytes:
+            raise OverBudget(n_bytes, self.max_render_bytes)
+
+    async def acquire(self, n_bytes: int) -> None:
+        """
+        Reserve `n_bytes`, waiting for other renders if need be.
+
+        A render always gets to run when no other render is running, so we
+        can't wait forever.
+        """
+        self.check(n_bytes)
+
+        while self.n_bytes and self.n_bytes + n_bytes > self.max_worker_bytes:
+            logger.info('Render needs %d bytes; %d of %d are in use. Waiting.',
+                        n_bytes, self.n_bytes, self.max_worker_bytes)
+            future = asyncio.get_event_loop().create_future()
+            self._waiters.append(future)
+            try:
+                await future
+            finally:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+
+        self.n_bytes += n_bytes
+
+    def grow(self, n_bytes: int) -> None:
+        """Count `n_bytes` more, without waiting: they're already in use."""
+        self.n_bytes += n_bytes
+
+    def release(self, n_bytes: int) -> None:
+        self.n_bytes -= n_bytes
+        waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)  # it will re-check
+
+
+class Reservation:
+    """Memory held by one render. Use as an async context manager."""
+
+    def __init__(self, budget: RenderBudget, n_bytes: int):
+        self.budget = budget
+        self.n_bytes = n_bytes
+        self.peak_bytes = n_bytes
+        self._acquired = 0
+
+    async def __aenter__(self):
+        if self.budget is not None:
+            await self.budget.acquire(self.n_bytes)
+            self._acquired = self.n_bytes
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.budget is not None:
+            self.budget.release(self._acquired)
+            self._acquired = 0
+
+    def add(self, n_bytes: int) -> None:
+        """
+        Count `n_bytes` more, for the render's output.
+
+        Raise OverBudget if the render now uses more than `max_render_bytes`.
+        """
+        self.n_bytes += n_bytes
+        self.peak_bytes = max(self.peak_bytes, self.n_bytes)
+        if self.budget is not None:
+            self.budget.grow(n_bytes)
+            self._acquired += n_bytes
+            self.budget.check(self.n_bytes)
+
+
+def start(max_render_bytes: int, max_worker_bytes: int) -> RenderBudget:
+    """Make `reserve()` enforce limits."""
+    global _budget
+    _budget = RenderBudget(max_render_bytes, max_worker_bytes)
+    return _budget
+
+
+def reserve(n_bytes: int) -> Reservation:
+    """Return an async context manager that holds `n_bytes` for a render."""
+    return Reservation(_budget, n_bytes)
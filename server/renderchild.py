@@ -0,0 +1,22 @@
+"""
+Entry point of render child processes (see `server.renderpool`).
+
+Render children come from the 'forkserver', not from forking the worker. They
+start with a bare interpreter, so we set up Django before importing anything
+that touches models. (The forkserver itself preloads only `server.csvpool`,
+which must not import Django.)
+"""
+import os
+import django
+from django.apps import apps
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cjworkbench.settings')
+if not apps.ready:  # the parent imports us, too, and it's already set up
+    django.setup()
+
+
+from server.renderpool import _child_main as main  # noqa: E402
+
+
+__all__ = ['main']
@@ -0,0 +1,360 @@
+"""
+Render modules in long-lived child processes.
+
+`LoadedModule.render()` is CPU-bound pandas code. In a thread, it holds our
+GIL and stalls everything else the worker does: fetches, RabbitMQ consumers
+and PgLocker heartbeats. In a child process, it only stalls the child.
+
+Tables don't travel through the Pipe: pickling a 1M-row DataFrame costs as
+much as rendering it. Instead, we write Arrow IPC files to a tmpfs directory
+(`/dev/shm` on Linux) -- that is, to shared memory -- and send their paths.
+The reader memory-maps them. The Pipe only carries tiny messages.
+
+Children come from the 'forkserver', like `server.csvpool`'s: the worker has
+threads, and a child forked from it would inherit whatever locks they hold,
+locked forever. Each child imports `server.renderchild`, which sets up Django.
+
+Each child records its peak RSS after each render. If it grows past
+`max_rss_bytes`, the child exits after replying and we start a fresh one. (A
+pandas-heavy Python process rarely gives memory back to the OS, so this is
+our only reliable way to reclaim it.)
+
+Usage:
+
+    renderpool.start(n_processes=2, max_rss_bytes=2 * 1024 ** 3)
+    # ...
+    result = await renderpool.render(loaded_module, params, table,
+                                     fetch_result)
+
+If `start()` was never called (e.g., in unit tests or in the web server),
+`render()` renders in a thread, just as before.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+from typing import Optional, Tuple
+import uuid
+import pandas as pd
+from server import arrowfile
+from server.models import LoadedModule, Params
+from server.modules.types import ProcessResult
+
+
+logger = logging.getLogger(__name__)
+
+
+_pool = None  # set in start()
+
+
+def _default_tmp_dir() -> Optional[str]:
+    """
+    Return a tmpfs directory, or None to let `tempfile` decide.
+
+    On Linux, /dev/shm is shared memory that looks like a filesystem. Files
+    there never touch disk.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    else:
+        return None
+
+
+def _peak_rss_bytes() -> int:
+    """Return this process's peak resident set size (Linux units)."""
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _write_table(path: str, table: Optional[pd.DataFrame]) -> Optional[str]:
+    """
+    Write `table` to `path` and return `path`; or return None if no `table`.
+
+    Arrow IPC files are uncompressed, and columns keep their dtypes: text
+    stays text and categories stay categories.
+    """
+    if table is None:
+        return None
+    arrowfile.write(path, table)
+    return path
+
+
+def _read_table(path: Optional[str]) -> pd.DataFrame:
+    """
+    Read (memory-mapped) and delete the file at `path`; or return an empty
+    DataFrame.
+    """
+    if path is None:
+        return pd.DataFrame()
+    try:
+        return arrowfile.read(path)
+    finally:
+        os.unlink(path)
+
+
+def _render_in_child(module_id_name: str, version_sha1: str, params: Params,
+                     input_path: Optional[str], fetch_path: Optional[str],
+                     fetch_error: Optional[str],
+                     output_path: str) -> Tuple[ProcessResult, Optional[str]]:
+    """
+    Render, from within a child process.
+
+    Return `(result, output_path)`. `result.dataframe` is empty: the parent
+    reads the real table from `output_path` (if it's not None).
+    """
+    loaded_module = LoadedModule.for_id_name_and_version_sync(module_id_name,
+                                                              version_sha1)
+    table = _read_table(input_path)
+    if fetch_error is None:
+        fetch_result = None
+    else:
+        fetch_result = ProcessResult(_read_table(fetch_path), fetch_error)
+
+    result = loaded_module.render(params, table, fetch_result)
+
+    output_path = _write_table(output_path, result.dataframe)
+    return (
+        ProcessResult(error=result.error, json=result.json,
+                      quick_fixes=result.quick_fixes),
+        output_path
+    )
+
+
+def _child_main(conn, max_rss_bytes: int) -> None:
+    """
+    Render requests from `conn`, forever -- or until we're too big.
+
+    Exit when the parent closes `conn`, sends `None`, or when our peak RSS
+    exceeds `max_rss_bytes` (0 means "no limit").
+    """
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return  # parent died
+
+        if request is None:
+            return  # parent asked us to exit
+
+        try:
+            response = _render_in_child(*request)
+        except Exception as err:
+            # LoadedModule.render() catches module errors. If we get here,
+            # there's a bug in Workbench (e.g., we can't load the module).
+            logger.exception('Error in render child process')
+            response = (ProcessResult(error=f'Render failed: {err}'), None)
+
+        recycle = bool(max_rss_bytes) and _peak_rss_bytes() > max_rss_bytes
+        conn.send((response, recycle))
+
+        if recycle:
+            return
+
+
+class _Child:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def close(self) -> None:
+        """Ask the child to exit, and wait for it."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass  # it's already dead
+        self.conn.close()
+        self.process.join()
+
+
+class RenderPool:
+    """
+    `n_processes` long-lived child processes that render modules.
+
+    Create it and `start()` it before handling any renders. Children are
+    started (and replaced) by the forkserver, so it's safe to replace them
+    from any thread.
+    """
+
+    def __init__(self, n_processes: int, max_rss_bytes: int=0,
+                 tmp_dir: Optional[str]=None):
+        self.n_processes = n_processes
+        self.max_rss_bytes = max_rss_bytes
+        self.tmp_dir = tmp_dir or _default_tmp_dir()
+        self._context = multiprocessing.get_context('forkserver')
+        self._idle = None  # asyncio.Queue of _Child
+
+    def _spawn(self) -> _Child:
+        # Import here: renderchild imports this module
+        from server import renderchild
+
+        parent_conn, child_conn = self._context.Pipe()
+        # daemon=False: modules (e.g., pythoncode) may spawn processes of
+        # their own, and daemonic processes can't have children.
+        process = self._context.Process(
+            target=renderchild.main,
+            name='render',
+            args=(child_conn, self.max_rss_bytes),
+            daemon=False
+        )
+        process.start()
+        child_conn.close()  # the child owns it now
+        logger.info('Started render process %d', process.pid)
+        return _Child(process, parent_conn)
+
+    def _respawn(self, child: _Child) -> _Child:
+        child.process.join()
+        child.conn.close()
+        logger.info('Render process %d exited with code %r', child.pid,
+                    child.process.exitcode)
+        return self._spawn()
+
+    async def _replace(self, child: _Child,
+                       reply: Optional[asyncio.Future]=None) -> None:
+        """
+        Respawn `child` (which is exiting) and put the new child in the pool.
+
+        `reply` is a pending `child.conn.recv()` in an executor thread. We
+        wait for it -- it ends when the child dies -- before closing `conn`
+        under it. Joining blocks, too, so it runs in an executor.
+        """
+        loop = asyncio.get_event_loop()
+        if reply is not None:
+            try:
+                await reply
+            except (EOFError, OSError):
+                pass  # the child died, as expected
+        new_child = await loop.run_in_executor(None, self._respawn, child)
+        self._idle.put_nowait(new_child)
+
+    def start(self) -> None:
+        """Start all child processes."""
+        self._idle = asyncio.Queue()
+        for _ in range(self.n_processes):
+            self._idle.put_nowait(self._spawn())
+
+    def close(self) -> None:
+        """Stop all idle child processes (for unit tests)."""
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+    def _tmp_path(self, suffix: str) -> str:
+        return os.path.join(self.tmp_dir or tempfile.gettempdir(),
+                            f'render-{uuid.uuid1()}-{suffix}.dat')
+
+    async def render(self, loaded_module: LoadedModule, params: Params,
+                     table: pd.DataFrame,
+                     fetch_result: Optional[ProcessResult]) -> ProcessResult:
+        """
+        Call `loaded_module.render()` in a child process.
+
+        Like `LoadedModule.render()`, this never raises: a crashed child
+        becomes an error ProcessResult.
+        """
+        loop = asyncio.get_event_loop()
+        child = await self._idle.get()
+        input_path = self._tmp_path('input')
+        fetch_path = self._tmp_path('fetch')
+        output_path = self._tmp_path('output')
+        try:
+            # Writing a big table is slow, too: don't hog the event loop.
+            input_path = await loop.run_in_executor(None, _write_table,
+                                                    input_path, table)
+            if fetch_result is None:
+                fetch_path = None
+                fetch_error = None
+            else:
+                fetch_path = await loop.run_in_executor(
+                    None,
+                    _write_table,
+                    fetch_path,
+                    fetch_result.dataframe
+                )
+                fetch_error = fetch_result.error
+
+            child.conn.send((loaded_module.module_id_name,
+                             loaded_module.version_sha1, params,
+                             input_path, fetch_path, fetch_error,
+                             output_path))
+            reply = loop.run_in_executor(None, child.conn.recv)
+            try:
+                # shield(): if we're cancelled, `reply` keeps running, and
+                # _replace() waits for it.
+                (result, output_path), recycle = await asyncio.shield(reply)
+            except asyncio.CancelledError:
+                # The child is still rendering, and it will write a reply
+                # nobody will read. Kill it: it can't go back in the pool.
+                # Replace it in the background: we're cancelled.
+                child.process.terminate()
+                asyncio.ensure_future(self._replace(child, reply))
+                child = None
+                raise
+            except EOFError:
+                # The child died mid-render. It was probably killed by the
+                # kernel's OOM killer.
+                logger.error('Render process %d died rendering %s',
+                             child.pid, loaded_module.name)
+                replacing = self._replace(child)
+                child = None
+                output_path = None
+                await asyncio.shield(replacing)
+                return ProcessResult(
+                    error='Render process crashed. Your data may be too big.'
+                )
+
+            if recycle:
+                logger.info('Recycling render process %d: RSS exceeded %d',
+                            child.pid, self.max_rss_bytes)
+                replacing = self._replace(child)
+                child = None
+                await asyncio.shield(replacing)
+
+            result.dataframe = await loop.run_in_executor(None, _read_table,
+                                                          output_path)
+            output_path = None  # _read_table() deleted it
+            return result
+        finally:
+            if child is not None:  # else _replace() refills the pool
+                self._idle.put_nowait(child)
+            # If the child didn't get to read (and delete) its input, delete
+            # it here. In the common case, these files are already gone.
+            for path in (input_path, fetch_path, output_path):
+                if path is not None:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+
+def start(n_processes: int, max_rss_bytes: int=0,
+          tmp_dir: Optional[str]=None) -> RenderPool:
+    """Start `n_processes` renderers; make `render()` use them."""
+    global _pool
+    _pool = RenderPool(n_processes, max_rss_bytes=max_rss_bytes,
+                       tmp_dir=tmp_dir)
+    _pool.start()
+    return _pool
+
+
+async def render(loaded_module: LoadedModule, params: Params,
+                 table: pd.DataFrame,
+                 fetch_result: Optional[ProcessResult]) -> ProcessResult:
+    """
+    Call `loaded_module.render()` without blocking the event loop.
+
+    If `start()` was called, render in a child process. Otherwise, render in
+    the event loop's default executor (a thread).
+    """
+    if _pool is None:
+        loop = asyncio.get_event_loop()
+        # Render may take a while. run_in_executor to push that slowdown to a
+        # thread and keep our event loop responsive.
+        return await loop.run_in_executor(None, loaded_module.render, params,
+                                          table, fetch_result)
+    else:
+        return await _pool.render(loaded_module, params, table, fetch_result)
@@ -0,0 +1,148 @@
+"""
+Keep recently-rendered module outputs in memory.
+
+Each render's input is the previous module's output. `execute` reads that
+from Parquet -- even if this very process wrote it a second ago. Users tend to
+edit one workflow many times in a row, so a small in-memory cache lets most
+renders skip decoding their input.
+
+Results are keyed by `(wf_module_id, delta_id)`. A WfModule's output for a
+given delta never changes, so entries never go stale: they only fall out of
+the cache when it exceeds its byte budget (least-recently-used first).
+
+Usage:
+
+    resultcache.start(max_bytes=500 * 1024 * 1024)
+    # ...
+    resultcache.put(wf_module_id, delta_id, result)
+    result = resultcache.get(wf_module_id, delta_id)  # or None
+
+If `start()` was never called (e.g., in unit tests or in the web server),
+`get()` always returns None and `put()` does nothing.
+"""
+from collections import OrderedDict
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+from server.modules.types import ProcessResult
+
+
+logger = logging.getLogger(__name__)
+
+
+_cache = None  # set in start()
+
+
+def _copy_result(result: ProcessResult) -> ProcessResult:
+    """
+    Copy `result.dataframe`, so callers can't modify our cached one.
+
+    Modules may modify their input tables in-place.
+    """
+    return ProcessResult(result.dataframe.copy(), result.error,
+                         json=result.json, quick_fixes=result.quick_fixes)
+
+
+def _result_nbytes(result: ProcessResult) -> int:
+    return int(result.dataframe.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCache:
+    """
+    LRU cache of `ProcessResult`s, totalling at most `max_bytes`.
+
+    Thread-safe: `execute` calls it from the event loop and from database
+    threads.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (wf_module_id, delta_id) => (ProcessResult, n_bytes)
+        self._entries = OrderedDict()
+
+    def get(self, wf_module_id: int,
+            delta_id: int) -> Optional[ProcessResult]:
+        """Return a copy of the cached result, or None."""
+        with self._lock:
+            try:
+                result, _ = self._entries[(wf_module_id, delta_id)]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end((wf_module_id, delta_id))
+            self.hits += 1
+
+        return _copy_result(result)
+
+    def put(self, wf_module_id: int, delta_id: int,
+            result: ProcessResult) -> None:
+        """
+        Cache a copy of `result`, evicting old results to fit.
+
+        Results bigger than `max_bytes` aren't cached at all.
+        """
+        n_bytes = _result_nbytes(result)
+        if n_bytes > self.max_bytes:
+            return
+
+        result = _copy_result(result)
+        key = (wf_module_id, delta_id)
+
+        with self._lock:
+            self._remove(key)
+
+            while self._entries and self.n_bytes + n_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+            self._entries[key] = (result, n_bytes)
+            self.n_bytes += n_bytes
+
+    def _remove(self, key: Tuple[int, int]) -> None:
+        """Remove an entry, if it exists. Call with self._lock held."""
+        try:
+            _, n_bytes = self._entries.pop(key)
+        except KeyError:
+            return
+        self.n_bytes -= n_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters, so we can size the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'n_results': len(self._entries),
+                'n_bytes': self.n_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def start(max_bytes: int) -> ResultCache:
+    """Make `get()` and `put()` use a cache of `max_bytes`."""
+    global _cache
+    _cache = ResultCache(max_bytes)
+    return _cache
+
+
+def get(wf_module_id: int, delta_id: int) -> Optional[ProcessResult]:
+    """Return a copy of a recently-`put()` result, or None."""
+    if _cache is None:
+        return None
+    return _cache.get(wf_module_id, delta_id)
+
+
+def put(wf_module_id: int, delta_id: int, result: ProcessResult) -> None:
+    """Remember a copy of `result`, if `start()` was called."""
+    if _cache is not None:
+        _cache.put(wf_module_id, delta_id, result)
+
+
+def log_stats() -> None:
+    """Log cache hits and misses, if `start()` was called."""
+    if _cache is not None:
+        logger.info('Result cache: %r', _cache.stats())
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import pandas
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from server.cron import storagegc
+from server.models import StoredObject, Workflow
+from server.modules.types import ProcessResult
+from server.tests.utils import DbTestCase
+
+
+class CollectGarbageTests(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        # Start with no orphans: other tests leave files behind
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root.name
+        )
+        self.settings_override.enable()
+
+        self.workflow = Workflow.objects.create()
+        self.wf_module = self.workflow.wf_modules.create(order=0)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_root.cleanup()
+        super().tearDown()
+
+    def _cache_result(self, delta_id=2):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        self.wf_module.cache_render_result(delta_id, result)
+        self.wf_module.save()
+        return self.wf_module.get_cached_render_result()
+
+    def _write(self, relpath: str, data: bytes=b'12345') -> str:
+        path = default_storage.path(relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _collect(self, **kwargs):
+        return storagegc.collect_garbage_sync(min_age_seconds=0, **kwargs)
+
+    def test_keep_current_result(self):
+        cached = self._cache_result()
+        self._collect()
+        self.assertTrue(os.path.isfile(cached.parquet_path))
+        self.assertTrue(os.path.isfile(cached.stats_path))
+
+    def test_delete_stale_table_version(self):
+        cached = self._cache_result(delta_id=2)
+        path = self._write(
+            f'cached-render-results/wf-{self.workflow.id}/'
+            f'wfm-{self.wf_module.id}-v1.dat'
+        )
+
+        report = self._collect()
+
+        self.assertEqual(report, storagegc.Report(1, 5))
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.isfile(cached.parquet_path))
+
+    def test_delete_stale_value_counts(self):
+        self._cache_result(delta_id=2)
+        dirname = (f'cached-render-results/wf-{self.workflow.id}/'
+                   f'value-counts/wfm-{self.wf_module.id}')
+        stale = self._write(f'{dirname}/v1-abc123.json')
+        current = self._write(f'{dirname}/v2-abc123.json')
+
+        self._collect()
+
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.isfile(current))
+
+    def test_delete_files_of_missing_workflow(self):
+        dirname = default_storage.path('cached-render-results/wf-999999')
+        self._write('cached-render-results/wf-999999/wfm-1-v1.dat')
+        self._write('cached-render-results/wf-999999/memo/wfm-1-key.dat')
+        self._write('cached-render-results/wf-999999/value-counts/wfm-1/'
+                    'v1-abc123.json')
+
+        report = self._collect()
+
+        self.assertEqual(report, storagegc.Report(3, 15))
+        self.assertFalse(os.path.exists(dirname))
+
+    def test_keep_soft_deleted_wf_module(self):
+        # DeleteModuleCommand detaches the WfModule; undo reattaches it
+        cached = self._cache_result()
+        self.wf_module.workflow = None
+        self.wf_module.save()
+
+        self._collect()
+
+        self.assertTrue(os.path.isfile(cached.parquet_path))
+
+    def test_ignore_unknown_files(self):
+        path = self._write(f'cached-render-results/wf-{self.workflow.id}/'
+                           'README')
+        self._collect()
+        self.assertTrue(os.path.isfile(path))
+
+    def test_stored_objects(self):
+        so = StoredObject.create_table(self.wf_module,
+                                       pandas.DataFrame({'a': [1]}))
+        orphan = self._write(f'{self.wf_module.id}-'
+                             '9b7b6ed0-e7c4-11e8-9f32-f2801f1b9fd1-fetch.dat')
+
+        report = self._collect()
+
+        self.assertEqual(report, storagegc.Report(1, 5))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.isfile(so.file.path))
+
+    def test_skip_new_files(self):
+        path = self._write('cached-render-results/wf-999999/wfm-1-v1.dat')
+        report = storagegc.collect_garbage_sync()
+        self.assertEqual(report, storagegc.Report(0, 0))
+        self.assertTrue(os.path.isfile(path))
+
+    def test_dry_run(self):
+        path = self._write('cached-render-results/wf-999999/wfm-1-v1.dat')
+        report = self._collect(dry_run=True)
+        self.assertEqual(report, storagegc.Report(1, 5))
+        self.assertTrue(os.path.isfile(path))
+
+    def test_quarantine(self):
+        self._write('cached-render-results/wf-999999/wfm-1-v1.dat')
+        with tempfile.TemporaryDirectory() as quarantine_dir:
+            self._collect(quarantine_dir=quarantine_dir)
+            self.assertTrue(os.path.isfile(os.path.join(
+                quarantine_dir,
+                'cached-render-results/wf-999999/wfm-1-v1.dat'
+            )))
+        self.assertFalse(os.path.exists(
+            default_storage.path('cached-render-results/wf-999999')
+        ))
@@ -309,7 +309,8 @@ class ChangeDataVersionCommandTests(CommandTestCase):
 
         delta = async_to_sync(ChangeDataVersionCommand.create)(self.wfm, date2)
 
-        queue_render.assert_called_with(self.wfm.workflow_id, delta.id)
+        queue_render.assert_called_with(self.wfm.workflow_id, delta.id,
+                                        background=True)
 
     @patch('server.websockets.queue_render_if_listening')
     @patch('server.rabbitmq.queue_render')
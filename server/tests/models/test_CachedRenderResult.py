@@ -1,12 +1,21 @@
 import os.path
 import datetime
+import importlib
+import time
+from unittest.mock import patch
 import pandas
+from pandas.testing import assert_frame_equal
+from server import parquet
 from server.tests.utils import DbTestCase
 from server.models import Workflow, WfModule
 from server.models.commands import InitWorkflowCommand
 from server.modules.types import Column, ProcessResult, QuickFix
 
 
+# server.models.CachedRenderResult is the class; we want the module
+crr_module = importlib.import_module('server.models.CachedRenderResult')
+
+
 class CachedRenderResultTests(DbTestCase):
     def setUp(self):
         super().setUp()
@@ -55,6 +64,36 @@ class CachedRenderResultTests(DbTestCase):
         self.assertIsNone(db_wf_module.get_cached_render_result())
         self.assertFalse(os.path.isfile(parquet_path))
 
+    def test_assign_without_materializing(self):
+        result = ProcessResult(pandas.DataFrame({
+            'A': [1, 2],
+            'B': ['x', 'y'],
+        }))
+        cached = self.wf_module.cache_render_result(2, result,
+                                                    materialize=False)
+        self.wf_module.save()
+        self.assertEqual(cached.result, result)  # still in memory
+        self.assertFalse(os.path.isfile(cached.parquet_path))
+
+        db_wf_module = WfModule.objects.get(id=self.wf_module.id)
+        from_db = db_wf_module.get_cached_render_result()
+        self.assertFalse(from_db.is_materialized)
+        self.assertEqual(from_db.columns, [Column('A', 'number'),
+                                           Column('B', 'text')])
+        self.assertEqual(len(from_db), 2)
+        self.assertTrue(from_db.result.dataframe.empty)
+
+    def test_materialize_over_unmaterialized(self):
+        result = ProcessResult(pandas.DataFrame({'A': [1]}))
+        self.wf_module.cache_render_result(2, result, materialize=False)
+        self.wf_module.cache_render_result(3, result)
+        self.wf_module.save()
+
+        db_wf_module = WfModule.objects.get(id=self.wf_module.id)
+        from_db = db_wf_module.get_cached_render_result()
+        self.assertTrue(from_db.is_materialized)
+        self.assertEqual(from_db.result, result)
+
     def test_metadata_comes_from_memory_when_available(self):
         result = ProcessResult(pandas.DataFrame({
             'A': [1],  # int64
@@ -95,7 +134,7 @@ class CachedRenderResultTests(DbTestCase):
         self.wf_module.save()
 
         cached_result = self.wf_module.get_cached_render_result()
-        cached_result.parquet_file  # read header
+        cached_result.table_file  # read header
         os.unlink(cached_result.parquet_path)
         self.assertEqual(len(cached_result), 1)
         self.assertEqual(cached_result.column_names, ['A', 'B', 'C', 'D'])
@@ -108,9 +147,183 @@ class CachedRenderResultTests(DbTestCase):
             Column('D', 'text'),
         ])
 
-        with self.assertRaises(FileNotFoundError):
-            # Prove that we didn't read from the file
-            self.assertIsNone(cached_result.result)
+        # The header holds the file open, so reading still works after a
+        # concurrent delete.
+        self.assertEqual(cached_result.result, result)
+
+    def test_read_rows_from_disk(self):
+        self.wf_module.cache_render_result(2, ProcessResult(pandas.DataFrame({
+            'A': [1, 2, 3, 4],
+            'B': ['a', 'b', 'c', 'd'],
+        })))
+        self.wf_module.save()
+
+        cached_result = self.wf_module.get_cached_render_result()
+        self.assertEqual(cached_result.file_format, 'arrow')
+        assert_frame_equal(cached_result.read_rows(1, 3, ['B']),
+                           pandas.DataFrame({'B': ['b', 'c']}))
+
+    def test_read_legacy_parquet_file(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': [1]})
+        ))
+        # Simulate a result written before we switched to Arrow
+        parquet_path = self.wf_module.get_cached_render_result().parquet_path
+        parquet.write(parquet_path, pandas.DataFrame({'A': [1, 2, 3]}))
+        self.wf_module.cached_render_result_format = 'parquet'
+        self.wf_module.save()
+
+        cached_result = self.wf_module.get_cached_render_result()
+        self.assertEqual(len(cached_result), 3)
+        assert_frame_equal(cached_result.read_rows(1, 2),
+                           pandas.DataFrame({'A': [2]}))
+
+    def test_column_stats(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': ['x', 'y', 'x']})
+        ))
+        self.wf_module.save()
+
+        cached_result = self.wf_module.get_cached_render_result()
+        self.assertEqual(cached_result.column_stats['A']['top_values'],
+                         [['x', 2], ['y', 1]])
+
+    def test_write_column_stats_later(self):
+        cached_result = self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': ['x', 'y', 'x']})
+        ), write_stats=False)
+        self.wf_module.save()
+        self.assertFalse(os.path.isfile(cached_result.stats_path))
+
+        cached_result.write_column_stats()
+        cached_result = self.wf_module.get_cached_render_result()
+        self.assertEqual(cached_result.column_stats['A']['top_values'],
+                         [['x', 2], ['y', 1]])
+
+    def test_write_column_stats_later_after_new_result(self):
+        cached_result = self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': ['x', 'y', 'x']})
+        ), write_stats=False)
+        self.wf_module.save()
+
+        # A concurrent render replaces the result before we write its stats
+        self.wf_module.cache_render_result(3, ProcessResult(
+            pandas.DataFrame({'A': ['z']})
+        ))
+        self.wf_module.save()
+
+        cached_result.write_column_stats()
+        # Nothing would ever delete these stats
+        self.assertFalse(os.path.isfile(cached_result.stats_path))
+
+    def test_column_stats_follow_memoized_result(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': ['x']})
+        ), key='a')
+        self.wf_module.cache_render_result(3, ProcessResult(
+            pandas.DataFrame({'A': ['y']})
+        ), key='b')
+        self.wf_module.reuse_render_result(4, 'a')
+        self.wf_module.save()
+
+        cached_result = self.wf_module.get_cached_render_result()
+        self.assertEqual(cached_result.column_stats['A']['top_values'],
+                         [['x', 1]])
+
+    def test_delete_wfmodule_deletes_column_stats(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        self.wf_module.cache_render_result(2, result)
+        self.wf_module.save()
+
+        stats_path = self.wf_module.get_cached_render_result().stats_path
+        self.assertTrue(os.path.isfile(stats_path))
+        self.wf_module.delete()
+        self.assertFalse(os.path.isfile(stats_path))
+
+    @patch('server.columnstats.MaxNTopValues', 1)
+    def test_read_value_counts_builds_index(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': ['x', 'y', 'x']})
+        ))
+        self.wf_module.save()
+
+        cached_result = self.wf_module.get_cached_render_result()
+        self.assertEqual(cached_result.read_value_counts('A'),
+                         {'x': 2, 'y': 1})
+
+        # Prove the second call reads the index, not the table
+        os.unlink(cached_result.parquet_path)
+        cached_result = self.wf_module.get_cached_render_result()
+        self.assertEqual(cached_result.read_value_counts('A'),
+                         {'x': 2, 'y': 1})
+
+    @patch('server.columnstats.MaxNTopValues', 1)
+    def test_categorical_value_counts_indexed_on_write(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({
+                'A': pandas.Series(['x', 'y', 'x'], dtype='category'),
+            })
+        ))
+        self.wf_module.save()
+
+        cached_result = self.wf_module.get_cached_render_result()
+        os.unlink(cached_result.parquet_path)
+        self.assertEqual(cached_result.read_value_counts('A'),
+                         {'x': 2, 'y': 1})
+
+    def test_new_version_does_not_disturb_old_readers(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': [1]})
+        ))
+        self.wf_module.save()
+        old_result = self.wf_module.get_cached_render_result()
+
+        self.wf_module.cache_render_result(3, ProcessResult(
+            pandas.DataFrame({'A': [2]})
+        ))
+        self.wf_module.save()
+        new_result = self.wf_module.get_cached_render_result()
+
+        self.assertNotEqual(old_result.parquet_path, new_result.parquet_path)
+        # A reader that looked up the old version reads the old table
+        self.assertEqual(old_result.result,
+                         ProcessResult(pandas.DataFrame({'A': [1]})))
+        self.assertEqual(new_result.result,
+                         ProcessResult(pandas.DataFrame({'A': [2]})))
+
+    @patch.object(crr_module, 'StaleFileGraceSeconds', -10)
+    def test_delete_stale_version(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': [1]})
+        ))
+        self.wf_module.save()
+        old_path = self.wf_module.get_cached_render_result().parquet_path
+
+        self.wf_module.cache_render_result(3, ProcessResult(
+            pandas.DataFrame({'A': [2]})
+        ))
+        self.wf_module.save()
+
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_keep_version_superseded_recently(self):
+        self.wf_module.cache_render_result(2, ProcessResult(
+            pandas.DataFrame({'A': [1]})
+        ))
+        self.wf_module.save()
+        old_result = self.wf_module.get_cached_render_result()
+        # Written long ago -- e.g., hard-linked by WfModule.duplicate()
+        an_hour_ago = time.time() - 3600
+        os.utime(old_result.parquet_path, (an_hour_ago, an_hour_ago))
+
+        self.wf_module.cache_render_result(3, ProcessResult(
+            pandas.DataFrame({'A': [2]})
+        ))
+        self.wf_module.save()
+
+        # A reader that looked up the old version can still open it
+        self.assertEqual(old_result.result,
+                         ProcessResult(pandas.DataFrame({'A': [1]})))
 
     def test_delete_wfmodule(self):
         result = ProcessResult(pandas.DataFrame({'a': [1]}))
@@ -18,7 +18,8 @@ from server.tests.modules.util import MockParams
 
 def call_fetch(loaded_module, params, workflow_id=1, input_dataframe=None,
                stored_dataframe=None, workflow_owner=None,
-               get_input_dataframe=None, get_stored_dataframe=None,
+               stored_metadata=None, get_input_dataframe=None,
+               get_stored_dataframe=None, get_stored_metadata=None,
                get_workflow_owner=None):
     """
     Call loaded_module.fetch, synchronously.
@@ -36,6 +37,9 @@ def call_fetch(loaded_module, params, workflow_id=1, input_dataframe=None,
     if get_stored_dataframe is None:
         get_stored_dataframe = wrap(stored_dataframe)
 
+    if get_stored_metadata is None:
+        get_stored_metadata = wrap(stored_metadata)
+
     if get_workflow_owner is None:
         get_workflow_owner = wrap(workflow_owner)
 
@@ -43,6 +47,7 @@ def call_fetch(loaded_module, params, workflow_id=1, input_dataframe=None,
         'workflow_id': workflow_id,
         'get_input_dataframe': get_input_dataframe,
         'get_stored_dataframe': get_stored_dataframe,
+        'get_stored_metadata': get_stored_metadata,
         'get_workflow_owner': get_workflow_owner,
     }
 
@@ -190,6 +195,56 @@ class LoadedModuleTest(SimpleTestCase):
         self.assertEqual(len(args), 2)
         self.assertEqual(result, expected)
 
+    def test_input_columns_default_none(self):
+        lm = LoadedModule('int', '1', False)
+        self.assertIsNone(lm.input_columns(MockParams(), ['A', 'B']))
+
+    def test_input_columns_static(self):
+        def input_columns(params, table):
+            self.assertEqual(list(table.columns), ['A', 'B', 'C'])
+            return ['C', 'X', 'A']
+
+        lm = LoadedModule('int', '1', False, input_columns_impl=input_columns)
+        # Ordered like the input; missing columns are ignored
+        self.assertEqual(lm.input_columns(MockParams(), ['A', 'B', 'C']),
+                         ['A', 'C'])
+
+    def test_input_columns_external_calling_convention(self):
+        def input_columns(table, params):
+            return [params['col']]
+
+        lm = LoadedModule('ext', '1', True, input_columns_impl=input_columns)
+        self.assertEqual(lm.input_columns(MockParams(col='B'), ['A', 'B']),
+                         ['B'])
+
+    def test_input_columns_exception_means_all_columns(self):
+        def input_columns(params, table):
+            raise ValueError('Oops')
+
+        lm = LoadedModule('int', '1', False, input_columns_impl=input_columns)
+        with self.assertLogs('server.models.loaded_module'):
+            self.assertIsNone(lm.input_columns(MockParams(), ['A']))
+
+    def test_is_row_wise_default_false(self):
+        lm = LoadedModule('int', '1', False)
+        self.assertFalse(lm.is_row_wise(MockParams()))
+
+    def test_is_row_wise_static(self):
+        def is_row_wise(params):
+            return params.get_param_checkbox('all_rows')
+
+        lm = LoadedModule('int', '1', False, is_row_wise_impl=is_row_wise)
+        self.assertTrue(lm.is_row_wise(MockParams(all_rows=True)))
+        self.assertFalse(lm.is_row_wise(MockParams(all_rows=False)))
+
+    def test_is_row_wise_exception_means_false(self):
+        def is_row_wise(params):
+            raise ValueError('Oops')
+
+        lm = LoadedModule('int', '1', False, is_row_wise_impl=is_row_wise)
+        with self.assertLogs('server.models.loaded_module'):
+            self.assertFalse(lm.is_row_wise(MockParams()))
+
     def test_render_static_exception(self):
         class Ick(Exception):
             pass
@@ -350,6 +405,17 @@ class LoadedModuleTest(SimpleTestCase):
 
         self.assertEqual(result, ProcessResult(pd.DataFrame({'A': [1]})))
 
+    def test_fetch_get_stored_metadata(self):
+        async def fetch(params, *, get_stored_metadata, **kwargs):
+            return ProcessResult(json=await get_stored_metadata())
+
+        lm = LoadedModule('int', '1', True, fetch_impl=fetch)
+        with self.assertLogs():
+            result = call_fetch(lm, MockParams(),
+                                stored_metadata={'etag': 'x'})
+
+        self.assertEqual(result, ProcessResult(json={'etag': 'x'}))
+
     def test_fetch_workflow_id(self):
         async def fetch(params, *, workflow_id, **kwargs):
             return ProcessResult(pd.DataFrame({'A': [workflow_id]}))
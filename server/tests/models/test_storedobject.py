@@ -1,16 +1,24 @@
+import importlib
 import os
 import json
 import tempfile
+from unittest.mock import patch
 from django.conf import settings
+from django.db.models import ProtectedError
 import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
+from server import parquet
 from server.models import StoredObject, Workflow
 from server.sanitizedataframe import sanitize_dataframe
 from server.tests.utils import DbTestCase
 from django.test import override_settings
 
 
+# server.models.StoredObject is the class; we want the module
+so_module = importlib.import_module('server.models.StoredObject')
+
+
 # don't clutter media directory with our tests (and don't accidentally succeed
 # because of files there)
 @override_settings(MEDIA_ROOT=tempfile.gettempdir())
@@ -94,6 +102,38 @@ class StoredObjectTests(DbTestCase):
         table3 = so3.get_table()
         assert_frame_equal(table3, df2)
 
+    def test_create_table_if_different_compares_hashes(self):
+        df1 = pd.DataFrame({'A': [1, 2]})
+        so1 = StoredObject.create_table(self.wfm1, df1)
+
+        with patch.object(StoredObject, 'get_table') as get_table:
+            self.assertIsNone(StoredObject.create_table_if_different(
+                self.wfm1, so1, pd.DataFrame({'A': [1, 2]})
+            ))
+            # Reordered rows, renamed column and changed dtype all differ
+            for df2 in [pd.DataFrame({'A': [2, 1]}),
+                        pd.DataFrame({'B': [1, 2]}),
+                        pd.DataFrame({'A': [1.0, 2.0]})]:
+                self.assertIsNotNone(StoredObject.create_table_if_different(
+                    self.wfm1, so1, df2
+                ))
+            get_table.assert_not_called()
+
+    def test_create_table_if_different_without_column_hashes(self):
+        # Stored before we hashed columns
+        df1 = pd.DataFrame({'A': [1]})
+        so1 = StoredObject.create_table(self.wfm1, df1)
+        so1.column_hashes = None
+        so1.save()
+
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, df1)
+        self.assertIsNone(so2)
+
+        so3 = StoredObject.create_table_if_different(
+            self.wfm1, so1, pd.DataFrame({'A': [2]})
+        )
+        self.assertEqual(len(so3.column_hashes), 1)
+
     def test_duplicate_table(self):
         table = pd.DataFrame({'A': [1]})
 
@@ -110,6 +150,112 @@ class StoredObjectTests(DbTestCase):
         self.assertEqual(self.file_contents(so1.file),
                          self.file_contents(so2.file))
 
+    def test_duplicate_table_shares_disk_space(self):
+        table = pd.DataFrame({'A': [1]})
+
+        self.wfm2 = self.workflow.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        so2 = so1.duplicate(self.wfm2)
+
+        self.assertEqual(os.stat(so1.file.path).st_ino,
+                         os.stat(so2.file.path).st_ino)
+
+        # Deleting the original leaves the duplicate readable
+        so1.delete()
+        assert_frame_equal(so2.get_table(), table)
+
+    def test_store_appended_rows(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [1, 2]}))
+        table = pd.DataFrame({'A': [1, 2, 3]})
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, table)
+
+        self.assertEqual(so2.base_id, so1.id)
+        self.assertTrue(so2.base_rows_first)
+        self.assertEqual(so2.n_rows, 3)
+        assert_frame_equal(parquet.read(so2.file.path),
+                           pd.DataFrame({'A': [3]}))
+        assert_frame_equal(so2.get_table(), table)
+
+    def test_store_prepended_rows(self):
+        # Twitter's accumulate mode puts new tweets first
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': ['b', 'c']}))
+        table = pd.DataFrame({'A': ['a', 'b', 'c']})
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, table)
+
+        self.assertEqual(so2.base_id, so1.id)
+        self.assertFalse(so2.base_rows_first)
+        assert_frame_equal(so2.get_table(), table)
+
+    def test_store_changed_rows_as_whole_table(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [1, 2]}))
+        table = pd.DataFrame({'A': [1, 3, 4]})
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, table)
+
+        self.assertIsNone(so2.base_id)
+        assert_frame_equal(so2.get_table(), table)
+
+    def test_chain_length_limit(self):
+        so = StoredObject.create_table(self.wfm1, pd.DataFrame({'A': [0]}))
+        with patch.object(so_module, 'MaxChainLength', 2):
+            for i in range(1, 4):
+                so = StoredObject.create_table_if_different(
+                    self.wfm1, so, pd.DataFrame({'A': list(range(i + 1))})
+                )
+        # chain lengths went 0, 1, 2, 0 (compacted)
+        self.assertIsNone(so.base_id)
+        self.assertEqual(so.chain_length, 0)
+        assert_frame_equal(so.get_table(), pd.DataFrame({'A': [0, 1, 2, 3]}))
+
+    def test_delete_base_compacts_dependents(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [1, 2]}))
+        table = pd.DataFrame({'A': [1, 2, 3]})
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, table)
+
+        so1.delete()
+
+        so2.refresh_from_db()
+        self.assertIsNone(so2.base_id)
+        assert_frame_equal(so2.get_table(), table)
+
+    def test_bulk_delete_base_is_protected(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [1, 2]}))
+        table = pd.DataFrame({'A': [1, 2, 3]})
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, table)
+
+        # QuerySet.delete() doesn't call StoredObject.delete()
+        with self.assertRaises(ProtectedError):
+            StoredObject.objects.filter(id=so1.id).delete()
+
+        assert_frame_equal(so2.get_table(), table)
+
+    def test_delete_wf_module_deletes_base_and_dependents(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [1, 2]}))
+        StoredObject.create_table_if_different(self.wfm1, so1,
+                                               pd.DataFrame({'A': [1, 2, 3]}))
+
+        self.wfm1.delete()
+
+        self.assertEqual(StoredObject.objects.count(), 0)
+
+    def test_duplicate_dependent_writes_whole_table(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [1, 2]}))
+        table = pd.DataFrame({'A': [1, 2, 3]})
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, table)
+
+        wfm2 = self.workflow.wf_modules.create(order=1)
+        so3 = so2.duplicate(wfm2)
+
+        self.assertIsNone(so3.base_id)
+        self.assertEqual(so3.n_rows, 3)
+        assert_frame_equal(so3.get_table(), table)
+
     def test_read_file_missing(self):
         so = StoredObject(file='hello', size=10)
         assert_frame_equal(so.get_table(), pd.DataFrame())
@@ -163,6 +163,26 @@ class WfModuleTests(WfModuleTestsBase):
         tableout2 = self.wfmodule1.retrieve_fetched_table()
         self.assertTrue(tableout2.equals(table2))
 
+    def test_wf_module_store_table_if_different_refresh_metadata(self):
+        self.createTestWorkflow()
+        self.wfmodule1.store_fetched_table_if_different(
+            mock_csv_table,
+            metadata='{"a": 1}',
+            metadata_is_validators=True
+        )
+
+        # Same table, new metadata (e.g., new ETag): update, no new version
+        version = self.wfmodule1.store_fetched_table_if_different(
+            mock_csv_table,
+            metadata='{"a": 2}',
+            metadata_is_validators=True
+        )
+
+        self.assertIsNone(version)
+        stored_objects = list(self.wfmodule1.stored_objects.all())
+        self.assertEqual(len(stored_objects), 1)
+        self.assertEqual(stored_objects[0].metadata, '{"a": 2}')
+
     def test_wf_module_duplicate(self):
         self.createTestWorkflow()
         wfm1 = self.wfmodule1
@@ -188,3 +188,9 @@ class FormulaTests(unittest.TestCase):
             {'formula_excel': '=A0*2', 'all_rows': False},
             expected_error='Invalid cell range: A0'
         )
+
+    def test_is_row_wise(self):
+        self.assertTrue(Formula.is_row_wise(P(syntax=1)))
+        self.assertTrue(Formula.is_row_wise(P(syntax=0, all_rows=True)))
+        # A one-row Excel formula may reference rows beyond the first N
+        self.assertFalse(Formula.is_row_wise(P(syntax=0, all_rows=False)))
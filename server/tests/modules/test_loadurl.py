@@ -9,6 +9,7 @@ from asgiref.sync import async_to_sync
 from django.conf import settings
 import pandas as pd
 import requests
+from server.modules import loadurl, utils
 from server.modules.loadurl import LoadURL
 from server.modules.types import ProcessResult
 from server.tests.utils import mock_xlsx_path
@@ -25,13 +26,16 @@ mock_csv_table = pd.DataFrame({
 
 
 class fake_spooled_data_from_url:
-    def __init__(self, data=b'', content_type='', charset='utf-8', error=None):
+    def __init__(self, data=b'', content_type='', charset='utf-8', error=None,
+                 headers={}):
         self.data = io.BytesIO(data)
-        self.headers = {'Content-Type': content_type}
+        self.headers = {'Content-Type': content_type, **headers}
         self.charset = charset
         self.error = error
+        self.request_headers = None
 
-    def __call__(self, *args, **kwargs):
+    def __call__(self, url, headers={}, *args, **kwargs):
+        self.request_headers = dict(headers)
         return self
 
     async def __aenter__(self):
@@ -94,7 +98,22 @@ P = MockParams.factory(url='', has_header=True)
 
 def fetch(**kwargs):
     params = P(**kwargs)
-    return async_to_sync(LoadURL.fetch)(params)
+    result = async_to_sync(LoadURL.fetch)(params)
+    if result is not None:
+        result.json = {}  # validators: see LoadUrlValidatorsTests
+    return result
+
+
+def fetch_with_metadata(stored_metadata, **kwargs):
+    params = P(**kwargs)
+
+    async def get_stored_metadata():
+        return stored_metadata
+
+    return async_to_sync(LoadURL.fetch)(
+        params,
+        get_stored_metadata=get_stored_metadata
+    )
 
 
 class LoadUrlTests(unittest.TestCase):
@@ -204,3 +223,91 @@ class LoadUrlTests(unittest.TestCase):
         fetch_result = fetch(url='not a url')
         self.assertEqual(fetch_result,
                          ProcessResult(error='Invalid URL'))
+
+
+class LoadUrlValidatorsTests(unittest.TestCase):
+    url = 'http://test.com/the.csv'
+    url_hash = loadurl._hash_url(url)
+    csv_hash = loadurl._hash_file(io.BytesIO(mock_csv_raw))[1]
+
+    def test_store_validators(self):
+        fake = fake_spooled_data_from_url(mock_csv_raw, 'text/csv', headers={
+            'ETag': '"abc"',
+            'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT',
+        })
+        with patch('server.modules.utils.spooled_data_from_url', fake):
+            result = fetch_with_metadata(None, url=self.url)
+
+        self.assertEqual(result.dataframe.shape, (2, 2))
+        self.assertEqual(result.json, {
+            'url_hash': self.url_hash,
+            'n_bytes': len(mock_csv_raw),
+            'hash': self.csv_hash,
+            'etag': '"abc"',
+            'last_modified': 'Wed, 21 Oct 2015 07:28:00 GMT',
+        })
+        self.assertNotIn('If-None-Match', fake.request_headers)
+
+    def test_omit_etag_too_long_to_store(self):
+        fake = fake_spooled_data_from_url(mock_csv_raw, 'text/csv',
+                                          headers={'ETag': 'x' * 200})
+        with patch('server.modules.utils.spooled_data_from_url', fake):
+            result = fetch_with_metadata(None, url=self.url)
+
+        self.assertNotIn('etag', result.json)
+        self.assertLessEqual(len(json.dumps(result.json)),
+                             loadurl.MaxValidatorsLength)
+
+    def test_send_conditional_headers(self):
+        fake = fake_spooled_data_from_url(error=utils.NotModified())
+        with patch('server.modules.utils.spooled_data_from_url', fake):
+            result = fetch_with_metadata({
+                'url_hash': self.url_hash,
+                'n_bytes': 1,
+                'hash': 'abc',
+                'etag': '"abc"',
+                'last_modified': 'Wed, 21 Oct 2015 07:28:00 GMT',
+            }, url=self.url)
+
+        self.assertIsNone(result)
+        self.assertEqual(fake.request_headers['If-None-Match'], '"abc"')
+        self.assertEqual(fake.request_headers['If-Modified-Since'],
+                         'Wed, 21 Oct 2015 07:28:00 GMT')
+
+    def test_ignore_validators_of_other_url(self):
+        fake = fake_spooled_data_from_url(mock_csv_raw, 'text/csv')
+        with patch('server.modules.utils.spooled_data_from_url', fake):
+            result = fetch_with_metadata({
+                'url_hash': loadurl._hash_url('http://test.com/other.csv'),
+                'n_bytes': len(mock_csv_raw),
+                'hash': self.csv_hash,
+                'etag': '"abc"',
+            }, url=self.url)
+
+        self.assertNotIn('If-None-Match', fake.request_headers)
+        self.assertEqual(result.dataframe.shape, (2, 2))
+
+    def test_skip_parse_when_bytes_unchanged(self):
+        fake = fake_spooled_data_from_url(mock_csv_raw, 'text/csv')
+        with patch('server.modules.utils.spooled_data_from_url', fake):
+            with patch('server.modules.loadurl.parse_bytesio') as parse:
+                result = fetch_with_metadata({
+                    'url_hash': self.url_hash,
+                    'n_bytes': len(mock_csv_raw),
+                    'hash': self.csv_hash,
+                }, url=self.url)
+
+        self.assertIsNone(result)
+        parse.assert_not_called()
+
+    def test_parse_when_bytes_changed(self):
+        fake = fake_spooled_data_from_url(mock_csv_raw, 'text/csv')
+        with patch('server.modules.utils.spooled_data_from_url', fake):
+            result = fetch_with_metadata({
+                'url_hash': self.url_hash,
+                'n_bytes': len(mock_csv_raw),
+                'hash': 'changed',
+            }, url=self.url)
+
+        self.assertEqual(result.dataframe.shape, (2, 2))
+        self.assertEqual(result.json['hash'], self.csv_hash)
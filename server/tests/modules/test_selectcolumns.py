@@ -20,6 +20,12 @@ def render(table, colnames, drop_or_keep, select_range,
     return result
 
 
+def input_columns(table, colnames, drop_or_keep, select_range,
+                  column_numbers):
+    params = P(colnames, drop_or_keep, select_range, column_numbers)
+    return SelectColumns.input_columns(params, table)
+
+
 class SelectColumnsTests(unittest.TestCase):
     def setUp(self):
         super().setUp()
@@ -63,3 +69,25 @@ class SelectColumnsTests(unittest.TestCase):
         self.assertEqual(result, ProcessResult(self.table, error=(
             'Rows must look like "1-2", "5" or "1-2, 5"; got "giraffe"'
         )))
+
+    def test_input_columns_keep(self):
+        self.assertEqual(
+            input_columns(self.table, (['A', 'C'], []), KEEP, False, ''),
+            ['A', 'C']
+        )
+
+    def test_input_columns_drop(self):
+        self.assertEqual(
+            input_columns(self.table, (['A'], []), DROP, False, ''),
+            ['B', 'C']
+        )
+
+    def test_input_columns_none_selected(self):
+        self.assertIsNone(
+            input_columns(self.table, ([], []), KEEP, False, '')
+        )
+
+    def test_input_columns_range_needs_all_columns(self):
+        self.assertIsNone(
+            input_columns(self.table, ([], []), KEEP, True, '1')
+        )
@@ -1,5 +1,6 @@
 import asyncio
 import io
+import tempfile
 import unittest
 from unittest.mock import patch
 from asgiref.sync import async_to_sync
@@ -12,7 +13,8 @@ from server.models import Workflow
 from server.models.commands import InitWorkflowCommand
 from server.modules.types import ProcessResult
 from server.modules.utils import build_globals_for_eval, parse_bytesio, \
-        turn_header_into_first_row, workflow_url_to_id, fetch_external_workflow
+        turn_header_into_first_row, workflow_url_to_id, \
+        fetch_external_workflow, _concat_categorical_chunks
 from server.tests.utils import DbTestCase
 
 
@@ -129,6 +131,93 @@ class ParseBytesIoTest(SimpleTestCase):
         expected = ProcessResult(pd.DataFrame({'A': ['B'], 'C': ['D']}))
         self.assertEqual(result, expected)
 
+    @override_settings(CSV_PARSE_CHUNK_N_ROWS=2)
+    def test_csv_in_chunks(self):
+        result = parse_bytesio(io.BytesIO(b'A,B\n1,x\n2,y\n3,x\n4,z\n5,'),
+                               'text/csv', 'utf-8')
+        self.assertEqual(result.dataframe['A'].tolist(), [1, 2, 3, 4, 5])
+        # categories are unified across chunks, not converted to object
+        self.assertEqual(result.dataframe['B'].dtype, 'category')
+        self.assertEqual(sorted(result.dataframe['B'].cat.categories),
+                         ['x', 'y', 'z'])
+        self.assertEqual(result.dataframe['B'].tolist()[:4],
+                         ['x', 'y', 'x', 'z'])
+        self.assertTrue(pd.isna(result.dataframe['B'][4]))
+
+    def test_concat_categorical_chunks_disjoint_categories(self):
+        # Chunks' categories differ: "a,b" then "c,d" then "c,e"
+        csv = 'A,B\nb,x\na,\nd,y\nc,x\nc,z\ne,y\n'
+        chunks = pd.read_csv(io.StringIO(csv), dtype='category', chunksize=2)
+        result = _concat_categorical_chunks(chunks)
+        expected = pd.read_csv(io.StringIO(csv), dtype='category')
+        assert_frame_equal(result, expected)
+
+    def test_concat_categorical_chunks_differently_ordered_categories(self):
+        chunks = [
+            pd.DataFrame({'A': pd.Categorical(['y', 'x'],
+                                              categories=['y', 'x'])}),
+            pd.DataFrame({'A': pd.Categorical(['z', 'x', None],
+                                              categories=['z', 'x'])}),
+        ]
+        result = _concat_categorical_chunks(chunks)
+        expected = pd.read_csv(io.StringIO('A\ny\nx\nz\nx\n\n'),
+                               dtype='category', skip_blank_lines=False)
+        assert_frame_equal(result, expected)
+
+    @override_settings(CSV_PARSE_CHUNK_N_ROWS=2)
+    def test_csv_header_only(self):
+        result = parse_bytesio(io.BytesIO(b'A,B'), 'text/csv', 'utf-8')
+        self.assertEqual(list(result.dataframe.columns), ['A', 'B'])
+        self.assertEqual(len(result.dataframe), 0)
+
+    def _parse_in_parallel_and_serially(self, b: bytes,
+                                        mime_type: str='text/csv'):
+        with override_settings(CSV_PARALLEL_PARSE_MIN_BYTES=0,
+                               CSV_PARALLEL_PARSE_CHUNK_N_BYTES=8,
+                               CSV_PARSE_N_PROCESSES=2):
+            with tempfile.TemporaryFile() as f:
+                f.write(b)
+                f.seek(0)
+                parallel = parse_bytesio(f, mime_type, 'utf-8')
+        serial = parse_bytesio(io.BytesIO(b), mime_type, 'utf-8')
+        return parallel, serial
+
+    def test_txt_in_parallel_one_separator(self):
+        # Sniffed from all the text, ';' wins. Sniffed from the last chunk
+        # alone, ',' would tie with it.
+        parallel, serial = self._parse_in_parallel_and_serially(
+            b'A;B\n1;x\n2;y\n3;z\n4,5;w\n',
+            'text/plain'
+        )
+        self.assertEqual(parallel, serial)
+        self.assertEqual(list(parallel.dataframe.columns), ['A', 'B'])
+        self.assertEqual(parallel.dataframe['B'].tolist(),
+                         ['x', 'y', 'z', 'w'])
+
+    def test_csv_in_parallel(self):
+        parallel, serial = self._parse_in_parallel_and_serially(
+            b'A,B,C\r\n1,x,"a\r\nb"\r\n2,y,c\r\n3,"x ""q""",d\r\n'
+            b'4,y,e\r\n5.5,z,"f,\ng"\r\n'
+        )
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel.dataframe['A'].tolist(),
+                         [1, 2, 3, 4, 5.5])
+        self.assertEqual(parallel.dataframe['B'].dtype, 'category')
+
+    def test_csv_in_parallel_stray_quote(self):
+        # A quote in an unquoted field makes us split mid-record. We must
+        # notice and parse serially.
+        parallel, serial = self._parse_in_parallel_and_serially(
+            b'A,B\n1,12" pipe\n2,"x\ny"\n3,"z\nz"\n4,w\n'
+        )
+        self.assertEqual(parallel, serial)
+
+    def test_csv_in_parallel_ragged_row(self):
+        parallel, serial = self._parse_in_parallel_and_serially(
+            b'A,B\n1,2\n3,4\n5,6\n7,8,9\n10,11\n'
+        )
+        self.assertEqual(parallel, serial)
+
 
 class OtherUtilsTests(SimpleTestCase):
     def test_turn_header_into_first_row(self):
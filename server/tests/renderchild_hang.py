@@ -0,0 +1,12 @@
+"""
+A render child that never replies, for `test_renderpool`.
+
+Render children import their entry point by name, in a fresh process from
+the forkserver. So this module must not import Django.
+"""
+import time
+
+
+def main(conn, max_rss_bytes):
+    conn.recv()
+    time.sleep(60)
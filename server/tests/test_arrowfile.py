@@ -0,0 +1,70 @@
+import datetime
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from server import arrowfile
+
+
+class ArrowFileTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+        super().tearDown()
+
+    def test_round_trip(self):
+        table = pd.DataFrame({
+            'A': [1, 2],
+            'B': [1.5, np.nan],
+            'C': ['x', None],
+            'D': pd.Series(['a', 'b'], dtype='category'),
+            'E': [datetime.datetime(2018, 8, 20), pd.NaT],
+        })
+        arrowfile.write(self.path, table)
+        assert_frame_equal(arrowfile.read(self.path), table)
+
+    def test_ordered_categorical_round_trip(self):
+        table = pd.DataFrame({
+            'A': pd.Categorical(['b', 'a', 'c', 'b'],
+                                categories=['c', 'b', 'a'], ordered=True),
+        })
+        arrowfile.write(self.path, table)
+        assert_frame_equal(arrowfile.read(self.path), table)
+        assert_frame_equal(arrowfile.read_header(self.path).read_rows(1, 3),
+                           table[1:3].reset_index(drop=True))
+
+    def test_read_header(self):
+        table = pd.DataFrame({
+            'A': [1, 2, 3],
+            'B': pd.Series(['a', 'b', 'a'], dtype='category'),
+            'C': [datetime.datetime(2018, 8, 20)] * 3,
+            'D': ['x', 'y', 'z'],
+        })
+        arrowfile.write(self.path, table)
+        header = arrowfile.read_header(self.path)
+        self.assertEqual(header.columns, ['A', 'B', 'C', 'D'])
+        self.assertEqual(header.count, 3)
+        self.assertEqual(list(header.dtypes.values()),
+                         list(table.dtypes.values))
+
+    def test_read_rows(self):
+        arrowfile.write(self.path, pd.DataFrame({
+            'A': [1, 2, 3, 4],
+            'B': ['a', 'b', 'c', 'd'],
+        }))
+        header = arrowfile.read_header(self.path)
+        assert_frame_equal(header.read_rows(1, 3, columns=['B']),
+                           pd.DataFrame({'B': ['b', 'c']}))
+        # clip out-of-range rows
+        assert_frame_equal(header.read_rows(3, 10),
+                           pd.DataFrame({'A': [4], 'B': ['d']}))
+
+    def test_read_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            arrowfile.read_header(self.path + '.missing')
@@ -0,0 +1,70 @@
+import errno
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from server import atomicfile
+
+
+class AtomicFileTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'x.dat')
+        with open(self.path, 'w') as f:
+            f.write('old')
+
+    def tearDown(self):
+        self.dir.cleanup()
+        super().tearDown()
+
+    def test_replace(self):
+        with atomicfile.replacing(self.path) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                f.write('new')
+            with open(self.path) as f:
+                self.assertEqual(f.read(), 'old')  # not replaced yet
+
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'new')
+        self.assertEqual(os.listdir(self.dir.name), ['x.dat'])
+
+    def test_error_leaves_file_untouched(self):
+        with self.assertRaises(ValueError):
+            with atomicfile.replacing(self.path) as tmp_path:
+                with open(tmp_path, 'w') as f:
+                    f.write('new')
+                raise ValueError('failed mid-write')
+
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(os.listdir(self.dir.name), ['x.dat'])
+
+    def test_copy_hard_links(self):
+        dst = os.path.join(self.dir.name, 'y.dat')
+        atomicfile.copy(self.path, dst)
+        with open(dst) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(os.stat(dst).st_ino, os.stat(self.path).st_ino)
+
+        # Replacing the original leaves the copy intact
+        with atomicfile.replacing(self.path) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                f.write('new')
+        with open(dst) as f:
+            self.assertEqual(f.read(), 'old')
+
+    @patch('os.link')
+    def test_copy_falls_back_to_copying_bytes(self, link):
+        link.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+        dst = os.path.join(self.dir.name, 'y.dat')
+        atomicfile.copy(self.path, dst)
+        with open(dst) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertNotEqual(os.stat(dst).st_ino, os.stat(self.path).st_ino)
+
+    def test_copy_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            atomicfile.copy(os.path.join(self.dir.name, 'missing'),
+                            os.path.join(self.dir.name, 'y.dat'))
+        self.assertEqual(os.listdir(self.dir.name), ['x.dat'])
@@ -0,0 +1,29 @@
+import tempfile
+import unittest
+from server import cachebenchmark
+
+
+class CacheBenchmarkTest(unittest.TestCase):
+    def test_run(self):
+        formats = [f for f in cachebenchmark.default_formats()
+                   if f.name in ('arrow', 'SNAPPY')]
+        tables = list(cachebenchmark.synthetic_tables(10))
+        with tempfile.TemporaryDirectory() as dirname:
+            measurements = list(cachebenchmark.run(tables, formats, dirname))
+
+        self.assertEqual(len(measurements), len(tables) * 2)
+        for measurement in measurements:
+            self.assertEqual(measurement.error, '')
+            self.assertGreater(measurement.n_bytes, 0)
+
+    def test_unavailable_format(self):
+        def write(path, table):
+            raise ImportError('no such codec')
+
+        file_format = cachebenchmark.Format('bad', write, None)
+        tables = list(cachebenchmark.synthetic_tables(10))[:1]
+        with tempfile.TemporaryDirectory() as dirname:
+            measurement, = cachebenchmark.run(tables, [file_format], dirname)
+
+        self.assertIsNone(measurement.n_bytes)
+        self.assertEqual(measurement.error, 'no such codec')
@@ -0,0 +1,71 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from server import columnstats
+
+
+class ColumnStatsTest(unittest.TestCase):
+    def test_text(self):
+        stats = columnstats.compute_column(
+            pd.Series(['a', 'b', 'b', None, 'c'])
+        )
+        self.assertEqual(stats['n_nulls'], 1)
+        self.assertIsNone(stats['min'])
+        self.assertIsNone(stats['max'])
+        self.assertEqual(stats['n_distinct'], 3)
+        self.assertEqual(stats['top_values'][0], ['b', 2])
+        self.assertEqual(sorted(stats['top_values'][1:]),
+                         [['a', 1], ['c', 1]])
+
+    def test_number(self):
+        stats = columnstats.compute_column(pd.Series([3, 1, 2, 3]))
+        self.assertEqual(stats['min'], 1)
+        self.assertEqual(stats['max'], 3)
+        self.assertEqual(stats['top_values'][0], ['3', 2])
+
+    def test_datetime(self):
+        stats = columnstats.compute_column(pd.Series([
+            datetime.datetime(2018, 8, 20),
+            pd.NaT,
+            datetime.datetime(2018, 1, 1),
+        ]))
+        self.assertEqual(stats['n_nulls'], 1)
+        self.assertEqual(stats['min'], '2018-01-01T00:00:00Z')
+        self.assertEqual(stats['max'], '2018-08-20T00:00:00Z')
+
+    def test_all_null(self):
+        stats = columnstats.compute_column(pd.Series([np.nan, np.nan]))
+        self.assertEqual(stats['n_nulls'], 2)
+        self.assertIsNone(stats['min'])
+        self.assertEqual(stats['n_distinct'], 0)
+
+    @patch('server.columnstats.MaxNTopValues', 1)
+    def test_top_values_limit(self):
+        stats = columnstats.compute_column(pd.Series(['a', 'b', 'b']))
+        self.assertEqual(stats['n_distinct'], 2)
+        self.assertEqual(stats['top_values'], [['b', 2]])
+
+    def test_value_counts_cast_to_str(self):
+        counts = columnstats.value_counts(pd.Series([1, 2, 2, np.nan]))
+        self.assertEqual(counts.to_dict(), {'2.0': 2, '1.0': 1})
+
+    def test_categorical_ignores_unused_categories(self):
+        series = pd.Series(['a', 'b', 'b'], dtype='category')
+        series = series[series == 'b'].astype(series.dtype)  # 'a' is unused
+        stats = columnstats.compute_column(series)
+        self.assertEqual(stats['n_distinct'], 1)
+        self.assertEqual(stats['top_values'], [['b', 2]])
+
+    def test_infinity_is_null(self):
+        stats = columnstats.compute_column(pd.Series([-np.inf, 1.0, np.inf]))
+        self.assertIsNone(stats['min'])
+        self.assertIsNone(stats['max'])
+        # ... so the stats are valid JSON
+        with tempfile.TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, 'x.stats.json')
+            columnstats.write(path, {'A': stats})
+            self.assertEqual(columnstats.read(path), {'A': stats})
@@ -1,14 +1,16 @@
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import logging
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 import django.db
 import pandas as pd
-from server.tests.utils import DbTestCase
-from server.execute import execute_workflow
-from server.models import LoadedModule, Workflow
+from server.tests.utils import DbTestCase, add_new_module_version, \
+        add_new_parameter_spec
+from server.execute import UnneededExecution, execute_workflow
+from server.models import LoadedModule, ParameterSpec, Workflow
 from server.models.commands import InitWorkflowCommand
 from server.modules.types import ProcessResult
+from server.renderbudget import RenderBudget, table_nbytes
 
 
 logger = logging.getLogger(__name__)
@@ -99,6 +101,24 @@ class ExecuteTests(DbTestCase):
             result2
         )
 
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_execute_cancelled(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        workflow.wf_modules.create(order=0, last_relevant_delta_id=delta.id)
+
+        fake_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_module
+
+        cancel = asyncio.Event(loop=self.loop)
+        cancel.set()
+
+        with self.assertRaises(UnneededExecution):
+            self.loop.run_until_complete(execute_workflow(workflow, cancel))
+
+        fake_module.render.assert_not_called()
+
     @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
     @patch('server.websockets.ws_client_send_delta_async')
     def test_execute_mark_unreachable(self, send_delta_async,
@@ -157,6 +177,86 @@ class ExecuteTests(DbTestCase):
             }
         })
 
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_record_render_peak_bytes(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        table1 = pd.DataFrame({'A': ['x' * 100] * 10})
+        wf_module1.cache_render_result(delta.id, ProcessResult(table1))
+        wf_module1.save()
+        wf_module2 = workflow.wf_modules.create(
+            order=1,
+            last_relevant_delta_id=delta.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.input_columns.return_value = None
+        table2 = pd.DataFrame({'B': range(10)})
+        fake_loaded_module.render.return_value = ProcessResult(table2)
+
+        self._execute(workflow)
+
+        wf_module1.refresh_from_db()
+        input_table = wf_module1.get_cached_render_result().result.dataframe
+        wf_module2.refresh_from_db()
+        self.assertEqual(wf_module2.render_peak_bytes,
+                         table_nbytes(input_table) + table_nbytes(table2))
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    @patch('server.renderbudget._budget', RenderBudget(100, 1000))
+    def test_render_over_budget_is_error(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.render.return_value = ProcessResult(
+            pd.DataFrame({'A': ['x' * 1000]})
+        )
+
+        self._execute(workflow)
+
+        wf_module.refresh_from_db()
+        result = wf_module.get_cached_render_result().result
+        self.assertEqual(result.status, 'error')
+        self.assertRegex(result.error, 'limit is')
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    @patch('server.renderbudget._budget', RenderBudget(100, 1000))
+    @patch('server.execute._render_key', lambda *args: 'key')
+    def test_render_over_budget_is_not_memoized(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.render.return_value = ProcessResult(
+            pd.DataFrame({'A': ['x' * 1000]})
+        )
+
+        self._execute(workflow)
+
+        wf_module.refresh_from_db()
+        self.assertEqual(wf_module.cached_render_result_status, 'error')
+        # A render with a bigger budget won't restore the error
+        self.assertEqual(wf_module.cached_render_result_key, '')
+
     @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
     @patch('server.websockets.ws_client_send_delta_async', fake_send)
     def test_execute_cache_hit(self, fake_module):
@@ -198,6 +298,7 @@ class ExecuteTests(DbTestCase):
 
         fake_loaded_module = Mock(LoadedModule)
         fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.input_columns.return_value = None
         result2 = ProcessResult(pd.DataFrame({'A': [2]}))
         fake_loaded_module.render.return_value = result2
 
@@ -208,6 +309,35 @@ class ExecuteTests(DbTestCase):
         self.assertEqual(actual, result2)
         fake_loaded_module.render.assert_called_once()  # only with module2
 
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_read_only_input_columns_module_needs(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        wf_module1.cache_render_result(delta.id, ProcessResult(
+            pd.DataFrame({'A': [1], 'B': [2], 'C': [3]})
+        ))
+        wf_module1.save()
+        workflow.wf_modules.create(order=1, last_relevant_delta_id=delta.id)
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.input_columns.return_value = ['A', 'C']
+        fake_loaded_module.render.return_value = ProcessResult()
+
+        self._execute(workflow)
+
+        fake_loaded_module.input_columns.assert_called_once_with(
+            ANY,
+            ['A', 'B', 'C']
+        )
+        table = fake_loaded_module.render.call_args[0][1]
+        self.assertEqual(list(table.columns), ['A', 'C'])
+
     @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
     @patch('server.websockets.ws_client_send_delta_async', fake_send)
     @patch('server.notifications.email_output_delta')
@@ -261,3 +391,337 @@ class ExecuteTests(DbTestCase):
         self._execute(workflow)
 
         email.assert_not_called()
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_reuse_result_when_render_key_unchanged(self, fake_load_module):
+        module_version = add_new_module_version('Module', id_name='nop')
+        workflow = Workflow.objects.create()
+        delta1 = InitWorkflowCommand.create(workflow)
+        wf_module = workflow.wf_modules.create(
+            order=0,
+            module_version=module_version,
+            last_relevant_delta_id=delta1.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        result = ProcessResult(pd.DataFrame({'A': [1]}))
+        fake_loaded_module.render.return_value = result
+
+        self._execute(workflow)
+
+        # A no-op delta: nothing the render depends on has changed
+        delta2 = InitWorkflowCommand.create(workflow)
+        wf_module.last_relevant_delta_id = delta2.id
+        wf_module.save(update_fields=['last_relevant_delta_id'])
+
+        self._execute(workflow)
+
+        fake_loaded_module.render.assert_called_once()
+        wf_module.refresh_from_db()
+        cached_result = wf_module.get_cached_render_result(only_fresh=True)
+        self.assertEqual(cached_result.delta_id, delta2.id)
+        self.assertEqual(cached_result.result, result)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_render_again_when_internal_module_code_changes(
+        self,
+        fake_load_module
+    ):
+        # Internal modules' ModuleVersions never change: only their code does
+        module_version = add_new_module_version('Module', id_name='NOP')
+        workflow = Workflow.objects.create()
+        delta1 = InitWorkflowCommand.create(workflow)
+        wf_module = workflow.wf_modules.create(
+            order=0,
+            module_version=module_version,
+            last_relevant_delta_id=delta1.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.render.return_value = \
+            ProcessResult(pd.DataFrame({'A': [1]}))
+
+        with patch('server.execute._internal_modules_code_hash',
+                   lambda: 'old-code'):
+            self._execute(workflow)
+
+        delta2 = InitWorkflowCommand.create(workflow)
+        wf_module.last_relevant_delta_id = delta2.id
+        wf_module.save(update_fields=['last_relevant_delta_id'])
+
+        with patch('server.execute._internal_modules_code_hash',
+                   lambda: 'new-code'):
+            self._execute(workflow)
+
+        self.assertEqual(fake_loaded_module.render.call_count, 2)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_restore_memoized_result_on_undo(self, fake_load_module):
+        module_version = add_new_module_version('Module', id_name='nop')
+        add_new_parameter_spec(module_version, ParameterSpec.STRING,
+                               id_name='x', def_value='1')
+        workflow = Workflow.objects.create()
+        delta1 = InitWorkflowCommand.create(workflow)
+        wf_module = workflow.wf_modules.create(
+            order=0,
+            module_version=module_version,
+            last_relevant_delta_id=delta1.id
+        )
+        wf_module.create_parametervals()
+        pval = wf_module.parameter_vals.first()
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        result1 = ProcessResult(pd.DataFrame({'A': [1]}))
+        result2 = ProcessResult(pd.DataFrame({'A': [2]}))
+        fake_loaded_module.render.side_effect = [result1, result2]
+
+        self._execute(workflow)
+
+        # Change a param: must render
+        pval.set_value('2')
+        pval.save()
+        delta2 = InitWorkflowCommand.create(workflow)
+        wf_module.last_relevant_delta_id = delta2.id
+        wf_module.save(update_fields=['last_relevant_delta_id'])
+        self._execute(workflow)
+
+        # "Undo": the params are what they were at delta1
+        pval.set_value('1')
+        pval.save()
+        delta3 = InitWorkflowCommand.create(workflow)
+        wf_module.last_relevant_delta_id = delta3.id
+        wf_module.save(update_fields=['last_relevant_delta_id'])
+        self._execute(workflow)
+
+        self.assertEqual(fake_loaded_module.render.call_count, 2)
+        wf_module.refresh_from_db()
+        cached_result = wf_module.get_cached_render_result(only_fresh=True)
+        self.assertEqual(cached_result.delta_id, delta3.id)
+        self.assertEqual(cached_result.result, result1)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async')
+    def test_send_preview_of_selected_row_wise_module(self, send_delta_async,
+                                                      fake_load_module):
+        send_delta_async.return_value = fake_future
+        module_version = add_new_module_version('Module', id_name='nop')
+        workflow = Workflow.objects.create(selected_wf_module=1)
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        wf_module1.cache_render_result(delta.id, ProcessResult(
+            pd.DataFrame({'A': range(1000)})
+        ))
+        wf_module1.save()
+        wf_module2 = workflow.wf_modules.create(
+            order=1,
+            module_version=module_version,
+            last_relevant_delta_id=delta.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.is_row_wise.return_value = True
+        fake_loaded_module.input_columns.return_value = None
+        fake_loaded_module.render.side_effect = \
+            lambda params, table, fetch_result: ProcessResult(table)
+
+        self._execute(workflow)
+
+        # First render: the preview
+        table = fake_loaded_module.render.call_args_list[0][0][1]
+        self.assertEqual(len(table), 200)
+        # Second render: the real thing
+        table = fake_loaded_module.render.call_args_list[1][0][1]
+        self.assertEqual(len(table), 1000)
+
+        delta_dict = send_delta_async.call_args_list[0][0][1]
+        preview = delta_dict['updateWfModules'][str(wf_module2.id)][
+            'output_preview'
+        ]
+        self.assertEqual(preview['delta_id'], delta.id)
+        self.assertEqual(preview['columns'], [{'name': 'A',
+                                               'type': 'number'}])
+        self.assertEqual(preview['rows'][:2], [{'A': 0}, {'A': 1}])
+        self.assertEqual(len(preview['rows']), 200)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    @patch('server.renderbudget._budget', RenderBudget(1000, 10 ** 9))
+    def test_preview_respects_render_budget(self, fake_load_module):
+        module_version = add_new_module_version('Module', id_name='nop')
+        workflow = Workflow.objects.create(selected_wf_module=1)
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        wf_module1.cache_render_result(delta.id, ProcessResult(
+            pd.DataFrame({'A': ['x' * 100] * 1000})
+        ))
+        wf_module1.save()
+        workflow.wf_modules.create(
+            order=1,
+            module_version=module_version,
+            last_relevant_delta_id=delta.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.is_row_wise.return_value = True
+        fake_loaded_module.input_columns.return_value = None
+        fake_loaded_module.render.side_effect = \
+            lambda params, table, fetch_result: ProcessResult(table)
+
+        self._execute(workflow)
+
+        # Even the preview's 200 rows are over budget: we don't render them
+        fake_loaded_module.render.assert_not_called()
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_no_preview_when_module_is_not_row_wise(self, fake_load_module):
+        module_version = add_new_module_version('Module', id_name='nop')
+        workflow = Workflow.objects.create(selected_wf_module=1)
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        wf_module1.cache_render_result(delta.id, ProcessResult(
+            pd.DataFrame({'A': range(1000)})
+        ))
+        wf_module1.save()
+        workflow.wf_modules.create(
+            order=1,
+            module_version=module_version,
+            last_relevant_delta_id=delta.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.is_row_wise.return_value = False
+        fake_loaded_module.input_columns.return_value = None
+        fake_loaded_module.render.return_value = ProcessResult()
+
+        self._execute(workflow)
+
+        fake_loaded_module.render.assert_called_once()
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_skip_writing_cheap_intermediate_result(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        wf_module2 = workflow.wf_modules.create(
+            order=1,
+            last_relevant_delta_id=delta.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.input_columns.return_value = None
+        fake_loaded_module.render.return_value = ProcessResult(
+            pd.DataFrame({'A': [1]})
+        )
+
+        self._execute(workflow)
+
+        wf_module1.refresh_from_db()
+        cached_result1 = wf_module1.get_cached_render_result()
+        self.assertFalse(cached_result1.is_materialized)
+        self.assertEqual(len(cached_result1), 1)
+        # The workflow's output is always written
+        wf_module2.refresh_from_db()
+        cached_result2 = wf_module2.get_cached_render_result()
+        self.assertTrue(cached_result2.is_materialized)
+        self.assertEqual(cached_result2.result,
+                         ProcessResult(pd.DataFrame({'A': [1]})))
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_write_selected_result(self, fake_load_module):
+        workflow = Workflow.objects.create(selected_wf_module=0)
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        workflow.wf_modules.create(order=1, last_relevant_delta_id=delta.id)
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.input_columns.return_value = None
+        fake_loaded_module.render.return_value = ProcessResult(
+            pd.DataFrame({'A': [1]})
+        )
+
+        self._execute(workflow)
+
+        wf_module1.refresh_from_db()
+        self.assertTrue(wf_module1.get_cached_render_result().is_materialized)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_write_public_output_result(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id,
+            materialize_output=True
+        )
+        workflow.wf_modules.create(order=1, last_relevant_delta_id=delta.id)
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.input_columns.return_value = None
+        fake_loaded_module.render.return_value = ProcessResult(
+            pd.DataFrame({'A': [1]})
+        )
+
+        self._execute(workflow)
+
+        wf_module1.refresh_from_db()
+        self.assertTrue(wf_module1.get_cached_render_result().is_materialized)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_render_unwritten_input_again(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wf_module1 = workflow.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta.id
+        )
+        wf_module1.cache_render_result(delta.id, ProcessResult(
+            pd.DataFrame({'A': [1]})
+        ), materialize=False)
+        wf_module1.save()
+        workflow.wf_modules.create(order=1, last_relevant_delta_id=delta.id)
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.input_columns.return_value = None
+        fake_loaded_module.render.side_effect = [
+            ProcessResult(pd.DataFrame({'A': [2]})),  # module 1, again
+            ProcessResult(pd.DataFrame({'B': [3]})),  # module 2
+        ]
+
+        self._execute(workflow)
+
+        self.assertEqual(fake_loaded_module.render.call_count, 2)
+        table = fake_loaded_module.render.call_args_list[1][0][1]
+        self.assertEqual(list(table['A']), [2])
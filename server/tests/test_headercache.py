@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from server.headercache import HeaderCache
+
+
+class HeaderCacheTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'x.dat')
+        self._write(b'1')
+        self.reads = []
+
+    def tearDown(self):
+        self.dir.cleanup()
+        super().tearDown()
+
+    def _write(self, data: bytes) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)  # new inode
+
+    def _read(self, path):
+        self.reads.append(path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_hit(self):
+        cache = HeaderCache(10)
+        self.assertEqual(cache.read_header(self.path, 1, self._read), b'1')
+        self.assertEqual(cache.read_header(self.path, 1, self._read), b'1')
+        self.assertEqual(self.reads, [self.path])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_miss_on_new_file(self):
+        cache = HeaderCache(10)
+        cache.read_header(self.path, 1, self._read)
+        self._write(b'22')
+        self.assertEqual(cache.read_header(self.path, 1, self._read), b'22')
+        # The old version was dropped
+        self.assertEqual(cache.stats()['n_headers'], 1)
+
+    def test_drop_other_versions_of_same_owner(self):
+        cache = HeaderCache(10)
+        v2_path = os.path.join(self.dir.name, 'x-v2.dat')
+        with open(v2_path, 'wb') as f:
+            f.write(b'2')
+        other_path = os.path.join(self.dir.name, 'y.dat')
+        with open(other_path, 'wb') as f:
+            f.write(b'3')
+        cache.read_header(self.path, 1, self._read, owner=(1, 2))
+        cache.read_header(other_path, 1, self._read, owner=(1, 3))
+        cache.read_header(v2_path, 2, self._read, owner=(1, 2))
+        # The old version of (1, 2) was dropped; (1, 3) was kept
+        self.assertEqual(cache.stats()['n_headers'], 2)
+        cache.read_header(other_path, 1, self._read, owner=(1, 3))
+        self.assertEqual(self.reads, [self.path, other_path, v2_path])
+
+    def test_miss_on_new_delta_id(self):
+        cache = HeaderCache(10)
+        cache.read_header(self.path, 1, self._read)
+        cache.read_header(self.path, 2, self._read)
+        self.assertEqual(len(self.reads), 2)
+
+    def test_missing_file(self):
+        cache = HeaderCache(10)
+        with self.assertRaises(FileNotFoundError):
+            cache.read_header(self.path + '.missing', 1, self._read)
+        self.assertEqual(self.reads, [])
+
+    def test_evict_least_recently_used(self):
+        cache = HeaderCache(1)
+        other_path = os.path.join(self.dir.name, 'y.dat')
+        with open(other_path, 'wb') as f:
+            f.write(b'2')
+        cache.read_header(self.path, 1, self._read)
+        cache.read_header(other_path, 1, self._read)
+        cache.read_header(self.path, 1, self._read)
+        self.assertEqual(self.reads, [self.path, other_path, self.path])
@@ -1,5 +1,10 @@
 import os.path
+import tempfile
 import unittest
+from unittest.mock import patch
+from django.test import override_settings
+import pandas as pd
+from pandas.testing import assert_frame_equal
 from server import parquet
 
 
@@ -23,3 +28,136 @@ class ParquetTest(unittest.TestCase):
     def test_read_issue_375_snappy(self):
         with self.assertRaises(parquet.FastparquetIssue375):
             parquet.read(_path('fastparquet-issue-375-snappy.par'))
+
+    def test_read_columns(self):
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, pd.DataFrame({'A': [1], 'B': ['x'],
+                                                 'C': [2.0]}))
+            table = parquet.read(tf.name, columns=['A', 'C'])
+        assert_frame_equal(table, pd.DataFrame({'A': [1], 'C': [2.0]}))
+
+    @patch('server.parquet.RowGroupNRows', 2)
+    def test_write_aligned_row_groups(self):
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, pd.DataFrame({'A': [1, 2, 3, 4, 5]}))
+            pf = parquet.read_header(tf.name)
+        self.assertEqual([rg.num_rows for rg in pf.row_groups], [2, 2, 1])
+
+    @patch('server.parquet.RowGroupNRows', 2)
+    def test_read_rows(self):
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, pd.DataFrame({
+                'A': [1, 2, 3, 4, 5],
+                'B': ['a', 'b', 'c', 'd', 'e'],
+            }))
+            table = parquet.read_rows(tf.name, ['B'], 1, 4)
+        assert_frame_equal(table, pd.DataFrame({'B': ['b', 'c', 'd']}))
+
+    def test_read_rows_out_of_range(self):
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, pd.DataFrame({'A': [1, 2]}))
+            table = parquet.read_rows(tf.name, None, 5, 10)
+        self.assertEqual(list(table.columns), ['A'])
+        self.assertEqual(len(table), 0)
+
+    def test_write_uncompressed(self):
+        table = pd.DataFrame({'A': [1, 2], 'B': ['x', 'y']})
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, table, compression='UNCOMPRESSED')
+            assert_frame_equal(parquet.read(tf.name), table)
+
+    def test_write_compression_level_invalid(self):
+        with tempfile.NamedTemporaryFile() as tf:
+            with self.assertRaises(ValueError):
+                parquet.write(tf.name, pd.DataFrame({'A': [1]}),
+                              compression='SNAPPY', compression_level=3)
+
+    @override_settings(PARQUET_COMPRESSION='GZIP',
+                       PARQUET_COMPRESSION_LEVEL=9)
+    @patch('fastparquet.write')
+    def test_write_compression_level_overrides_settings(self, write):
+        with tempfile.TemporaryDirectory() as dirname:
+            parquet.write(os.path.join(dirname, 'x.dat'),
+                          pd.DataFrame({'A': [1]}), compression_level=1)
+        self.assertEqual(write.call_args[1]['compression'], {
+            '_default': {'type': 'GZIP', 'args': {'compresslevel': 1}},
+        })
+
+    @override_settings(PARQUET_COMPRESSION='GZIP',
+                       PARQUET_COMPRESSION_LEVEL=9)
+    @patch('fastparquet.write')
+    def test_write_compression_level_from_settings(self, write):
+        with tempfile.TemporaryDirectory() as dirname:
+            parquet.write(os.path.join(dirname, 'x.dat'),
+                          pd.DataFrame({'A': [1]}))
+        self.assertEqual(write.call_args[1]['compression'], {
+            '_default': {'type': 'GZIP', 'args': {'compresslevel': 9}},
+        })
+
+    def test_write_dictionary_encode_few_values(self):
+        table = pd.DataFrame({
+            'A': ['x', 'y', 'x', 'x'],  # 2 distinct values: encode
+            'B': ['a', 'b', 'c', 'a'],  # 3 distinct values: don't
+        })
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, table, dictionary_max_fraction=0.5)
+            result = parquet.read(tf.name)
+        self.assertEqual(result['A'].dtype, 'category')
+        self.assertEqual(result['B'].dtype, object)
+        self.assertEqual(list(result['A']), ['x', 'y', 'x', 'x'])
+
+    @override_settings(PARQUET_DICTIONARY_MAX_FRACTION=0.5)
+    def test_write_dictionary_encode_off(self):
+        table = pd.DataFrame({'A': ['x', 'x', 'x', 'x']})
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, table, dictionary_max_fraction=None)
+            result = parquet.read(tf.name)
+        self.assertEqual(result['A'].dtype, object)
+
+    @override_settings(PARQUET_DICTIONARY_MAX_FRACTION=0.5)
+    def test_write_dictionary_encode_from_settings(self):
+        table = pd.DataFrame({'A': ['x', 'x', 'x', 'x']})
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, table)
+            result = parquet.read(tf.name)
+        self.assertEqual(result['A'].dtype, 'category')
+
+    def test_categorical_round_trip(self):
+        table = pd.DataFrame({
+            'A': pd.Categorical(['b', 'a', 'c', 'b'],
+                                categories=['c', 'b', 'a'], ordered=True),
+        })
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, table)
+            assert_frame_equal(parquet.read(tf.name), table)
+
+    @patch('server.parquet.RowGroupNRows', 2)
+    def test_categorical_round_trip_read_rows(self):
+        table = pd.DataFrame({
+            'A': pd.Categorical(['b', 'a', 'c', 'b'],
+                                categories=['c', 'b', 'a']),
+        })
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, table)
+            result = parquet.read_rows(tf.name, None, 1, 4)
+        assert_frame_equal(result, table[1:4].reset_index(drop=True))
+
+    @patch('server.parquet.RowGroupNRows', 2)
+    def test_ordered_categorical_round_trip_read_rows(self):
+        table = pd.DataFrame({
+            'A': pd.Categorical(['b', 'a', 'c', 'b'],
+                                categories=['c', 'b', 'a'], ordered=True),
+        })
+        with tempfile.NamedTemporaryFile() as tf:
+            parquet.write(tf.name, table)
+            result = parquet.read_rows(tf.name, None, 0, 4)
+        assert_frame_equal(result, table)
+
+    def test_concat_row_groups_keeps_category_order(self):
+        # Another writer's row groups may have different dictionaries
+        result = parquet._concat_row_groups([
+            pd.DataFrame({'A': pd.Categorical(['b'], categories=['c', 'b'])}),
+            pd.DataFrame({'A': pd.Categorical(['a'], categories=['a'])}),
+        ])
+        self.assertEqual(list(result['A'].cat.categories), ['c', 'b', 'a'])
+        self.assertEqual(list(result['A']), ['b', 'a'])
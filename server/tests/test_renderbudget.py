@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+import pandas as pd
+from server.renderbudget import OverBudget, RenderBudget, Reservation, \
+        table_nbytes
+
+
+class RenderBudgetTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        super().tearDown()
+
+    def test_table_nbytes_counts_strings(self):
+        short = pd.DataFrame({'A': ['x'] * 10})
+        long = pd.DataFrame({'A': ['x' * 1000] * 10})
+        self.assertGreater(table_nbytes(long), table_nbytes(short) + 9000)
+
+    def test_peak_bytes_without_budget(self):
+        async def inner():
+            reservation = Reservation(None, 100)
+            async with reservation:
+                reservation.add(50)
+            return reservation.peak_bytes
+
+        self.assertEqual(self.loop.run_until_complete(inner()), 150)
+
+    def test_input_over_budget(self):
+        budget = RenderBudget(100, 1000)
+
+        async def inner():
+            async with Reservation(budget, 101):
+                pass
+
+        with self.assertRaisesRegex(OverBudget, 'limit is'):
+            self.loop.run_until_complete(inner())
+        self.assertEqual(budget.n_bytes, 0)
+
+    def test_output_over_budget(self):
+        budget = RenderBudget(100, 1000)
+
+        async def inner():
+            reservation = Reservation(budget, 60)
+            async with reservation:
+                reservation.add(60)
+
+        with self.assertRaises(OverBudget):
+            self.loop.run_until_complete(inner())
+        self.assertEqual(budget.n_bytes, 0)
+
+    def test_wait_for_worker_budget(self):
+        budget = RenderBudget(100, 150)
+        order = []
+
+        async def render(name, n_bytes):
+            async with Reservation(budget, n_bytes):
+                order.append(name + ' start')
+                await asyncio.sleep(0)
+                order.append(name + ' end')
+
+        async def inner():
+            await asyncio.gather(render('a', 100), render('b', 100))
+
+        self.loop.run_until_complete(inner())
+        self.assertEqual(order, ['a start', 'a end', 'b start', 'b end'])
+        self.assertEqual(budget.n_bytes, 0)
+
+    def test_share_worker_budget(self):
+        budget = RenderBudget(100, 200)
+        n_running = 0
+        max_running = 0
+
+        async def render():
+            nonlocal n_running, max_running
+            async with Reservation(budget, 100):
+                n_running += 1
+                max_running = max(max_running, n_running)
+                await asyncio.sleep(0)
+                n_running -= 1
+
+        async def inner():
+            await asyncio.gather(render(), render(), render())
+
+        self.loop.run_until_complete(inner())
+        self.assertEqual(max_running, 2)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from server import renderpool
+from server.models import LoadedModule
+from server.modules.types import ProcessResult
+from server.renderpool import RenderPool
+from server.tests import renderchild_hang
+from server.tests.modules.util import MockParams
+
+
+def _module(id_name='NOP'):
+    return LoadedModule.for_id_name_and_version_sync(id_name, 'internal')
+
+
+class RenderPoolTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self._old_loop = asyncio.get_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(self._old_loop)
+        self.loop.close()
+        super().tearDown()
+
+    def _render(self, pool, table, fetch_result=None, module=None,
+                params=None):
+        return self.loop.run_until_complete(
+            pool.render(module or _module(), params or MockParams(), table,
+                        fetch_result)
+        )
+
+    def test_render_table(self):
+        pool = RenderPool(1)
+        pool.start()
+        try:
+            result = self._render(pool, pd.DataFrame({'A': [1, 2],
+                                                      'B': ['x', 'y']}))
+        finally:
+            pool.close()
+
+        self.assertEqual(result.error, '')
+        assert_frame_equal(result.dataframe,
+                           pd.DataFrame({'A': [1, 2], 'B': ['x', 'y']}))
+
+    def test_hand_off_keeps_dtypes(self):
+        table = pd.DataFrame({
+            'A': ['x', 'x', 'x', 'x'],
+            'B': pd.Series(['y', 'z', 'y', 'y'], dtype='category'),
+        })
+        with tempfile.TemporaryDirectory() as dirname:
+            path = renderpool._write_table(os.path.join(dirname, 'x.dat'),
+                                           table)
+            assert_frame_equal(renderpool._read_table(path), table)
+            self.assertFalse(os.path.exists(path))
+
+    def test_render_empty_table(self):
+        pool = RenderPool(1)
+        pool.start()
+        try:
+            result = self._render(pool, pd.DataFrame())
+        finally:
+            pool.close()
+
+        self.assertEqual(result, ProcessResult())
+
+    def test_render_fetch_result(self):
+        pool = RenderPool(1)
+        pool.start()
+        try:
+            fetch_result = ProcessResult(pd.DataFrame({'A': [1]}), 'warning')
+            result = self._render(pool, pd.DataFrame(), fetch_result,
+                                  module=_module('loadurl'),
+                                  params=MockParams(has_header=True))
+        finally:
+            pool.close()
+
+        self.assertEqual(result, fetch_result)
+
+    def test_recycle_process_over_max_rss(self):
+        # max_rss_bytes=1: every render puts the child over its limit
+        pool = RenderPool(1, max_rss_bytes=1)
+        pool.start()
+        try:
+            pid1 = pool._idle._queue[0].pid
+            result1 = self._render(pool, pd.DataFrame({'A': [1]}))
+            pid2 = pool._idle._queue[0].pid
+            result2 = self._render(pool, pd.DataFrame({'A': [2]}))
+        finally:
+            pool.close()
+
+        self.assertNotEqual(pid1, pid2)
+        assert_frame_equal(result1.dataframe, pd.DataFrame({'A': [1]}))
+        assert_frame_equal(result2.dataframe, pd.DataFrame({'A': [2]}))
+
+    def test_cancel_replaces_child(self):
+        pool = RenderPool(1)
+        # Spawn a child that never replies
+        with patch('server.renderchild.main', renderchild_hang.main):
+            pool.start()
+        try:
+            pid1 = pool._idle._queue[0].pid
+            with self.assertRaises(asyncio.TimeoutError):
+                self.loop.run_until_complete(asyncio.wait_for(
+                    pool.render(_module(), MockParams(),
+                                pd.DataFrame({'A': [1]}), None),
+                    0.5
+                ))
+            # The child is replaced in the background
+            child = self.loop.run_until_complete(pool._idle.get())
+            pool._idle.put_nowait(child)
+            result = self._render(pool, pd.DataFrame({'A': [1]}))
+        finally:
+            pool.close()
+
+        self.assertNotEqual(child.pid, pid1)
+        assert_frame_equal(result.dataframe, pd.DataFrame({'A': [1]}))
@@ -0,0 +1,61 @@
+import unittest
+import pandas as pd
+from server.modules.types import ProcessResult
+from server.resultcache import ResultCache
+
+
+def _result(n_rows: int) -> ProcessResult:
+    return ProcessResult(pd.DataFrame({'A': range(n_rows)}))
+
+
+def _nbytes(result: ProcessResult) -> int:
+    return int(result.dataframe.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_get_miss(self):
+        cache = ResultCache(1024 * 1024)
+        self.assertIsNone(cache.get(1, 2))
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_get_hit(self):
+        cache = ResultCache(1024 * 1024)
+        cache.put(1, 2, _result(3))
+        self.assertEqual(cache.get(1, 2), _result(3))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 0)
+
+    def test_get_other_delta_id(self):
+        cache = ResultCache(1024 * 1024)
+        cache.put(1, 2, _result(3))
+        self.assertIsNone(cache.get(1, 3))
+
+    def test_get_returns_copy(self):
+        cache = ResultCache(1024 * 1024)
+        cache.put(1, 2, _result(3))
+        cache.get(1, 2).dataframe['A'] = 4  # a module modifies its input
+        self.assertEqual(cache.get(1, 2), _result(3))
+
+    def test_evict_least_recently_used(self):
+        cache = ResultCache(_nbytes(_result(100)) * 2)
+        cache.put(1, 1, _result(100))
+        cache.put(2, 1, _result(100))
+        cache.get(1, 1)  # now 2 is least-recently used
+        cache.put(3, 1, _result(100))
+        self.assertIsNotNone(cache.get(1, 1))
+        self.assertIsNone(cache.get(2, 1))
+        self.assertIsNotNone(cache.get(3, 1))
+        self.assertEqual(cache.stats()['n_results'], 2)
+
+    def test_do_not_cache_result_bigger_than_budget(self):
+        cache = ResultCache(_nbytes(_result(100)) - 1)
+        cache.put(1, 1, _result(100))
+        self.assertIsNone(cache.get(1, 1))
+        self.assertEqual(cache.stats()['n_bytes'], 0)
+
+    def test_put_twice_counts_bytes_once(self):
+        cache = ResultCache(1024 * 1024)
+        cache.put(1, 1, _result(100))
+        cache.put(1, 1, _result(100))
+        self.assertEqual(cache.stats()['n_bytes'], _nbytes(_result(100)))
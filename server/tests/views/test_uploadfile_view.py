@@ -8,7 +8,7 @@ from pandas.testing import assert_frame_equal
 from rest_framework import status
 from rest_framework.test import force_authenticate, APIRequestFactory
 from server import rabbitmq
-from server.models import UploadedFile, User
+from server.models import StoredObject, UploadedFile, User
 from server.views.UploadedFileView import get_uploadedfile
 from server.views import uploads
 from server.tests.utils import load_and_add_module, LoggedInTestCase
@@ -110,3 +110,16 @@ class UploadFileViewTests(LoggedInTestCase):
             'our-bucket',
             'eb785452-f0f2-4ebe-97ce-e225e346148e.xlsx'
         )
+
+    def test_get_uploadedfile_null_metadata(self):
+        # `save` stores `null` for metadata that doesn't fit
+        stored_object = StoredObject.objects.create(wf_module=self.wfm,
+                                                    metadata='null')
+        self.wfm.stored_data_version = stored_object.stored_at
+        self.wfm.save()
+
+        request = self.factory.get(f'/api/uploadfile/{self.wfm.id}')
+        self._augment_request(request, self.user)
+        response = get_uploadedfile(request, self.wfm.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), [])
@@ -488,3 +488,104 @@ class WfModuleTests(LoggedInTestCase):
         self.assertEqual(json.loads(response.content), {
             'error': 'column "C" not found'
         })
+
+    @patch('server.columnstats.MaxNTopValues', 2)
+    def test_value_counts_more_values_than_stats_hold(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': ['a', 'b', 'b', 'a', 'c', np.nan]})
+        ))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/api/wfmodules/{self.wf_module2.id}/value-counts?column=A'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            json.loads(response.content),
+            {'values': {'a': 2, 'b': 2, 'c': 1}}
+        )
+
+    def test_column_stats(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': [1, 2, np.nan, 2]})
+        ))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/api/wfmodules/{self.wf_module2.id}/column-stats'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), {
+            'delta_id': 2,
+            'columns': {
+                'A': {
+                    'n_nulls': 1,
+                    'min': 1.0,
+                    'max': 2.0,
+                    'n_distinct': 2,
+                    'top_values': [['2.0', 2], ['1.0', 1]],
+                },
+            },
+        })
+
+    def test_value_counts_etag(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': ['a', 'b', 'b']})
+        ))
+        self.wf_module2.save()
+
+        url = f'/api/wfmodules/{self.wf_module2.id}/value-counts?column=A'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A new render means a new ETag
+        self.wf_module2.cache_render_result(3, ProcessResult(
+            pd.DataFrame({'A': ['a']})
+        ))
+        self.wf_module2.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_public_output(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': [1, 2]})
+        ))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'A\n1\n2\n')
+
+    @patch('server.websockets.ws_client_send_delta_async', async_noop)
+    @patch('server.rabbitmq.queue_render')
+    def test_public_output_renders_unwritten_table(self, queue_render):
+        queue_render.side_effect = async_noop
+        self.wf_module1.cache_render_result(1, ProcessResult(
+            pd.DataFrame({'A': [1, 2]})
+        ), materialize=False)
+        self.wf_module1.save()
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module1.id}.csv'
+        )
+
+        # Not an empty table: a "retry later"
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+        # The next render writes the table -- and so will every later one
+        self.wf_module1.refresh_from_db()
+        self.assertTrue(self.wf_module1.materialize_output)
+        self.assertIsNone(self.wf_module1.get_cached_render_result())
+        queue_render.assert_called_with(self.workflow.id,
+                                        self.workflow.last_delta_id)
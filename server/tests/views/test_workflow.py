@@ -5,7 +5,9 @@ from allauth.account.utils import user_display
 from django.contrib.auth.models import AnonymousUser
 from rest_framework import status
 from rest_framework.test import APIRequestFactory, force_authenticate
+import pandas as pd
 from server.models import Module, ModuleVersion, User, WfModule, Workflow
+from server.modules.types import ProcessResult
 from server.tests.utils import LoggedInTestCase, add_new_module_version, \
         add_new_wf_module, load_module_version
 from server.views import workflow_list, workflow_addmodule, workflow_detail, \
@@ -451,3 +453,29 @@ class WorkflowViewTests(LoggedInTestCase):
         self.assertIs(response.status_code, status.HTTP_204_NO_CONTENT)
         workflow.refresh_from_db()
         self.assertEqual(workflow.selected_wf_module, 808)
+
+    @patch('server.websockets.ws_client_send_delta_async', async_noop)
+    @patch('server.rabbitmq.queue_render')
+    def test_workflow_selected_wf_module_post_renders_unwritten_table(
+        self,
+        queue_render
+    ):
+        queue_render.side_effect = async_noop
+        workflow = Workflow.objects.get(name='Workflow 1')
+        wf_module = workflow.wf_modules.create(order=0,
+                                               last_relevant_delta_id=1)
+        wf_module.cache_render_result(1, ProcessResult(
+            pd.DataFrame({'A': [1]})
+        ), materialize=False)
+        wf_module.save()
+
+        request = self._build_post('/api/workflows/%d' % workflow.id,
+                                   {'selected_wf_module': 0},
+                                   user=self.user)
+        response = workflow_detail(request, workflow_id=workflow.id)
+        self.assertIs(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        # Forget the result, so the render will write the table
+        wf_module.refresh_from_db()
+        self.assertIsNone(wf_module.get_cached_render_result())
+        queue_render.assert_called_with(workflow.id, workflow.last_delta_id)
@@ -45,7 +45,8 @@ class FetchTests(DbTestCase):
         with self.assertLogs(fetch.__name__, logging.DEBUG):
             async_to_sync(fetch.fetch_wf_module)(wf_module, now)
 
-        save_result.assert_called_with(wf_module, result)
+        save_result.assert_called_with(wf_module, result, None,
+                                       stored_object_json_is_validators=True)
 
         wf_module.refresh_from_db()
         self.assertEqual(wf_module.last_update_check, now)
@@ -209,6 +210,38 @@ class FetchTests(DbTestCase):
 
         self._test_fetch(fetch, wfm2)
 
+    @patch('server.rabbitmq.queue_render')
+    def test_fetch_get_input_dataframe_not_materialized(self, queue_render):
+        queue_render.return_value = future_none
+        table = pd.DataFrame({'A': [1]})
+
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        wfm1 = workflow.wf_modules.create(order=0,
+                                          last_relevant_delta_id=delta.id)
+        wfm1.cache_render_result(delta.id, ProcessResult(table),
+                                 materialize=False)
+        wfm1.save()
+        wfm2 = workflow.wf_modules.create(order=1)
+
+        raised = []
+
+        async def fetch_impl(params, *, get_input_dataframe, **kwargs):
+            try:
+                await get_input_dataframe()
+            except fetch.InputNotRendered:
+                raised.append(True)
+
+        self._test_fetch(fetch_impl, wfm2)
+
+        # We don't fetch from an empty table; we render the input again,
+        # and write it to disk this time.
+        self.assertEqual(raised, [True])
+        wfm1.refresh_from_db()
+        self.assertTrue(wfm1.materialize_output)
+        self.assertIsNone(wfm1.cached_render_result_delta_id)
+        queue_render.assert_called_with(workflow.id, delta.id)
+
     def test_fetch_get_input_dataframe_race_delete_this_wf_module(self):
         table = pd.DataFrame({'A': [1]})
 
@@ -312,6 +345,58 @@ class FetchTests(DbTestCase):
 
         self._test_fetch(fetch, wf_module)
 
+    def test_fetch_get_stored_metadata_happy_path(self):
+        workflow = Workflow.objects.create()
+        wf_module = workflow.wf_modules.create(order=0)
+        wf_module.store_fetched_table_if_different(pd.DataFrame({'A': [1]}),
+                                                   metadata='{"etag": "x"}')
+
+        async def fetch(params, *, get_stored_metadata, **kwargs):
+            self.assertEqual(await get_stored_metadata(), {'etag': 'x'})
+
+        self._test_fetch(fetch, wf_module)
+
+    def test_fetch_get_stored_metadata_after_fetch_error(self):
+        # The user sees an error: don't let the module skip the next fetch
+        workflow = Workflow.objects.create()
+        wf_module = workflow.wf_modules.create(order=0, fetch_error='oops')
+        wf_module.store_fetched_table_if_different(pd.DataFrame({'A': [1]}),
+                                                   metadata='{"etag": "x"}')
+
+        async def fetch(params, *, get_stored_metadata, **kwargs):
+            self.assertIsNone(await get_stored_metadata())
+
+        self._test_fetch(fetch, wf_module)
+
+    def test_fetch_get_stored_metadata_no_stored_object(self):
+        workflow = Workflow.objects.create()
+        wf_module = workflow.wf_modules.create(order=0)
+
+        async def fetch(params, *, get_stored_metadata, **kwargs):
+            self.assertIsNone(await get_stored_metadata())
+
+        self._test_fetch(fetch, wf_module)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.worker.save.save_result_if_changed')
+    def test_fetch_save_result_json(self, save, load):
+        result = ProcessResult(pd.DataFrame({'A': [1]}), json={'etag': 'x'})
+
+        async def fake_fetch(*args, **kwargs):
+            return result
+
+        load.return_value = Mock(LoadedModule)
+        load.return_value.fetch.side_effect = fake_fetch
+        save.return_value = future_none
+
+        workflow = Workflow.objects.create()
+        wf_module = workflow.wf_modules.create(order=0)
+        wf_module.save = Mock()
+
+        async_to_sync(fetch.fetch_wf_module)(wf_module, timezone.now())
+
+        save.assert_called_with(wf_module, result, {'etag': 'x'})
+
     def test_fetch_workflow_id(self):
         workflow = Workflow.objects.create()
         wf_module = workflow.wf_modules.create(order=0)
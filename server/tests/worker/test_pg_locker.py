@@ -1,3 +1,4 @@
+import asyncio
 from asgiref.sync import async_to_sync
 from server.tests.utils import DbTestCase
 from server.worker.pg_locker import PgLocker, WorkflowAlreadyLocked
@@ -9,12 +10,52 @@ class PgLockerTest(DbTestCase):
             async with PgLocker() as locker1:
                 async with PgLocker() as locker2:
                     async with locker1.render_lock(1):
-                        with self.assertRaises(WorkflowAlreadyLocked):
+                        with self.assertRaises(WorkflowAlreadyLocked) as cm:
                             async with locker2.render_lock(1):
                                 pass
+                        # It names the holder
+                        self.assertEqual(cm.exception.holder_pid,
+                                         locker1.pid)
 
                     # do not raise WorkflowAlreadyLocked here
                     async with locker2.render_lock(1):
                         pass
 
         async_to_sync(inner)()
+
+    def test_render_different_workflows_concurrently(self):
+        async def render(locker, workflow_id, started, finish):
+            async with locker.render_lock(workflow_id):
+                started.set()
+                await finish.wait()
+
+        async def inner():
+            async with PgLocker() as locker:
+                started1 = asyncio.Event()
+                started2 = asyncio.Event()
+                finish = asyncio.Event()
+                task1 = asyncio.ensure_future(render(locker, 1, started1,
+                                                     finish))
+                task2 = asyncio.ensure_future(render(locker, 2, started2,
+                                                     finish))
+                # Both renders hold their locks at once
+                await asyncio.wait_for(started1.wait(), 1)
+                await asyncio.wait_for(started2.wait(), 1)
+                finish.set()
+                await asyncio.gather(task1, task2)
+
+                # ... and released them
+                async with locker.render_lock(1):
+                    pass
+
+        async_to_sync(inner)()
+
+    def test_same_workflow_twice_in_one_process(self):
+        async def inner():
+            async with PgLocker() as locker:
+                async with locker.render_lock(1):
+                    with self.assertRaises(WorkflowAlreadyLocked):
+                        async with locker.render_lock(1):
+                            pass
+
+        async_to_sync(inner)()
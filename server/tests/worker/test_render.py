@@ -1,26 +1,29 @@
 import asyncio
 from contextlib import contextmanager
-from unittest.mock import patch
+import time
+from unittest.mock import ANY, patch
 from asgiref.sync import async_to_sync
 import msgpack
 from server import execute
 from server.models import Workflow
 from server.models.commands import InitWorkflowCommand
 from server.tests.utils import DbTestCase
-from server.worker.render import handle_render, render_or_reschedule
+from server.worker import render
+from server.worker.render import cancel_stale_render, coalesce_render, \
+        handle_coalesce_render, handle_render, render_or_coalesce
 from server.worker.pg_locker import WorkflowAlreadyLocked
+from server.worker.render_slots import Interactive
 
 
 future_none = asyncio.Future()
 future_none.set_result(None)
 
 
-class Rescheduler:
-    def __init__(self):
-        self.calls = []
+HolderPid = 4321  # Postgres backend PID of the lock holder
 
-    async def reschedule(self, *args):
-        self.calls.append(args)
+
+class FakePgLocker:
+    pid = HolderPid
 
 
 class SuccessfulRenderLocker:
@@ -47,7 +50,7 @@ class FailedRenderLocker:
         return cls(workflow_id)
 
     async def __aenter__(self):
-        raise WorkflowAlreadyLocked
+        raise WorkflowAlreadyLocked(HolderPid)
 
     async def __aexit__(self, exc_type, exc, tb):
         pass
@@ -66,7 +69,7 @@ class WorkerTest(DbTestCase):
 
         async def inner():
             with self.assertLogs('server.worker', level='INFO') as cm:
-                await handle_render(None, None, FakeRender())
+                await handle_render(None, None, Interactive, FakeRender())
                 self.assertEqual(cm.output, [
                     ('INFO:server.worker.render:Ignoring invalid render '
                      'request. Expected {workflow_id:int, delta_id:int}; got '
@@ -76,55 +79,171 @@ class WorkerTest(DbTestCase):
         async_to_sync(inner)()
 
     @patch('server.execute.execute_workflow')
-    def test_render_or_reschedule_render(self, execute):
+    def test_render_or_coalesce_render(self, execute):
         execute.return_value = future_none
         workflow = Workflow.objects.create()
         delta = InitWorkflowCommand.create(workflow)
-        rescheduler = Rescheduler()
 
         async def inner():
             with self.assertLogs():
-                await render_or_reschedule(SuccessfulRenderLocker,
-                                           rescheduler.reschedule,
-                                           workflow.id, delta.id)
+                await render_or_coalesce(SuccessfulRenderLocker, workflow.id,
+                                         delta.id)
 
         async_to_sync(inner)()
 
-        execute.assert_called_with(workflow)
-        self.assertEqual(rescheduler.calls, [])
+        execute.assert_called_with(workflow, ANY)
+        self.assertEqual(render._locked_workflows, set())
 
+    @patch('server.rabbitmq.coalesce_render')
     @patch('server.execute.execute_workflow')
-    def test_render_or_reschedule_reschedule(self, execute):
+    def test_render_or_coalesce_locked_elsewhere(self, execute,
+                                                 rabbitmq_coalesce):
         execute.return_value = future_none
+        rabbitmq_coalesce.return_value = future_none
         workflow = Workflow.objects.create()
         delta = InitWorkflowCommand.create(workflow)
-        rescheduler = Rescheduler()
 
         async def inner():
             with self.assertLogs('server.worker', level='INFO') as cm:
-                await render_or_reschedule(FailedRenderLocker,
-                                           rescheduler.reschedule,
-                                           workflow.id, delta.id)
+                await render_or_coalesce(FailedRenderLocker, workflow.id,
+                                         delta.id)
                 self.assertEqual(cm.output, [
                     (f'INFO:server.worker.render:Workflow {workflow.id} is '
-                     'being rendered elsewhere; rescheduling'),
+                     'being rendered elsewhere; coalescing'),
                 ])
 
         async_to_sync(inner)()
 
         execute.assert_not_called()
-        self.assertEqual(rescheduler.calls, [(workflow.id, delta.id)])
+        rabbitmq_coalesce.assert_called_with(workflow.id, delta.id,
+                                             HolderPid)
+
+    @patch('server.execute.execute_workflow')
+    def test_render_or_coalesce_render_pending_delta_next(self, execute):
+        workflow = Workflow.objects.create()
+        delta1 = InitWorkflowCommand.create(workflow)
+        delta2 = None
+        cancels = []
+
+        async def fake_execute(workflow, cancel):
+            nonlocal delta2
+            cancels.append(cancel)
+            if delta2 is None:
+                # While we render, somebody requests a newer delta
+                delta2 = InitWorkflowCommand.create(workflow)
+                self.assertTrue(coalesce_render(workflow.id, delta2.id))
+                self.assertTrue(cancel.is_set())
+
+        execute.side_effect = fake_execute
+
+        async def inner():
+            with self.assertLogs():
+                await render_or_coalesce(SuccessfulRenderLocker, workflow.id,
+                                         delta1.id)
+
+        async_to_sync(inner)()
+
+        self.assertEqual(execute.call_count, 2)  # one render per delta
+        self.assertFalse(cancels[1].is_set())
+        self.assertEqual(render._pending_renders, {})
+
+    @patch('server.rabbitmq.queue_render')
+    @patch('server.execute.execute_workflow')
+    def test_render_or_coalesce_requeue_if_unlocked(self, execute,
+                                                    queue_render):
+        queue_render.return_value = future_none
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+
+        class JustUnlockedLocker(FailedRenderLocker):
+            async def __aenter__(self):
+                raise WorkflowAlreadyLocked(None)
+
+        async def inner():
+            with self.assertLogs('server.worker', level='INFO'):
+                await render_or_coalesce(JustUnlockedLocker, workflow.id,
+                                         delta.id)
+
+        async_to_sync(inner)()
+
+        execute.assert_not_called()
+        queue_render.assert_called_with(workflow.id, delta.id)
+
+    def test_handle_render_coalesces_without_a_slot(self):
+        class FakeRender:
+            @contextmanager
+            def process(self):
+                yield
+
+            body = msgpack.packb({'workflow_id': 1, 'delta_id': 3})
+
+        async def inner():
+            with self.assertLogs('server.worker', level='INFO'):
+                # render_slots=None: taking a slot would crash
+                await handle_render(None, None, Interactive, FakeRender())
+
+        with patch.object(render, '_locked_workflows', {1}):
+            with patch.dict(render._pending_renders, {}, clear=True):
+                async_to_sync(inner)()
+                self.assertEqual(render._pending_renders, {1: 3})
+
+    def test_coalesce_render_not_locked(self):
+        self.assertFalse(coalesce_render(12345, 1))
+        self.assertEqual(render._pending_renders, {})
+
+    @patch('server.rabbitmq.queue_render')
+    def test_handle_coalesce_render_recently_unlocked(self, queue_render):
+        queue_render.return_value = future_none
+
+        class FakeMessage:
+            body = msgpack.packb({'workflow_id': 1, 'delta_id': 2,
+                                  'holder_pid': HolderPid})
+
+        async def inner():
+            await handle_coalesce_render(FakePgLocker, FakeMessage())
+
+        with patch.dict(render._recently_unlocked, {1: time.monotonic()}):
+            async_to_sync(inner)()
 
-    def test_render_or_reschedule_wrong_delta_id(self):
-        rescheduler = Rescheduler()
+        queue_render.assert_called_with(1, 2)
+
+    @patch('server.rabbitmq.queue_render')
+    def test_handle_coalesce_render_ignore_other_holder(self, queue_render):
+        class FakeMessage:
+            body = msgpack.packb({'workflow_id': 1, 'delta_id': 2,
+                                  'holder_pid': HolderPid + 1})
+
+        async def inner():
+            await handle_coalesce_render(FakePgLocker, FakeMessage())
+
+        # We held the lock recently, but somebody else holds it now
+        with patch.dict(render._recently_unlocked, {1: time.monotonic()}):
+            async_to_sync(inner)()
+
+        queue_render.assert_not_called()
+
+    @patch('server.rabbitmq.queue_render')
+    def test_handle_coalesce_render_ignore_other_workflow(self,
+                                                          queue_render):
+        class FakeMessage:
+            body = msgpack.packb({'workflow_id': 1, 'delta_id': 2})
+
+        async def inner():
+            await handle_coalesce_render(FakePgLocker, FakeMessage())
+
+        with patch.dict(render._recently_unlocked, {}, clear=True):
+            async_to_sync(inner)()
+
+        queue_render.assert_not_called()
+
+    def test_render_or_coalesce_wrong_delta_id(self):
         workflow = Workflow.objects.create()
         delta = InitWorkflowCommand.create(workflow)
 
         async def inner():
             with self.assertLogs('server.worker', level='INFO') as cm:
-                await render_or_reschedule(SuccessfulRenderLocker,
-                                           rescheduler.reschedule,
-                                           workflow.id, delta.id - 1)
+                await render_or_coalesce(SuccessfulRenderLocker, workflow.id,
+                                         delta.id - 1)
                 self.assertEqual(cm.output, [
                     (f'INFO:server.worker.render:Ignoring stale render request'
                      f' {delta.id - 1} for Workflow {workflow.id}'),
@@ -132,13 +251,10 @@ class WorkerTest(DbTestCase):
 
         async_to_sync(inner)()
 
-    def test_render_or_reschedule_workflow_not_found(self):
-        rescheduler = Rescheduler()
-
+    def test_render_or_coalesce_workflow_not_found(self):
         async def inner():
             with self.assertLogs('server.worker', level='INFO') as cm:
-                await render_or_reschedule(SuccessfulRenderLocker,
-                                           rescheduler.reschedule, 12345, 1)
+                await render_or_coalesce(SuccessfulRenderLocker, 12345, 1)
                 self.assertEqual(cm.output, [
                     ('INFO:server.worker.render:Skipping render of deleted '
                      'Workflow 12345'),
@@ -147,17 +263,15 @@ class WorkerTest(DbTestCase):
         async_to_sync(inner)()
 
     @patch('server.execute.execute_workflow')
-    def test_render_or_reschedule_aborted(self, mock_execute):
+    def test_render_or_coalesce_aborted(self, mock_execute):
         mock_execute.side_effect = execute.UnneededExecution
         workflow = Workflow.objects.create()
         delta = InitWorkflowCommand.create(workflow)
-        rescheduler = Rescheduler()
 
         async def inner():
             with self.assertLogs('server.worker', level='INFO') as cm:
-                await render_or_reschedule(SuccessfulRenderLocker,
-                                           rescheduler.reschedule,
-                                           workflow.id, delta.id)
+                await render_or_coalesce(SuccessfulRenderLocker, workflow.id,
+                                         delta.id)
                 self.assertEqual(cm.output, [
                     ('INFO:server.worker.render:UnneededExecution in '
                      f'execute_workflow({workflow.id})')
@@ -167,5 +281,21 @@ class WorkerTest(DbTestCase):
         loop.run_until_complete(inner())
         loop.close()
 
-        # Don't reschedule: it is _unneeded_ execution.
-        self.assertEqual(rescheduler.calls, [])
+    def test_cancel_stale_render(self):
+        cancel = asyncio.Event(loop=asyncio.new_event_loop())
+        with patch.dict(render._running_renders, {1: (2, cancel)}):
+            with self.assertLogs('server.worker', level='INFO'):
+                cancel_stale_render(1, 3)
+        self.assertTrue(cancel.is_set())
+
+    def test_cancel_stale_render_ignore_same_delta(self):
+        cancel = asyncio.Event(loop=asyncio.new_event_loop())
+        with patch.dict(render._running_renders, {1: (2, cancel)}):
+            cancel_stale_render(1, 2)
+        self.assertFalse(cancel.is_set())
+
+    def test_cancel_stale_render_ignore_other_workflow(self):
+        cancel = asyncio.Event(loop=asyncio.new_event_loop())
+        with patch.dict(render._running_renders, {1: (2, cancel)}):
+            cancel_stale_render(2, 3)
+        self.assertFalse(cancel.is_set())
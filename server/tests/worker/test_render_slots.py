@@ -0,0 +1,92 @@
+import asyncio
+import time
+import unittest
+from server.worker.render_slots import Background, Interactive, RenderSlots
+
+
+class RenderSlotsTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        super().tearDown()
+
+    def test_interactive_before_background(self):
+        slots = RenderSlots(1)
+        order = []
+
+        async def render(name, priority):
+            async with slots.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        async def inner():
+            await slots.acquire(Interactive)  # fill the only slot
+            tasks = [
+                asyncio.ensure_future(render('background1', Background)),
+                asyncio.ensure_future(render('interactive1', Interactive)),
+                asyncio.ensure_future(render('background2', Background)),
+                asyncio.ensure_future(render('interactive2', Interactive)),
+            ]
+            await asyncio.sleep(0)  # let them all wait
+            self.assertEqual(slots.n_waiting(Background), 2)
+            self.assertEqual(slots.n_waiting(Interactive), 2)
+            slots.release()
+            await asyncio.gather(*tasks)
+
+        self.loop.run_until_complete(inner())
+        self.assertEqual(order, ['interactive1', 'interactive2',
+                                 'background1', 'background2'])
+
+    def test_run_up_to_n_at_once(self):
+        slots = RenderSlots(2)
+        n_running = 0
+        max_running = 0
+
+        async def render():
+            nonlocal n_running, max_running
+            async with slots.slot(Interactive):
+                n_running += 1
+                max_running = max(max_running, n_running)
+                await asyncio.sleep(0)
+                n_running -= 1
+
+        async def inner():
+            await asyncio.gather(*[render() for _ in range(5)])
+
+        self.loop.run_until_complete(inner())
+        self.assertEqual(max_running, 2)
+        self.assertEqual(slots.n_free, 2)
+
+    def test_cancel_waiting_render(self):
+        slots = RenderSlots(1)
+
+        async def inner():
+            await slots.acquire(Interactive)
+            task = asyncio.ensure_future(slots.acquire(Background))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(slots.n_waiting(Background), 0)
+            slots.release()
+
+        self.loop.run_until_complete(inner())
+        self.assertEqual(slots.n_free, 1)
+
+    def test_record_wait(self):
+        slots = RenderSlots(1)
+
+        async def inner():
+            async with slots.slot(Background, time.time() - 2):
+                pass
+
+        self.loop.run_until_complete(inner())
+        stats = slots.wait_stats[Background].to_dict()
+        self.assertEqual(stats['n_renders'], 1)
+        self.assertGreaterEqual(stats['max_wait_ms'], 2000)
+        self.assertEqual(slots.wait_stats[Interactive].to_dict()['n_renders'],
+                         0)
@@ -34,6 +34,63 @@ class SaveTests(DbTestCase):
         async_to_sync(save_result_if_changed)(self.wfm, ProcessResult(table))
         self.assertEqual(StoredObject.objects.count(), 2)
 
+    def test_store_stored_object_json(self):
+        workflow = Workflow.objects.create()
+        wfm = workflow.wf_modules.create(order=0)
+
+        async_to_sync(save_result_if_changed)(wfm, ProcessResult(
+            mock_csv_table
+        ), {'etag': 'x'})
+
+        self.assertEqual(StoredObject.objects.get().metadata,
+                         '{"etag": "x"}')
+
+    def test_same_table_new_validators(self):
+        workflow = Workflow.objects.create()
+        wfm = workflow.wf_modules.create(order=0)
+
+        async_to_sync(save_result_if_changed)(
+            wfm, ProcessResult(mock_csv_table), {'etag': 'x'},
+            stored_object_json_is_validators=True
+        )
+        async_to_sync(save_result_if_changed)(
+            wfm, ProcessResult(mock_csv_table), {'etag': 'y'},
+            stored_object_json_is_validators=True
+        )
+
+        # The next fetch compares against the new ETag
+        self.assertEqual(StoredObject.objects.get().metadata,
+                         '{"etag": "y"}')
+
+    def test_same_table_new_upload_keeps_metadata(self):
+        workflow = Workflow.objects.create()
+        wfm = workflow.wf_modules.create(order=0)
+
+        async_to_sync(save_result_if_changed)(
+            wfm, ProcessResult(mock_csv_table),
+            [{'uuid': 'a', 'name': 'a.csv'}]
+        )
+        async_to_sync(save_result_if_changed)(
+            wfm, ProcessResult(mock_csv_table),
+            [{'uuid': 'b', 'name': 'b.csv'}]
+        )
+
+        # The stored version still names the file it came from
+        self.assertEqual(StoredObject.objects.get().metadata,
+                         '[{"uuid": "a", "name": "a.csv"}]')
+
+    def test_drop_stored_object_json_too_long_for_metadata(self):
+        workflow = Workflow.objects.create()
+        wfm = workflow.wf_modules.create(order=0)
+
+        with self.assertLogs('server.worker.save'):
+            async_to_sync(save_result_if_changed)(wfm, ProcessResult(
+                mock_csv_table
+            ), {'etag': 'x' * 300})
+
+        # The table is stored; the metadata isn't
+        self.assertEqual(StoredObject.objects.get().metadata, 'null')
+
     @override_settings(MAX_STORAGE_PER_MODULE=1000)
     def test_storage_limits(self):
         workflow = Workflow.objects.create()
@@ -0,0 +1,26 @@
+import json
+import unittest
+from server.models import StoredObject, UploadedFile
+from server.worker.upload_DELETEME import _stored_object_json
+
+
+Uuid = 'eb785452-f0f2-4ebe-97ce-e225e346148e'
+
+
+class StoredObjectJsonTest(unittest.TestCase):
+    def test_short_name(self):
+        uploaded_file = UploadedFile(uuid=Uuid, name='x.csv')
+        self.assertEqual(_stored_object_json(uploaded_file), [{
+            'uuid': Uuid,
+            'name': 'x.csv',
+        }])
+
+    def test_truncate_long_name(self):
+        # UploadedFileView needs the uuid; `save` would store `null` if the
+        # JSON didn't fit.
+        max_length = StoredObject._meta.get_field('metadata').max_length
+        uploaded_file = UploadedFile(uuid=Uuid, name='é' * 300 + '.csv')
+        result = _stored_object_json(uploaded_file)
+        self.assertLessEqual(len(json.dumps(result)), max_length)
+        self.assertEqual(result[0]['uuid'], Uuid)
+        self.assertTrue(result[0]['name'].startswith('éé'))
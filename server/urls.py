@@ -53,6 +53,7 @@ urlpatterns = [
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/output$', views.wfmodule_output),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/embeddata$', views.wfmodule_embeddata),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/value-counts$', views.wfmodule_value_counts),
+    url(r'^api/wfmodules/(?P<pk>[0-9]+)/column-stats$', views.wfmodule_column_stats),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/dataversion/read', views.wfmodule_dataversion_read),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/dataversion', views.wfmodule_dataversion),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/notifications', views.notifications_delete_by_wfmodule),
@@ -15,7 +15,12 @@ def get_uploadedfile(request, wf_module_id):
         stored_at=wf_module.stored_data_version
     ).first()
     if so and so.metadata:
-        metadata = json.loads(so.metadata)[0]
+        metadata = json.loads(so.metadata)
+        if not metadata:
+            # `save` stores `null` for metadata that doesn't fit. We can't
+            # tell which UploadedFile it came from.
+            return JsonResponse([], safe=False)
+        metadata = metadata[0]
         try:
             uploaded_file = UploadedFile.objects.get(uuid=metadata['uuid'])
         except UploadedFile.DoesNotExist:
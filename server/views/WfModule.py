@@ -5,11 +5,11 @@ import pandas as pd
 from asgiref.sync import async_to_sync
 from django.core.exceptions import PermissionDenied
 from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, \
-        Http404, HttpResponseNotFound, JsonResponse
+        Http404, HttpResponseNotFound, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils import dateparse, timezone
+from django.utils.cache import patch_cache_control
 from django.views.decorators.clickjacking import xframe_options_exempt
-import numpy as np
 from rest_framework import status
 from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.renderers import JSONRenderer
@@ -223,23 +223,16 @@ N_COLUMNS_PER_TABLE = 101
 
 # Helper method that produces json output for a table + start/end row
 # Also silently clips row indices
-# Now reading a maximum of 101 columns directly from cache parquet
+# Now reading a maximum of 101 columns and the requested rows from the cache
 def _make_render_tuple(cached_result, startrow=None, endrow=None):
     """Build (startrow, endrow, json_rows) data."""
-    if not cached_result:
-        dataframe = pd.DataFrame()
+    if not cached_result or not cached_result.is_materialized:
+        # (If the cached data is gone because of a race, len() is 0. This
+        # probably means the user doesn't need it any more.)
+        nrows = 0
     else:
-        column_names = cached_result.column_names[:N_COLUMNS_PER_TABLE]
-        parquet_file = cached_result.parquet_file
-        if parquet_file:
-            dataframe = parquet_file.to_pandas(column_names)
-        else:
-            # There was a race: the cached data is gone.
-            #
-            # This probably means the user doesn't need it any more.
-            dataframe = pd.DataFrame()
+        nrows = len(cached_result)
 
-    nrows = len(dataframe)
     if startrow is None:
         startrow = 0
     if endrow is None:
@@ -248,7 +241,11 @@ def _make_render_tuple(cached_result, startrow=None, endrow=None):
     startrow = max(0, startrow)
     endrow = min(nrows, endrow, startrow + _MaxNRowsPerRequest)
 
-    table = dataframe[startrow:endrow]
+    if nrows:
+        column_names = cached_result.column_names[:N_COLUMNS_PER_TABLE]
+        table = cached_result.read_rows(startrow, endrow, column_names)
+    else:
+        table = pd.DataFrame()
 
     # table.to_json() renders a JSON string. It can't render a dict that we
     # encode later, so let's not even try. Just return the string.
@@ -339,7 +336,7 @@ def wfmodule_value_counts(request, pk):
 
     with wf_module.workflow.cooperative_lock():
         cached_result = wf_module.get_cached_render_result()
-        if not cached_result:
+        if not cached_result or not cached_result.is_materialized:
             # assume we'll get another request after execute finishes
             return JsonResponse({'values': {}})
 
@@ -347,18 +344,42 @@ def wfmodule_value_counts(request, pk):
             return JsonResponse({'error': f'column "{column}" not found'},
                                 status=404)
 
-        # Only load the one column
-        series = cached_result.parquet_file.to_pandas([column])[column]
+        etag = cached_result.value_counts_etag(column)
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return HttpResponseNotModified()
+
+        # We only handle string: values are converted to string. This reads
+        # an index on disk -- or, the first time, the one column.
+        value_counts = cached_result.read_value_counts(column)
+
+    response = JsonResponse({'values': value_counts})
+    response['ETag'] = etag
+    # Make the browser ask every time, so it gets the new values after a
+    # render. We'll respond 304 Not Modified if they're the same.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    # We only handle string. If it's not string, convert to string.
-    if not (series.dtype == object or hasattr(series, 'cat')):
-        t = series.astype(str)
-        t[series.isna()] = np.nan
-        series = t
 
-    value_counts = series.value_counts().to_dict()
+@api_view(['GET'])
+@renderer_classes((JSONRenderer,))
+def wfmodule_column_stats(request, pk):
+    """
+    Return null count, min, max, distinct count and top values per column.
+
+    These are computed when the render result is cached; see
+    `server.columnstats`. Respond `{"columns": null}` if there are none.
+    """
+    wf_module = _lookup_wf_module_for_read(pk, request)
+
+    cached_result = wf_module.get_cached_render_result()
+    if not cached_result:
+        # assume we'll get another request after execute finishes
+        return JsonResponse({'columns': None})
 
-    return JsonResponse({'values': value_counts})
+    return JsonResponse({
+        'delta_id': cached_result.delta_id,
+        'columns': cached_result.column_stats,
+    })
 
 
 N_ROWS_PER_TILE = 200
@@ -386,6 +407,9 @@ def wfmodule_tile(request, pk, delta_id, tile_row, tile_column):
     if not cached_result:
         return HttpResponseNotFound(f'This module has no cached result')
 
+    if not cached_result.is_materialized:
+        return HttpResponseNotFound(f'This module has no table on disk')
+
     if str(cached_result.delta_id) != delta_id:
         return HttpResponseNotFound(
             f'Requested delta {delta_id} but cached render result is '
@@ -396,20 +420,38 @@ def wfmodule_tile(request, pk, delta_id, tile_row, tile_column):
     cbegin = N_COLUMNS_PER_TILE * int(tile_column)
     cend = N_COLUMNS_PER_TILE * (int(tile_column) + 1)
 
-    # TODO handle races in the following file reads....
-    pf = cached_result.parquet_file
-    df = pf.to_pandas(columns=cached_result.column_names[cbegin:cend])
-
     rbegin = N_ROWS_PER_TILE * int(tile_row)
     rend = N_ROWS_PER_TILE * (int(tile_row) + 1)
 
-    df = df.iloc[rbegin:rend]
+    # TODO handle races in the following file reads....
+    df = cached_result.read_rows(rbegin, rend,
+                                 cached_result.column_names[cbegin:cend])
 
     json_string = df.to_json(orient='values', date_format='iso')
 
     return HttpResponse(json_string, content_type='application/json')
 
 
+def _queue_render_for_public_output(wf_module: WfModule) -> None:
+    """Show `wf_module` as busy, and render it."""
+    workflow = wf_module.workflow
+
+    async def notify():
+        await websockets.ws_client_send_delta_async(workflow.id, {
+            'updateWfModules': {
+                str(wf_module.id): {
+                    'output_status': 'busy',
+                    'cached_render_result_delta_id': None,
+                    'output_columns': None,
+                    'output_n_rows': None,
+                }
+            }
+        })
+        await rabbitmq.queue_render(workflow.id, workflow.last_delta_id)
+
+    async_to_sync(notify)()
+
+
 # Public access to wfmodule output. Basically just /render with different auth
 # and output format
 # NOTE: does not support startrow/endrow at the moment
@@ -423,7 +465,25 @@ def wfmodule_public_output(request, pk, type, format=None):
         if not cached_result:
             # assume we'll get another request after execute finishes
             return JsonResponse({})
-        result = cached_result.result  # slow
+
+        if cached_result.is_materialized:
+            result = cached_result.result  # slow
+        else:
+            # The render skipped writing the table. Render again, and from
+            # now on always write it: whoever reads this URL will be back.
+            wf_module.materialize_output = True
+            wf_module.cache_render_result(None, None)
+            wf_module.save()
+            result = None
+
+    if result is None:
+        _queue_render_for_public_output(wf_module)
+        response = JsonResponse(
+            {'error': 'This table is being rendered. Please retry.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        response['Retry-After'] = '5'
+        return response
 
     if type == 'json':
         d = result.dataframe.to_json(orient='records')
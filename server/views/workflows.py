@@ -13,7 +13,7 @@ from rest_framework.decorators import api_view
 from rest_framework.decorators import renderer_classes
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
-from server import minio, rabbitmq
+from server import minio, rabbitmq, websockets
 from server.models import Module, ModuleVersion, Workflow
 from server.models.commands import AddModuleCommand, ReorderModulesCommand, \
         ChangeWorkflowTitleCommand
@@ -201,6 +201,47 @@ def render_workflow(request: HttpRequest, workflow: Workflow):
                                 {'initState': init_state})
 
 
+def _materialize_selected_wf_module(workflow: Workflow) -> None:
+    """
+    Render the selected module's output and input again if they aren't saved.
+
+    Renders skip writing cheap intermediate tables to disk. (See
+    `server.execute._should_materialize()`.) The user wants to see these, so
+    forget their results and render: this time, the tables will be written.
+    """
+    selected = workflow.selected_wf_module
+    if selected is None:
+        return
+
+    with workflow.cooperative_lock():
+        wf_modules = list(workflow.wf_modules.filter(
+            order__in=[selected - 1, selected],
+            cached_render_result_n_rows__isnull=False
+        ))
+        for wf_module in wf_modules:
+            wf_module.cache_render_result(None, None)
+            wf_module.save()
+
+    if not wf_modules:
+        return
+
+    async def notify():
+        await websockets.ws_client_send_delta_async(workflow.id, {
+            'updateWfModules': dict(
+                (str(wf_module.id), {
+                    'output_status': 'busy',
+                    'cached_render_result_delta_id': None,
+                    'output_columns': None,
+                    'output_n_rows': None,
+                })
+                for wf_module in wf_modules
+            )
+        })
+        await rabbitmq.queue_render(workflow.id, workflow.last_delta_id)
+
+    async_to_sync(notify)()
+
+
 # Retrieve or delete a workflow instance.
 # Or reorder modules
 @api_view(['GET', 'PATCH', 'POST', 'DELETE'])
@@ -251,6 +292,7 @@ def workflow_detail(request, workflow_id, format=None):
                 workflow.selected_wf_module = \
                         request.data['selected_wf_module']
                 workflow.save(update_fields=['selected_wf_module'])
+                _materialize_selected_wf_module(workflow)
 
         except Exception as e:
             return JsonResponse({'message': str(e), 'status_code': 400},
@@ -3,11 +3,13 @@ from functools import partial
 import logging
 import os
 import aio_pika
-from server import rabbitmq
+from server import rabbitmq, renderbudget, renderpool, resultcache
 from .pg_locker import PgLocker
 from .fetch import handle_fetch
 from .upload_DELETEME import handle_upload_DELETEME
-from .render import handle_render, send_render
+from .render import handle_coalesce_render, handle_render
+from .render_slots import Background, Interactive, PriorityNames, \
+        RenderSlots
 
 
 logger = logging.getLogger(__name__)
@@ -26,6 +28,49 @@ logger = logging.getLogger(__name__)
 # for cron-render.
 NRenderers = int(os.getenv('CJW_WORKER_N_RENDERERS', 1))
 
+# RenderInProcesses: if true (the default), pre-fork NRenderers child
+# processes and render in them. Otherwise, render in threads -- which share
+# our GIL with fetchers and PgLocker heartbeats.
+RenderInProcesses = (
+    os.getenv('CJW_WORKER_RENDER_IN_PROCESSES', 'true').upper() != 'FALSE'
+)
+
+# RendererMaxRss: recycle a render process once its peak RSS exceeds this many
+# bytes. Python rarely returns freed memory to the OS, so a process that
+# rendered one huge table stays huge until it exits. 0 means "never recycle."
+#
+# Default is 2GB.
+RendererMaxRss = int(os.getenv('CJW_WORKER_RENDERER_MAX_RSS',
+                               2 * 1024 * 1024 * 1024))
+
+# ResultCacheMaxBytes: memory for recently-rendered tables. Renders read the
+# previous module's output from this cache instead of decoding Parquet. Sum of
+# DataFrame.memory_usage(deep=True) -- real usage is a bit higher. 0 means
+# "no cache."
+#
+# Default is 500MB.
+ResultCacheMaxBytes = int(os.getenv('CJW_WORKER_RESULT_CACHE_MAX_BYTES',
+                                    500 * 1024 * 1024))
+
+# RenderMaxBytes: memory one render may use for its input and output tables.
+# Sum of DataFrame.memory_usage(deep=True). Renders that need more fail with
+# an error message. 0 means "no limit."
+#
+# Default is 1GB.
+RenderMaxBytes = int(os.getenv('CJW_WORKER_RENDER_MAX_BYTES',
+                               1024 * 1024 * 1024))
+
+# RendersMaxBytes: memory all simultaneous renders may use for their input and
+# output tables. Renders wait when they'd exceed it. 0 means "no limit."
+#
+# Default is 2GB.
+RendersMaxBytes = int(os.getenv('CJW_WORKER_RENDERS_MAX_BYTES',
+                                2 * 1024 * 1024 * 1024))
+
+# RenderStatsInterval: seconds between logging render-queue depths and wait
+# times.
+RenderStatsInterval = int(os.getenv('CJW_WORKER_RENDER_STATS_INTERVAL', 60))
+
 # NFetchers: number of fetches to perform simultaneously. Fetching is
 # often I/O-heavy, and some of our dependencies use blocking calls, so we
 # allocate a thread per fetcher. Larger files may use lots of RAM.
@@ -35,9 +80,10 @@ NRenderers = int(os.getenv('CJW_WORKER_N_RENDERERS', 1))
 NFetchers = int(os.getenv('CJW_WORKER_N_FETCHERS', 3))
 
 # NUploaders: number of uploaded files to process at a time. TODO turn these
-# into fetches - https://www.pivotaltracker.com/story/show/161509317. We handle
-# the occasional 1GB+ file, which will consume ~3GB of RAM, so let's keep this
-# number at 1
+# into fetches - https://www.pivotaltracker.com/story/show/161509317. We parse
+# CSV in chunks, so a 1GB+ file costs its (categorical) table plus a chunk --
+# no longer ~3GB of RAM. Still, we handle the occasional huge file, so raise
+# this number with care.
 #
 # Default is 1: we don't expect many uploads.
 NUploaders = int(os.getenv('CJW_WORKER_N_UPLOADERS', 1))
@@ -53,12 +99,67 @@ async def consume_queue(connection, queue_name, n_consumers, callback):
 
 async def listen_for_renders(pg_locker: PgLocker,
                              connection: aio_pika.Connection,
+                             render_slots: RenderSlots,
                              n_renderers: int) -> None:
     """
     Run renders, forever.
+
+    We consume both render queues. `render_slots` limits us to `n_renderers`
+    simultaneous renders, and it starts interactive renders first.
+    """
+    render = partial(handle_render, pg_locker, render_slots, Interactive)
+    await consume_queue(connection, rabbitmq.RenderQueue, n_renderers,
+                        render)
+
+    render_background = partial(handle_render, pg_locker, render_slots,
+                                Background)
+    await consume_queue(connection, rabbitmq.BackgroundRenderQueue,
+                        n_renderers, render_background)
+
+
+async def log_render_stats(connection: aio_pika.Connection,
+                           render_slots: RenderSlots) -> None:
+    """
+    Log render-queue depths and wait times, forever.
+
+    Queue depth is the number of messages RabbitMQ hasn't delivered to any
+    worker; "waiting" is the number of delivered messages waiting for one of
+    our render slots.
+    """
+    channel = await connection.channel()
+    queue_names = {
+        Interactive: rabbitmq.RenderQueue,
+        Background: rabbitmq.BackgroundRenderQueue,
+    }
+    while True:
+        await asyncio.sleep(RenderStatsInterval)
+        for priority, queue_name in queue_names.items():
+            queue = await channel.declare_queue(queue_name, passive=True)
+            depth = queue.declaration_result.message_count
+            logger.info('Render queue %s: depth %d, waiting %d, %r',
+                        PriorityNames[priority], depth,
+                        render_slots.n_waiting(priority),
+                        render_slots.wait_stats[priority].to_dict())
+
+
+async def listen_for_coalesce_renders(
+    pg_locker: PgLocker,
+    connection: aio_pika.Connection
+) -> None:
     """
-    render = partial(handle_render, pg_locker, send_render)
-    await consume_queue(connection, 'render', n_renderers, render)
+    Accept other workers' render requests for workflows we're rendering.
+
+    Each worker gets its own exclusive queue bound to the fanout exchange, so
+    every worker hears every message.
+    """
+    channel = await connection.channel()
+    exchange = await channel.declare_exchange(rabbitmq.CoalesceRenderExchange,
+                                              aio_pika.ExchangeType.FANOUT)
+    queue = await channel.declare_queue(exclusive=True)
+    await queue.bind(exchange)
+    await queue.consume(partial(handle_coalesce_render, pg_locker),
+                        no_ack=True)
+    logger.info('Listening for %s requests', rabbitmq.CoalesceRenderExchange)
 
 
 async def listen_for_fetches(connection: aio_pika.Connection,
@@ -87,10 +188,25 @@ async def main_loop():
     """
     Run fetchers and renderers, forever.
     """
+    if NRenderers and RenderInProcesses:
+        # Start renderers first: they set up Django while we connect.
+        renderpool.start(NRenderers, max_rss_bytes=RendererMaxRss)
+
+    if NRenderers and ResultCacheMaxBytes:
+        resultcache.start(ResultCacheMaxBytes)
+
+    if NRenderers and (RenderMaxBytes or RendersMaxBytes):
+        renderbudget.start(max_render_bytes=RenderMaxBytes or float('inf'),
+                           max_worker_bytes=RendersMaxBytes or float('inf'))
+
     connection = (await rabbitmq.get_connection()).connection
     async with PgLocker() as pg_locker:
         if NRenderers:
-            await listen_for_renders(pg_locker, connection, NRenderers)
+            render_slots = RenderSlots(NRenderers)
+            await listen_for_coalesce_renders(pg_locker, connection)
+            await listen_for_renders(pg_locker, connection, render_slots,
+                                     NRenderers)
+            asyncio.ensure_future(log_render_stats(connection, render_slots))
         if NFetchers:
             await listen_for_fetches(connection, NFetchers)
         if NUploaders:
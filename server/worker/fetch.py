@@ -1,13 +1,16 @@
 from datetime import timedelta
 from functools import partial
+import json
 import logging
 import os
+from asgiref.sync import async_to_sync
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
 from django.db import DatabaseError, InterfaceError
 from django.utils import timezone
 import msgpack
-from server.models import LoadedModule, Params, WfModule
+from server import rabbitmq
+from server.models import LoadedModule, Params, StoredObject, WfModule
 from server.worker import save
 from .util import benchmark
 
@@ -20,6 +23,16 @@ MinFetchInterval = 5 * 60  # 5min
 logger = logging.getLogger(__name__)
 
 
+class InputNotRendered(Exception):
+    """
+    The input table's render didn't write it to disk; we've asked for it.
+    """
+
+    def __init__(self):
+        super().__init__('The input table is being rendered. '
+                         'Please fetch again in a moment.')
+
+
 @database_sync_to_async
 def _get_params(wf_module: WfModule) -> Params:
     return wf_module.get_params()
@@ -41,8 +54,21 @@ def _get_input_dataframe(wf_module_id: int):
     crr = input_wf_module.get_cached_render_result(only_fresh=True)
     if not crr:
         return None
-    else:
-        return crr.result.dataframe
+
+    if not crr.is_materialized:
+        # The render skipped writing the table (see
+        # `execute._should_materialize()`). Render again, and from now on
+        # always write it: this fetch will be back.
+        workflow = input_wf_module.workflow
+        with workflow.cooperative_lock():
+            input_wf_module.materialize_output = True
+            input_wf_module.cache_render_result(None, None)
+            input_wf_module.save()
+        async_to_sync(rabbitmq.queue_render)(workflow.id,
+                                             workflow.last_delta_id)
+        raise InputNotRendered()
+
+    return crr.result.dataframe
 
 
 @database_sync_to_async
@@ -55,6 +81,35 @@ def _get_stored_dataframe(wf_module_id: int):
     return wf_module.retrieve_fetched_table()
 
 
+@database_sync_to_async
+def _get_stored_metadata(wf_module_id: int):
+    """
+    Return the `metadata` the previous fetch stored, parsed as JSON.
+
+    Return None if there is no stored version, or if the previous fetch
+    failed: then a module mustn't skip a fetch because nothing changed,
+    because the user is looking at an error.
+    """
+    try:
+        wf_module = WfModule.objects.get(pk=wf_module_id)
+    except WfModule.DoesNotExist:
+        return None
+
+    if wf_module.fetch_error:
+        return None
+
+    stored_object = StoredObject.objects.filter(
+        wf_module_id=wf_module_id
+    ).order_by('-stored_at').first()
+    if stored_object is None or not stored_object.metadata:
+        return None
+
+    try:
+        return json.loads(stored_object.metadata)
+    except ValueError:
+        return None
+
+
 @database_sync_to_async
 def _get_workflow_owner(workflow_id: int):
     try:
@@ -77,11 +132,24 @@ async def fetch_wf_module(wf_module, now):
             workflow_id=wf_module.workflow_id,
             get_input_dataframe=partial(_get_input_dataframe, wf_module.id),
             get_stored_dataframe=partial(_get_stored_dataframe, wf_module.id),
+            get_stored_metadata=partial(_get_stored_metadata, wf_module.id),
             get_workflow_owner=partial(_get_workflow_owner,
                                        wf_module.workflow_id),
         )
 
-        await save.save_result_if_changed(wf_module, result)
+        # The module may return `json` to store with the new version: e.g.,
+        # HTTP validators, for get_stored_metadata() to return next time.
+        if result is not None and result.json:
+            stored_object_json = result.json
+        else:
+            stored_object_json = None
+
+        await save.save_result_if_changed(
+            wf_module,
+            result,
+            stored_object_json,
+            stored_object_json_is_validators=True
+        )
     except Exception as e:
         # Log exceptions but keep going
         logger.exception(f'Error fetching {wf_module}')
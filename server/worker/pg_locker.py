@@ -1,11 +1,21 @@
 import asyncio
+from typing import Optional
 import asyncpg
 from async_generator import asynccontextmanager  # TODO python 3.7 native
 from django.conf import settings
 
 
 class WorkflowAlreadyLocked(Exception):
-    pass
+    """
+    Another connection holds the lock.
+
+    `holder_pid` is its Postgres backend PID (see `PgLocker.pid`), or None if
+    it released the lock before we could look it up.
+    """
+
+    def __init__(self, holder_pid: Optional[int]=None):
+        super().__init__(holder_pid)
+        self.holder_pid = holder_pid
 
 
 class PgLocker:
@@ -24,13 +34,17 @@ class PgLocker:
 
     def __init__(self):
         # Use a lock, so heartbeat queries won't interfere with advisory-lock
-        # queries.
+        # queries. We hold it for one query at a time, never for a render:
+        # renders of different workflows run concurrently.
         self.pg_connection = None
         self.lock = asyncio.Lock()
+        # Workflow IDs we hold advisory locks on. Postgres session locks are
+        # re-entrant, so we must refuse a second lock ourselves.
+        self._locked_workflow_ids = set()
 
     async def __aenter__(self) -> 'PgLocker':
-        # pg_connection: asyncpg, not Django database, because we use its
-        # transaction asynchronously. (Async is so much easier than threading.)
+        # pg_connection: asyncpg, not Django database, because we use it
+        # asynchronously. (Async is so much easier than threading.)
         pg_config = settings.DATABASES['default']
         pg_connection = await asyncpg.connect(
             host=pg_config['HOST'],
@@ -58,13 +72,18 @@ class PgLocker:
 
         await self.pg_connection.close()
 
+    @property
+    def pid(self) -> int:
+        """Postgres backend PID of our connection: it names lock holders."""
+        return self.pg_connection.get_server_pid()
+
     async def send_pg_heartbeats_forever(self, interval: float) -> None:
         """
         Keep Postgres connection alive.
         """
-        # Use connection_lock to make sure we don't send heartbeat queries at
-        # the same time as we're sending BEGIN and COMMIT queries: we don't
-        # want races.
+        # Use self.lock to make sure we don't send heartbeat queries at the
+        # same time as we're sending lock and unlock queries: we don't want
+        # races.
         while True:
             await asyncio.sleep(interval)
             async with self.lock:
@@ -84,24 +103,53 @@ class PgLocker:
         something Worker A is already rendering, then Worker A should postpone
         the render and pick some other task instead.
 
-        Implementation: try to acquire a Postgres advisory lock from within a
-        transaction and hold it for the duration of the render. Raise
-        WorkflowAlreadyLocked if we cannot acquire the lock immediately.
+        Implementation: try to acquire a Postgres advisory lock and hold it
+        for the duration of the render. Raise WorkflowAlreadyLocked if we
+        cannot acquire the lock immediately.
 
         pg_advisory_lock() takes two int parameters (to make a 64-bit int).
         Give 0 as the first int (let's call 0 "category of lock") and workflow
         ID as the second int. (Workflow IDs are 32-bit.) We use
-        pg_try_advisory_xact_lock(0, workflow_id): `try` is non-blocking and
-        `xact` means the lock will be released as soon as the transaction ends
-        -- for instance, if a worker exits unexpectedly.
+        pg_try_advisory_lock(0, workflow_id): `try` is non-blocking. It's a
+        session lock, not a transaction lock, because one connection renders
+        many workflows at once and can only have one transaction open. Postgres
+        releases it if our connection closes -- for instance, if a worker exits
+        unexpectedly.
+
+        WorkflowAlreadyLocked names the holder, from `pg_locks`, so we can
+        address it. (Postgres shows a two-int advisory lock's ints as
+        `classid` and `objid`, with `objsubid` 2.)
         """
+        if workflow_id in self._locked_workflow_ids:
+            raise WorkflowAlreadyLocked(self.pid)
+
         async with self.lock:
-            async with self.pg_connection.transaction():
-                success = await self.pg_connection.fetchval(
-                    'SELECT pg_try_advisory_xact_lock(0, $1)',
+            success = await self.pg_connection.fetchval(
+                'SELECT pg_try_advisory_lock(0, $1)',
+                workflow_id
+            )
+            if not success:
+                holder_pid = await self.pg_connection.fetchval(
+                    """
+                    SELECT pid
+                    FROM pg_locks
+                    WHERE locktype = 'advisory'
+                      AND classid = 0
+                      AND objid = $1
+                      AND objsubid = 2
+                      AND granted
+                    """,
+                    workflow_id
+                )
+                raise WorkflowAlreadyLocked(holder_pid)
+            self._locked_workflow_ids.add(workflow_id)
+
+        try:
+            yield
+        finally:
+            self._locked_workflow_ids.discard(workflow_id)
+            async with self.lock:
+                await self.pg_connection.fetchval(
+                    'SELECT pg_advisory_unlock(0, $1)',
                     workflow_id
                 )
-                if success:
-                    yield
-                else:
-                    raise WorkflowAlreadyLocked
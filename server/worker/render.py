@@ -1,56 +1,171 @@
 import asyncio
 import logging
 import os
-from typing import Awaitable, Callable
+import time
 import aio_pika
 from django.db import DatabaseError, InterfaceError
 import msgpack
-from server import execute, rabbitmq
+from server import execute, rabbitmq, resultcache
 from server.models import Workflow
 from .pg_locker import PgLocker, WorkflowAlreadyLocked
+from .render_slots import RenderSlots
 from .util import benchmark
 
 
 logger = logging.getLogger(__name__)
 
 
-# DupRenderWait: number of seconds to wait before queueing a re-render request.
-# When a service requests a render of an already-rendering workflow, the
-# running render will fail fast and a new render should begin. If we receive
-# the request for a new render before the prior render failed fast, we'll wait
-# a bit before rescheduling so we don't re-queue the render ten times per
-# millisecond.
+# CoalesceRaceWindow: number of seconds after we release a workflow's render
+# lock during which we still answer its coalesce requests.
 #
-# If this is too low, we'll use lots of network traffic and CPU re-queueing a
-# render over and over, if its Workflow is the only one in the queue. If it's
-# too high, Workbench will idle instead of rendering (for half this duration,
-# on average). Either way, the duplicate-render Workflow will be queued _last_
-# so that other pending renders will occur before it.
-DupRenderWait = 0.05  # s
-
-
-async def send_render(workflow_id: int, delta_id: int) -> None:
-    # We use asyncio.sleep() to avoid spinning. During the sleep, we are not
-    # rendering! It would be nice to use a RabbitMQ delayed exchange instead;
-    # that would involve a custom RabbitMQ image, and as of 2018-10-30 the cost
-    # (new Docker image) seems to outweigh the benefit (simpler client code).
-    await asyncio.sleep(DupRenderWait)
-    await rabbitmq.queue_render(workflow_id, delta_id)
-
-
-async def render_or_reschedule(
-    pg_locker: PgLocker,
-    reschedule: Callable[[int, int], Awaitable[None]],
-    workflow_id: int,
-    delta_id: int
-) -> None:
+# A worker that finds a workflow locked asks the lock holder (via
+# rabbitmq.coalesce_render()) to render the new delta when it's done. If the
+# holder releases its lock before the message arrives, nobody would render.
+# So for a few seconds after releasing, the former holder queues a render
+# itself. (Spurious renders are cheap.)
+CoalesceRaceWindow = 5.0  # s
+
+
+# Renders running in this process: workflow_id => (delta_id, asyncio.Event).
+# Setting the Event makes execute_workflow() raise UnneededExecution.
+_running_renders = {}
+
+# Workflows whose render lock this process holds (or is acquiring)
+_locked_workflows = set()
+
+# Render requests that arrived while we held the lock: workflow_id =>
+# delta_id. Many requests collapse into one entry.
+_pending_renders = {}
+
+# workflow_id => time.monotonic() when we released its render lock
+_recently_unlocked = {}
+
+
+def cancel_stale_render(workflow_id: int, delta_id: int) -> None:
+    """
+    Cancel this process's render of `workflow_id`, if it is older than
+    `delta_id`.
+
+    The render aborts at its next safe point: between modules, or mid-render
+    if the module is rendering in a child process.
+    """
+    try:
+        running_delta_id, cancel = _running_renders[workflow_id]
+    except KeyError:
+        return  # we aren't rendering this workflow
+
+    if running_delta_id < delta_id and not cancel.is_set():
+        logger.info('Cancelling render %d of Workflow %d: %d is newer',
+                    running_delta_id, workflow_id, delta_id)
+        cancel.set()
+
+
+def coalesce_render(workflow_id: int, delta_id: int) -> bool:
+    """
+    If we hold `workflow_id`'s render lock, render `delta_id` next.
+
+    Cancel our current render if it's stale. Return False if we don't hold
+    the lock.
+    """
+    if workflow_id not in _locked_workflows:
+        return False
+
+    if _pending_renders.get(workflow_id, 0) < delta_id:
+        _pending_renders[workflow_id] = delta_id
+    cancel_stale_render(workflow_id, delta_id)
+    return True
+
+
+def _remember_unlock(workflow_id: int) -> None:
+    """Note that we just released `workflow_id`'s render lock."""
+    now = time.monotonic()
+    for other_id, unlocked_at in list(_recently_unlocked.items()):
+        if now - unlocked_at > CoalesceRaceWindow:
+            del _recently_unlocked[other_id]
+    _recently_unlocked[workflow_id] = now
+
+
+async def handle_coalesce_render(pg_locker: PgLocker,
+                                 message: aio_pika.IncomingMessage) -> None:
+    """
+    Handle a message published by `rabbitmq.coalesce_render()`.
+
+    Only the lock holder it names answers. (Messages from older code name
+    nobody: then any worker that held the lock answers.)
+    """
+    body = msgpack.unpackb(message.body, raw=False)
+    try:
+        workflow_id = int(body['workflow_id'])
+        delta_id = int(body['delta_id'])
+    except:
+        logger.info(
+            ('Ignoring invalid coalesce-render request. '
+             'Expected {workflow_id:int, delta_id:int}; got %r'),
+            body
+        )
+        return
+
+    holder_pid = body.get('holder_pid')
+    if holder_pid is not None and holder_pid != pg_locker.pid:
+        return  # it's for another worker
+
+    if coalesce_render(workflow_id, delta_id):
+        return
+
+    unlocked_at = _recently_unlocked.get(workflow_id)
+    if (
+        unlocked_at is not None
+        and time.monotonic() - unlocked_at <= CoalesceRaceWindow
+    ):
+        # The sender saw our lock, but we released it before we heard from
+        # them. Nobody else will render.
+        await rabbitmq.queue_render(workflow_id, delta_id)
+
+
+async def _render_workflow(workflow: Workflow, delta_id: int) -> None:
+    """
+    Render `workflow`, within its render lock.
+
+    Return quietly if the render becomes unneeded.
+    """
+    workflow_id = workflow.id
+    cancel = asyncio.Event()
+    _running_renders[workflow_id] = (delta_id, cancel)
+    try:
+        # Most exceptions caught elsewhere.
+        #
+        # execute_workflow() will raise UnneededExecution if the workflow
+        # changes while it's being rendered.
+        #
+        # We don't use `workflow.cooperative_lock()` because `execute` may
+        # take ages (and it locks internally when it needs to).
+        # `execute_workflow()` _anticipates_ that `workflow` data may be
+        # stale.
+        #
+        # execute_workflow() will also raise UnneededExecution soon after
+        # somebody calls cancel_stale_render() with a newer delta.
+        task = execute.execute_workflow(workflow, cancel)
+        await benchmark(logger, task, 'execute_workflow(%d)', workflow_id)
+    except execute.UnneededExecution:
+        logger.info('UnneededExecution in execute_workflow(%d)',
+                    workflow_id)
+        # Don't reschedule. Assume the process that modified the Workflow has
+        # also requested a render. Indeed, that request may already be in
+        # _pending_renders.
+    finally:
+        del _running_renders[workflow_id]
+        resultcache.log_stats()
+
+
+async def render_or_coalesce(pg_locker: PgLocker, workflow_id: int,
+                             delta_id: int) -> None:
     """
-    Acquire an advisory lock and render, or re-queue task if the lock is held.
+    Acquire an advisory lock and render, or hand off if the lock is held.
 
     If a render is requested on a Workflow that's already being rendered,
-    there's no point in wasting CPU cycles starting from scratch. Wait for the
-    first render to exit (which will happen at the next stale database-write)
-    before trying again.
+    that render is stale. Whoever holds the lock -- this process or another
+    worker -- cancels it and renders the newest delta next. Duplicate
+    requests collapse into one pending render, so we never re-queue.
     """
     # Query for workflow before locking. We don't need a lock for this, and no
     # lock means we can dismiss spurious renders sooner, so they don't fill the
@@ -65,32 +180,42 @@ async def render_or_reschedule(
                     delta_id, workflow_id)
         return
 
+    if coalesce_render(workflow_id, delta_id):
+        logger.info('Workflow %d is being rendered here; will render %d next',
+                    workflow_id, delta_id)
+        return
+
+    _locked_workflows.add(workflow_id)
+    locked = False
     try:
         async with pg_locker.render_lock(workflow_id):
-            # Most exceptions caught elsewhere.
-            #
-            # execute_workflow() will raise UnneededExecution if the workflow
-            # changes while it's being rendered.
-            #
-            # We don't use `workflow.cooperative_lock()` because `execute` may
-            # take ages (and it locks internally when it needs to).
-            # `execute_workflow()` _anticipates_ that `workflow` data may be
-            # stale.
-            task = execute.execute_workflow(workflow)
-            await benchmark(logger, task, 'execute_workflow(%d)', workflow_id)
-
-    except WorkflowAlreadyLocked:
-        logger.info('Workflow %d is being rendered elsewhere; rescheduling',
-                    workflow_id)
-        await reschedule(workflow_id, delta_id)
+            locked = True
+            while True:
+                await _render_workflow(workflow, delta_id)
 
-    except execute.UnneededExecution:
-        logger.info('UnneededExecution in execute_workflow(%d)',
-                    workflow_id)
-        # Don't reschedule. Assume the process that modified the
-        # Workflow has also scheduled a render. Indeed, that new render
-        # request may already have hit WorkflowAlreadyLocked.
-        return
+                next_delta_id = _pending_renders.pop(workflow_id, None)
+                if next_delta_id is None or next_delta_id <= delta_id:
+                    break
+
+                try:
+                    workflow = Workflow.objects.get(id=workflow_id)
+                except Workflow.DoesNotExist:
+                    break
+                delta_id = workflow.last_delta_id
+
+    except WorkflowAlreadyLocked as err:
+        if err.holder_pid is None:
+            # The holder released the lock as we looked. Try again.
+            logger.info('Workflow %d was just unlocked; re-queueing',
+                        workflow_id)
+            await rabbitmq.queue_render(workflow_id, delta_id)
+        else:
+            logger.info('Workflow %d is being rendered elsewhere; coalescing',
+                        workflow_id)
+            # Ask the lock holder to cancel its (stale) render and render
+            # ours next.
+            await rabbitmq.coalesce_render(workflow_id, delta_id,
+                                           err.holder_pid)
 
     except DatabaseError:
         # Two possibilities:
@@ -120,10 +245,28 @@ async def render_or_reschedule(
         logger.exception('Fatal database error; exiting')
         os._exit(1)
 
+    finally:
+        _locked_workflows.discard(workflow_id)
+        if locked:
+            _remember_unlock(workflow_id)
+
+        next_delta_id = _pending_renders.pop(workflow_id, None)
+        if next_delta_id is not None and next_delta_id > delta_id:
+            # A request arrived as we were locking or unlocking. Let
+            # whichever worker is free handle it.
+            await rabbitmq.queue_render(workflow_id, next_delta_id)
+
 
 async def handle_render(pg_locker: PgLocker,
-                        reschedule: Callable[[int, int], Awaitable[None]],
+                        render_slots: RenderSlots,
+                        priority: int,
                         message: aio_pika.IncomingMessage) -> None:
+    """
+    Render the workflow in `message`, once `render_slots` has room for it.
+
+    Messages are acknowledged after the render, so a prefetched message that
+    is waiting for a slot stays ours: other workers won't render it.
+    """
     with message.process():
         body = msgpack.unpackb(message.body, raw=False)
         try:
@@ -137,10 +280,20 @@ async def handle_render(pg_locker: PgLocker,
             )
             return
 
+        # If we're rendering this workflow, hand the request to that render
+        # now, without waiting for a render slot: we may wait behind it.
+        if coalesce_render(workflow_id, delta_id):
+            logger.info('Workflow %d is being rendered here; will render %d '
+                        'next', workflow_id, delta_id)
+            return
+
+        # Messages queued by older code have no 'queued_at'
+        queued_at = body.get('queued_at')
+
         try:
-            task = render_or_reschedule(pg_locker, reschedule, workflow_id,
-                                        delta_id)
-            await benchmark(logger, task, 'render_or_reschedule(%d, %d)',
-                            workflow_id, delta_id)
+            async with render_slots.slot(priority, queued_at):
+                task = render_or_coalesce(pg_locker, workflow_id, delta_id)
+                await benchmark(logger, task, 'render_or_coalesce(%d, %d)',
+                                workflow_id, delta_id)
         except:
             logger.exception('Error during render')
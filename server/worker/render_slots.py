@@ -0,0 +1,117 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Dict, Optional
+
+
+# Priorities. Lower numbers go first.
+Interactive = 0  # a user is waiting
+Background = 1  # nobody is waiting (e.g., cron fetch with notifications)
+
+PriorityNames = {
+    Interactive: 'interactive',
+    Background: 'background',
+}
+
+
+class WaitStats:
+    """Time renders spent between queue_render() and starting to render."""
+
+    def __init__(self):
+        self.n_renders = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def add(self, wait: float) -> None:
+        self.n_renders += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.n_renders:
+            mean_wait = self.total_wait / self.n_renders
+        else:
+            mean_wait = 0.0
+        return {
+            'n_renders': self.n_renders,
+            'mean_wait_ms': int(mean_wait * 1000),
+            'max_wait_ms': int(self.max_wait * 1000),
+        }
+
+
+class _Slot:
+    def __init__(self, slots: 'RenderSlots', priority: int,
+                 queued_at: Optional[float]):
+        self.slots = slots
+        self.priority = priority
+        self.queued_at = queued_at
+
+    async def __aenter__(self):
+        await self.slots.acquire(self.priority)
+        if self.queued_at is not None:
+            wait = max(0.0, time.time() - self.queued_at)
+            self.slots.wait_stats[self.priority].add(wait)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.slots.release()
+
+
+class RenderSlots:
+    """
+    Allow `n` simultaneous renders; give free slots to interactive renders
+    first.
+
+    We consume the interactive and background render queues at the same time,
+    so RabbitMQ hands us messages from both. Renders wait here for a slot. A
+    background render only gets a slot when no interactive render is waiting.
+
+    Usage:
+
+        async with render_slots.slot(Interactive, queued_at):
+            ...  # render
+    """
+
+    def __init__(self, n: int):
+        self.n_free = n
+        self._waiters = []  # heap of (priority, seq, Future)
+        self._seq = itertools.count()  # FIFO within a priority
+        self.wait_stats = dict((p, WaitStats()) for p in PriorityNames)
+
+    def slot(self, priority: int, queued_at: Optional[float]=None) -> _Slot:
+        """
+        Return an async context manager that holds a slot.
+
+        If `queued_at` is set, record our wait when we get the slot.
+        """
+        return _Slot(self, priority, queued_at)
+
+    async def acquire(self, priority: int) -> None:
+        if self.n_free > 0 and not self._waiters:
+            self.n_free -= 1
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future  # release() gives us its slot
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We were given a slot just as we were cancelled
+                self.release()
+            else:
+                self._waiters = [w for w in self._waiters
+                                 if w[2] is not future]
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.n_free += 1
+
+    def n_waiting(self, priority: int) -> int:
+        return sum(1 for w in self._waiters if w[0] == priority)
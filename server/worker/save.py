@@ -1,19 +1,47 @@
 import json
+import logging
 from typing import Any, Dict, Optional
 from channels.db import database_sync_to_async
 from django.conf import settings
 from django.utils import timezone
 from server import websockets
-from server.models import WfModule, Workflow
+from server.models import StoredObject, WfModule, Workflow
 from server.models.commands import ChangeDataVersionCommand
 from server.modules.types import ProcessResult
 
 
+logger = logging.getLogger(__name__)
+
+
+def _serialize_metadata(stored_object_json: Optional[Dict[str, Any]]) -> str:
+    """
+    Serialize `stored_object_json` for `StoredObject.metadata`.
+
+    Modules choose what to return, and a value the column can't hold would
+    make the INSERT raise DataError -- a DatabaseError, which kills the
+    fetcher. Store `null` instead of such values.
+    """
+    try:
+        metadata = json.dumps(stored_object_json)
+    except (TypeError, ValueError):
+        logger.warning('Dropping fetch metadata: not JSON-serializable')
+        return json.dumps(None)
+
+    max_length = StoredObject._meta.get_field('metadata').max_length
+    if len(metadata) > max_length:
+        logger.warning('Dropping fetch metadata: %d characters is more than '
+                       '%d', len(metadata), max_length)
+        return json.dumps(None)
+
+    return metadata
+
+
 @database_sync_to_async
 def _maybe_add_version(
     wf_module: WfModule,
     maybe_result: Optional[ProcessResult],
-    stored_object_json: Optional[Dict[str, Any]]=None
+    stored_object_json: Optional[Dict[str, Any]]=None,
+    stored_object_json_is_validators: bool=False
 ) -> Optional[timezone.datetime]:
     """
     Apply `result` to `wf_module`.
@@ -48,7 +76,8 @@ def _maybe_add_version(
             if maybe_result is not None:
                 version_added = wf_module.store_fetched_table_if_different(
                     maybe_result.dataframe,  # TODO store entire result
-                    metadata=json.dumps(stored_object_json)
+                    metadata=_serialize_metadata(stored_object_json),
+                    metadata_is_validators=stored_object_json_is_validators
                 )
             else:
                 version_added = None
@@ -66,7 +95,8 @@ def _maybe_add_version(
 async def save_result_if_changed(
     wf_module: WfModule,
     new_result: Optional[ProcessResult],
-    stored_object_json: Optional[Dict[str, Any]]=None
+    stored_object_json: Optional[Dict[str, Any]]=None,
+    stored_object_json_is_validators: bool=False
 ) -> None:
     """
     Store fetched table, if it is a change from `wf_module`'s existing data.
@@ -87,9 +117,16 @@ async def save_result_if_changed(
 
     Call with `new_result=None` to indicate that a fetch is finished and
     guarantee not to add a new version.
+
+    If `stored_object_json_is_validators`, an unchanged table still gets the
+    new `stored_object_json` (see `store_fetched_table_if_different()`).
     """
-    version_added = await _maybe_add_version(wf_module, new_result,
-                                             stored_object_json)
+    version_added = await _maybe_add_version(
+        wf_module,
+        new_result,
+        stored_object_json,
+        stored_object_json_is_validators
+    )
 
     if version_added:
         # Don't send_delta_async. wf_module.last_relevant_delta_id hasn't been
@@ -131,16 +168,22 @@ def enforce_storage_limits(wf_module: WfModule) -> None:
     """
     limit = settings.MAX_STORAGE_PER_MODULE
 
-    # walk over this WfM's StoredObjects from newest to oldest, deleting all
-    # that are over the limit
-    sos = wf_module.stored_objects.order_by('-stored_at')
-    cumulative = 0
-    first = True
-
-    for so in sos:
-        cumulative += so.size
-        if cumulative > limit and not first:
-            # allow most recent version to be stored even if it is itself over
-            # limit
+    while True:
+        # walk over this WfM's StoredObjects from newest to oldest, finding
+        # all that are over the limit
+        sos = list(wf_module.stored_objects.order_by('-stored_at'))
+        cumulative = 0
+        for i, so in enumerate(sos):
+            cumulative += so.size
+            # allow most recent version to be stored even if it is itself
+            # over limit
+            if cumulative > limit and i > 0:
+                break
+        else:
+            return
+
+        # Delete newest first. `so.delete()` rewrites versions built on `so`
+        # as standalone tables; this way, it only rewrites versions we keep.
+        # Those grow (they hold their base's rows now), so we count again.
+        for so in sos[i:]:
             so.delete()
-        first = False
@@ -1,8 +1,9 @@
+import json
 import logging
 import msgpack
-from typing import Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from channels.db import database_sync_to_async
-from server.models import WfModule, UploadedFile
+from server.models import StoredObject, WfModule, UploadedFile
 from server.modules import uploadfile
 from server.worker import save
 from .util import benchmark
@@ -38,6 +39,25 @@ def load_wf_module_and_uploaded_file(
     return (wf_module, uploaded_file)
 
 
+def _stored_object_json(uploaded_file: UploadedFile) -> List[Dict[str, Any]]:
+    """
+    Build the JSON `UploadedFileView` reads from `StoredObject.metadata`.
+
+    Truncate the filename so the JSON fits: `save` stores `null` for
+    metadata that doesn't, and the view needs the `uuid`. (The view reads the
+    name from the UploadedFile, not from here.)
+    """
+    max_length = StoredObject._meta.get_field('metadata').max_length
+    name = uploaded_file.name
+    while True:
+        stored_object_json = [{'uuid': uploaded_file.uuid, 'name': name}]
+        n_extra = len(json.dumps(stored_object_json)) - max_length
+        if n_extra <= 0 or not name:
+            return stored_object_json
+        # json.dumps() may escape a character as several: loop
+        name = name[:-n_extra]
+
+
 async def upload_DELETEME(*, wf_module_id: int, uploaded_file_id: int) -> None:
     """
     DELETEME: see https://www.pivotaltracker.com/story/show/161509317
@@ -55,11 +75,11 @@ async def upload_DELETEME(*, wf_module_id: int, uploaded_file_id: int) -> None:
                              wf_module.workflow_id, wf_module_id,
                              uploaded_file_id)
 
-    await save.save_result_if_changed(wf_module, result,
-                                      stored_object_json=[{
-                                          'uuid': uploaded_file.uuid,
-                                          'name': uploaded_file.name,
-                                      }])
+    await save.save_result_if_changed(
+        wf_module,
+        result,
+        stored_object_json=_stored_object_json(uploaded_file)
+    )
 
 
 async def handle_upload_DELETEME(message):